@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Times `fbcap messages` with each writer and `fbcap stats` end to end on
+generated archives (see `benchmarks.generator`) of increasing size,
+recording the throughput and peak RSS of each run.
+
+Each run is a separate `fbcap` process, measured with `os.wait4`, so the
+figures include start-up and everything else a user would sit through.
+Archives are generated once into the work directory and reused by later
+runs. Results can be saved with `--output` and compared against a previous
+run with `--baseline`, which shows the change of every figure.
+
+    python -m benchmarks.bench_e2e [--sizes 10M,100M] [--layouts legacy,split]
+        [--commands json,text,stats] [--jobs N] [--work-dir DIR]
+        [--output results.json] [--baseline previous.json]
+
+The full suite goes from 10 MB to 5 GB (`--sizes 10M,100M,1G,5G`), which
+takes hours and needs around 15 GB of disk space.
+"""
+
+from __future__ import unicode_literals, print_function, division
+
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from timeit import default_timer
+
+from fbchat_archive_parser.writers import BUILTIN_WRITERS
+
+from .generator import Archive, generate_archive, parse_size, LAYOUTS
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATS = 'stats'
+COMMANDS = BUILTIN_WRITERS + (STATS,)
+
+
+def _fbcap_args(command, archive, jobs):
+    if command == STATS:
+        args = ['stats', '-f', 'json']
+    else:
+        args = ['messages', '-f', command]
+    args += [archive.path, '--noprogress', '--nocolor', '--no-cache', '-j', str(jobs)]
+    if archive.timezone_hints:
+        args += ['-z', archive.timezone_option()]
+    return args
+
+
+def run_fbcap(args):
+    """
+    Runs `fbcap` in a child process, discarding its output.
+
+    :return: A tuple of the elapsed seconds and peak RSS in bytes.
+    :raises RuntimeError: If `fbcap` fails.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [_ROOT, env.get('PYTHONPATH')]))
+    with open(os.devnull, 'wb') as devnull, tempfile.TemporaryFile() as stderr:
+        start = default_timer()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'fbchat_archive_parser.main'] + args,
+            stdout=devnull, stderr=stderr, env=env)
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = default_timer() - start
+        # Already reaped, so `Popen` mustn't try to.
+        process.returncode = status
+        if status != 0:
+            stderr.seek(0)
+            raise RuntimeError("fbcap %s failed:\n%s"
+                               % (' '.join(args), stderr.read().decode('utf-8', 'replace')))
+    # Kilobytes on Linux, bytes on macOS.
+    peak_rss = usage.ru_maxrss * (1 if platform.system() == 'Darwin' else 1024)
+    return elapsed, peak_rss
+
+
+def _archive(work_dir, layout, size, seed):
+    """
+    Generates an archive, or reuses the one generated by an earlier run.
+    """
+    directory = os.path.join(work_dir, '%s-%d-%d' % (layout, size, seed))
+    manifest = os.path.join(directory, 'archive.json')
+    if os.path.exists(manifest):
+        with io.open(manifest, encoding='utf-8') as f:
+            fields = json.load(f)
+        fields['timezone_hints'] = dict((name, tuple(offset)) for name, offset
+                                        in fields['timezone_hints'].items())
+        return Archive(**fields)
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+    archive = generate_archive(directory, layout, size=size, seed=seed)
+    with io.open(manifest, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(archive._asdict()))
+    return archive
+
+
+def _key(result):
+    return '%s %s %s' % (result['layout'], result['size_label'], result['command'])
+
+
+def _change(value, previous):
+    if not previous:
+        return ''
+    return ' (%+.0f%%)' % ((value - previous) / previous * 100)
+
+
+def report(result, baseline):
+    previous = baseline.get(_key(result), {})
+    print('%-40s %8.2f s%-7s %7.1f MB/s %9.0f msgs/s %8.1f MB RSS%s'
+          % (_key(result), result['seconds'],
+             _change(result['seconds'], previous.get('seconds')),
+             result['bytes_per_second'] / 1e6, result['messages_per_second'],
+             result['peak_rss'] / 1e6, _change(result['peak_rss'], previous.get('peak_rss'))))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--sizes', default='10M,100M')
+    arg_parser.add_argument('--layouts', default=','.join(LAYOUTS))
+    arg_parser.add_argument('--commands', default=','.join(COMMANDS))
+    arg_parser.add_argument('--jobs', type=int, default=1)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--work-dir', default=None,
+                            help='Where to keep the generated archives (default: a '
+                                 'temporary directory, removed afterwards)')
+    arg_parser.add_argument('--output', default=None, help='Write the results to this file')
+    arg_parser.add_argument('--baseline', default=None,
+                            help='Compare against the results written by an earlier run')
+    args = arg_parser.parse_args()
+
+    sizes = args.sizes.split(',')
+    layouts = args.layouts.split(',')
+    commands = args.commands.split(',')
+    for command in commands:
+        if command not in COMMANDS:
+            arg_parser.error("unknown command %s (choose from %s)" % (command, COMMANDS))
+    baseline = {}
+    if args.baseline:
+        with io.open(args.baseline, encoding='utf-8') as f:
+            baseline = dict((_key(r), r) for r in json.load(f)['results'])
+
+    work_dir = args.work_dir or tempfile.mkdtemp()
+    results = []
+    try:
+        for size_label in sizes:
+            for layout in layouts:
+                archive = _archive(work_dir, layout, parse_size(size_label), args.seed)
+                for command in commands:
+                    seconds, peak_rss = run_fbcap(_fbcap_args(command, archive, args.jobs))
+                    result = {
+                        'layout': layout,
+                        'size_label': size_label,
+                        'size': archive.size,
+                        'messages': archive.messages,
+                        'command': command,
+                        'jobs': args.jobs,
+                        'seconds': seconds,
+                        'bytes_per_second': archive.size / seconds,
+                        'messages_per_second': archive.messages / seconds,
+                        'peak_rss': peak_rss,
+                    }
+                    results.append(result)
+                    report(result, baseline)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir)
+        if args.output:
+            with io.open(args.output, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'python': platform.python_version(), 'results': results},
+                                   indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the available XML engines on synthetic archives of all three
+formats: the raw iterparse throughput in events per second, and the time
+taken to parse the whole archive.
+
+    python -m benchmarks.bench_engines [--threads N] [--messages N]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import io
+import os
+import shutil
+import tempfile
+
+from fbchat_archive_parser.parser import parse, iterparse, available_engines
+
+from .common import best_of, report
+from .generator import generate_archive, LAYOUTS
+
+
+def _files(manifest):
+    messages_dir = os.path.join(os.path.dirname(os.path.dirname(manifest)), 'messages')
+    if not os.path.isdir(messages_dir):
+        return [manifest]
+    return [manifest] + [os.path.join(messages_dir, name) for name in os.listdir(messages_dir)]
+
+
+def _count_events(paths, engine):
+    count = 0
+    for path in paths:
+        with io.open(path, 'rb') as f:
+            for _ in iterparse(f, engine):
+                count += 1
+    return count
+
+
+def _parse(manifest, engine):
+    with io.open(manifest, 'rb') as f:
+        return parse(f, engine=engine)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--threads', type=int, default=200)
+    arg_parser.add_argument('--messages', type=int, default=500)
+    args = arg_parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        for layout in LAYOUTS:
+            archive = generate_archive(os.path.join(root, layout), layout, args.threads,
+                                       args.messages, uniform=True)
+            manifest = archive.path
+            paths = _files(manifest)
+            size = sum(os.path.getsize(p) for p in paths)
+            print("%s archive: %.1f MB" % (layout, size / 1e6))
+            for engine in available_engines():
+                events = _count_events(paths, engine)
+                report('iterparse (%s)' % engine,
+                       best_of(lambda: _count_events(paths, engine)), size, events, 'events')
+                report('parse (%s)' % engine, best_of(lambda: _parse(manifest, engine)),
+                       size, archive.messages, 'msgs')
+            print()
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Times extracting a single conversation with a thread filter (`-t`) from
+synthetic archives of all three formats, next to parsing them in full.
+
+    python -m benchmarks.bench_filter [--size-mb 256] [--threads N]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import io
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from fbchat_archive_parser.parser import parse
+
+from .common import report
+from .generator import generate_archive, LAYOUTS, LEGACY_FORMAT, OWNER
+
+_MESSAGES_PER_THREAD = 200
+
+
+def _participants_of_first_thread(path):
+    # Legacy threads list the owner among their participants, and the links
+    # to split threads don't.
+    with io.open(path, encoding='utf-8') as f:
+        for line in f:
+            m = re.match(r'<div class="thread">(.*)$|<a href="\.\./messages/0\.html">(.*)</a>',
+                         line)
+            if m:
+                names = (m.group(1) or m.group(2)).split(', ')
+                return tuple(name for name in names if name != OWNER)
+
+
+def _parse(path, thread_filter):
+    with io.open(path, 'rb') as f:
+        start = time.time()
+        history = parse(f, thread_filter=thread_filter)
+        return time.time() - start, sum(len(t) for t in history.threads.values())
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--size-mb', type=float, default=256,
+                            help='size of the legacy archive')
+    arg_parser.add_argument('--threads', type=int, default=500,
+                            help='number of threads in the split archives')
+    args = arg_parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        for layout in LAYOUTS:
+            size = args.size_mb * 1e6 if layout == LEGACY_FORMAT else None
+            manifest = generate_archive(os.path.join(root, layout), layout, args.threads,
+                                        _MESSAGES_PER_THREAD, size).path
+            print("%s archive (%s)" % (layout, manifest))
+            seconds, messages = _parse(manifest, _participants_of_first_thread(manifest))
+            report('  one thread (-t)', seconds, None, messages, 'msgs')
+            if layout != LEGACY_FORMAT:
+                seconds, messages = _parse(manifest, None)
+                report('  everything', seconds, None, messages, 'msgs')
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Measures what a parsed chat history costs to hold and work with, on a
+generated archive (see `benchmarks.generator`) of a million messages by
+default: the memory it takes per message, how long sorting it takes and
+how long walking every field of every message takes. Histories are parsed
+with timestamps both in UTC and in their original timezones, and with the
+messages of each thread kept both in a list of `ChatMessage` objects and
+column by column (`parse(columnar=True)`, see `MessageColumns`).
+
+Memory is that still traced (with `tracemalloc`) once the history has
+been parsed and everything else has been let go of, so tracing slows
+parsing down but doesn't affect the figures.
+
+    python -m benchmarks.bench_history [--messages 1000000]
+        [--timezones offset] [--stores list,columnar] [--work-dir DIR]
+"""
+
+from __future__ import unicode_literals, print_function, division
+
+import argparse
+import gc
+import io
+import shutil
+import tempfile
+import tracemalloc
+
+from fbchat_archive_parser.parser import parse
+from fbchat_archive_parser.time import TIMESTAMP_CACHE
+
+from .common import best_of, report
+from .generator import generate_archive, LEGACY_FORMAT, TIMEZONE_STYLES, OFFSET_TIMEZONES
+
+
+def _walk(history):
+    for thread in history.threads.values():
+        for m in thread.messages:
+            m.timestamp, m.seq_num, m.sender, m.content
+
+
+STORES = ('list', 'columnar')
+
+
+def measure(archive, use_utc, store):
+    TIMESTAMP_CACHE.clear()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        with io.open(archive.path, 'rb') as f:
+            history = parse(f, use_utc=use_utc, timezone_hints=archive.timezone_hints,
+                            columnar=store == 'columnar')
+        TIMESTAMP_CACHE.clear()
+        gc.collect()
+        retained, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    messages = sum(len(thread) for thread in history.threads.values())
+    label = '%s, %s' % ('utc' if use_utc else 'local', store)
+    print('%s: %d messages, %.1f MB, %.0f bytes/message'
+          % (label, messages, retained / 1e6, retained / messages))
+    # Archives list messages newest first, so the first sort does the most.
+    report('  %s sort' % label, best_of(history.sort, 1), count=messages, unit='msgs')
+    report('  %s sort (sorted)' % label, best_of(history.sort), count=messages, unit='msgs')
+    report('  %s walk' % label, best_of(lambda: _walk(history)), count=messages, unit='msgs')
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--messages', type=int, default=1000000)
+    arg_parser.add_argument('--timezones', choices=TIMEZONE_STYLES, default=OFFSET_TIMEZONES)
+    arg_parser.add_argument('--stores', default=','.join(STORES),
+                            help='Comma separated message stores to measure (default: all)')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--work-dir', default=None,
+                            help='Where to generate the archive (default: a temporary '
+                                 'directory, removed afterwards)')
+    args = arg_parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp()
+    try:
+        archive = generate_archive(work_dir, LEGACY_FORMAT, threads=max(1, args.messages // 100),
+                                   messages=100, timezone_style=args.timezones,
+                                   seed=args.seed)
+        print('%.1f MB archive' % (archive.size / 1e6))
+        for use_utc in (False, True):
+            for store in args.stores.split(','):
+                measure(archive, use_utc, store)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
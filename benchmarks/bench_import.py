@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the cold start of the library: how long importing its modules
+takes in a fresh interpreter and how much memory that leaves resident,
+along with the first timestamps parsed (which is when the locale data of
+the timestamp formats and the table of timezone abbreviations are loaded).
+
+Each statement is run in a child process of its own, measured with
+`os.wait4`, the best of several runs being kept. The bare interpreter is
+measured too, to tell what the library adds to it.
+
+    python -m benchmarks.bench_import [--runs 10]
+"""
+
+from __future__ import unicode_literals, print_function, division
+
+import argparse
+import os
+import platform
+import subprocess
+import sys
+from timeit import default_timer
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PARSE = ("from fbchat_archive_parser.time import parse_timestamp; "
+          "parse_timestamp(%r, True, {})")
+
+STATEMENTS = [
+    ('python', 'pass'),
+    ('import fbchat_archive_parser.time', 'import fbchat_archive_parser.time'),
+    ('import fbchat_archive_parser.parser', 'import fbchat_archive_parser.parser'),
+    ('first timestamp (en_us, UTC offset)',
+     _PARSE % "Sunday, December 4, 2016 at 1:54pm UTC-07"),
+    ('first timestamp (lt_lt, UTC offset)', _PARSE % "2016 m. gruodis 4 d., 13:54 UTC-07"),
+    ('first timestamp (en_us, abbreviation)',
+     _PARSE % "Sunday, December 4, 2016 at 1:54pm PDT"),
+]
+
+
+def run_python(statement):
+    """
+    Runs a statement in a fresh interpreter.
+
+    :return: A tuple of the elapsed seconds and peak RSS in bytes.
+    :raises RuntimeError: If the statement fails.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [_ROOT, env.get('PYTHONPATH')]))
+    start = default_timer()
+    process = subprocess.Popen([sys.executable, '-c', statement], env=env)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = default_timer() - start
+    # Already reaped, so `Popen` mustn't try to.
+    process.returncode = status
+    if status != 0:
+        raise RuntimeError("%s failed" % statement)
+    # Kilobytes on Linux, bytes on macOS.
+    peak_rss = usage.ru_maxrss * (1 if platform.system() == 'Darwin' else 1024)
+    return elapsed, peak_rss
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--runs', type=int, default=10)
+    args = arg_parser.parse_args()
+
+    base_seconds = base_rss = None
+    for name, statement in STATEMENTS:
+        runs = [run_python(statement) for _ in range(args.runs)]
+        seconds = min(r[0] for r in runs)
+        peak_rss = min(r[1] for r in runs)
+        if base_seconds is None:
+            base_seconds, base_rss = seconds, peak_rss
+            print('%-40s %8.3f s %8.1f MB RSS' % (name, seconds, peak_rss / 1e6))
+        else:
+            print('%-40s %8.3f s %8.1f MB RSS  (+%.3f s, +%.1f MB)'
+                  % (name, seconds, peak_rss / 1e6, seconds - base_seconds,
+                     (peak_rss - base_rss) / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Streams a synthetic legacy archive of the given size through
+`LegacyMessageHtmlParser` and reports the peak memory traced while doing so.
+
+By default every thread is filtered out, so nothing but the parser's own
+working set is measured. With `--keep`, every thread is parsed and kept.
+
+    python -m benchmarks.bench_memory [--size-mb 1024] [--keep]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import time
+import tracemalloc
+
+from fbchat_archive_parser.parser import LegacyMessageHtmlParser
+
+from .common import ChunkStream
+from .generator import iter_legacy_archive
+
+_MESSAGES_PER_THREAD = 50
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--size-mb', type=float, default=1024)
+    arg_parser.add_argument('--keep', action='store_true')
+    args = arg_parser.parse_args()
+
+    sample = list(iter_legacy_archive(100, _MESSAGES_PER_THREAD, seed=1, uniform=True))
+    thread_size = sum(len(c) for c in sample[1:-1]) / 100.0
+    threads = max(1, int(args.size_mb * 1e6 / thread_size))
+
+    stream = ChunkStream(iter_legacy_archive(threads, _MESSAGES_PER_THREAD, uniform=True))
+    thread_filter = None if args.keep else ('nobody',)
+
+    tracemalloc.start()
+    start = time.time()
+    history = LegacyMessageHtmlParser(stream, thread_filter=thread_filter).parse()
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print("Archive size:     %.1f MB (%d threads)" % (stream.position / 1e6, threads))
+    print("Threads kept:     %d" % len(history.threads))
+    print("Elapsed:          %.1f s (%.1f MB/s)" % (elapsed, stream.position / 1e6 / elapsed))
+    print("Peak traced:      %.1f MB" % (peak / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the throughput of `SafeXMLStream` on text handles (decode, scrub and
+re-encode) against binary handles (scrubbing the UTF-8 bytes directly).
+
+    python -m benchmarks.bench_safe_stream [--threads N] [--messages N]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import io
+import xml.etree.ElementTree as ET
+from xml.etree.ElementTree import XMLParser
+
+from fbchat_archive_parser.parser import SafeXMLStream
+
+from .common import best_of, report
+from .generator import iter_legacy_archive
+
+
+def _drain(stream):
+    while stream.read(16 * 1024):
+        pass
+
+
+def _iterparse(stream):
+    parser = XMLParser(encoding=str('UTF-8'))
+    for _ in ET.iterparse(stream, events=("start", "end"), parser=parser):
+        pass
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--threads', type=int, default=200)
+    arg_parser.add_argument('--messages', type=int, default=500)
+    args = arg_parser.parse_args()
+
+    data = b''.join(iter_legacy_archive(args.threads, args.messages, uniform=True))
+    print("Archive size: %.1f MB\n" % (len(data) / 1e6))
+
+    def text():
+        return SafeXMLStream(io.TextIOWrapper(io.BytesIO(data), encoding='utf8'))
+
+    def binary():
+        return SafeXMLStream(io.BufferedReader(io.BytesIO(data)))
+
+    for name, make in (('text', text), ('binary', binary)):
+        report('scrub only (%s)' % name, best_of(lambda: _drain(make())), len(data))
+    for name, make in (('text', text), ('binary', binary)):
+        report('scrub + iterparse (%s)' % name, best_of(lambda: _iterparse(make())), len(data))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the per-thread cost of de-duplicating and saving parsed threads,
+with the incrementally maintained signatures against the md5 over every
+message that the signatures used to be recomputed as.
+
+    python -m benchmarks.bench_signatures [--threads N] [--messages N]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import hashlib
+import random
+from datetime import datetime, timedelta
+
+from fbchat_archive_parser import ChatThread, ChatMessage
+from fbchat_archive_parser.parser import LegacyMessageHtmlParser
+from fbchat_archive_parser.time import TzInfoByOffset
+
+from .common import best_of, report
+from .generator import OWNER, _PEOPLE, _WORDS
+
+
+def _threads(threads, messages, seed=0):
+    rand = random.Random(seed)
+    tz = TzInfoByOffset(timedelta(hours=-7))
+    start = datetime(2013, 10, 4, tzinfo=tz)
+    result = []
+    for t in range(threads):
+        people = rand.sample(_PEOPLE, 2)
+        thread = ChatThread(people)
+        for m in range(messages):
+            content = ' '.join(rand.choice(_WORDS) for _ in range(rand.randint(1, 12)))
+            thread.add_message(ChatMessage(start + timedelta(minutes=m),
+                                           rand.choice([OWNER] + people), content, -m))
+        result.append(thread)
+    return result
+
+
+def _md5_signature(thread):
+    signature = hashlib.md5()
+    for m in thread.messages:
+        signature.update(str(m.timestamp).encode('utf-8'))
+        signature.update(m.sender.encode('utf-8'))
+        signature.update(m.content.encode('utf-8'))
+    return signature.digest()
+
+
+def _save_all(threads, signature):
+    parser = LegacyMessageHtmlParser(None)
+    for thread in threads:
+        # As done by `MessageHtmlParser.iter_threads`.
+        key = signature(thread)
+        if key in parser.thread_signatures:
+            continue
+        parser.thread_signatures.add(key)
+        parser.save_thread(thread)
+
+
+def _build(threads):
+    for thread in threads:
+        rebuilt = ChatThread(thread.participants)
+        for m in thread.messages:
+            rebuilt.add_message(m)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--threads', type=int, default=500)
+    arg_parser.add_argument('--messages', type=int, default=1000)
+    args = arg_parser.parse_args()
+
+    threads = _threads(args.threads, args.messages)
+
+    def incremental():
+        for thread in threads:
+            # Drop the cached digest, as a freshly parsed thread has none.
+            thread._digest = None
+        _save_all(threads, lambda thread: thread.signature)
+
+    report('add_message', best_of(lambda: _build(threads)), None,
+           args.threads * args.messages, 'msgs')
+    report('save threads (md5 on access)',
+           best_of(lambda: _save_all(threads, _md5_signature)), None, args.threads, 'threads')
+    report('save threads (incremental)', best_of(incremental), None, args.threads, 'threads')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Guards the start-up time of `fbcap`, which batch jobs run over and over on
+small archives.
+
+Each command is run in fresh interpreters with `python -X importtime`. The
+best wall time of several runs, less that of a bare interpreter, has to
+stay within the budget, and none of the modules that are only needed by
+some subcommands (the name resolver's, YAML support, the date parsing
+libraries and lxml) may be imported. The slowest imports are listed to
+tell where the time goes. Exits with status 1 if any command fails either
+check.
+
+    python -m benchmarks.bench_startup [--runs 10] [--budget 0.25]
+"""
+
+from __future__ import unicode_literals, print_function, division
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from timeit import default_timer
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = [
+    ('fbcap --help', ['-m', 'fbchat_archive_parser.main', '--help']),
+    ('fbcap messages --help', ['-m', 'fbchat_archive_parser.main', 'messages', '--help']),
+    ('fbcap stats --help', ['-m', 'fbchat_archive_parser.main', 'stats', '--help']),
+]
+
+# Modules that no command above has any use for.
+DEFERRED_MODULES = ('requests', 'bs4', 'yaml', 'arrow', 'babel', 'lxml')
+
+_IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def run_python(args):
+    """
+    Runs the interpreter with `-X importtime`.
+
+    :return: A tuple of the elapsed seconds and a list of (module, cumulative
+             seconds, nesting level) tuples of the imports.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [_ROOT, env.get('PYTHONPATH')]))
+    with open(os.devnull, 'wb') as devnull, tempfile.TemporaryFile() as stderr:
+        start = default_timer()
+        status = subprocess.call([sys.executable, '-X', 'importtime'] + args,
+                                 stdout=devnull, stderr=stderr, env=env)
+        elapsed = default_timer() - start
+        stderr.seek(0)
+        output = stderr.read().decode('utf-8', 'replace')
+    if status != 0:
+        raise RuntimeError("python %s failed:\n%s" % (' '.join(args), output))
+    imports = []
+    for line in output.splitlines():
+        m = _IMPORT_TIME.match(line)
+        if m:
+            imports.append((m.group(4), int(m.group(2)) / 1e6, (len(m.group(3)) - 1) // 2))
+    return elapsed, imports
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--runs', type=int, default=10)
+    arg_parser.add_argument('--budget', type=float, default=0.25,
+                            help='Most seconds a command may add to a bare interpreter')
+    arg_parser.add_argument('--slowest', type=int, default=5,
+                            help='How many of the slowest imports to list')
+    args = arg_parser.parse_args()
+
+    base = min(run_python(['-c', 'pass'])[0] for _ in range(args.runs))
+    print('%-40s %8.3f s' % ('python', base))
+    failed = False
+    for name, command in COMMANDS:
+        runs = [run_python(command) for _ in range(args.runs)]
+        seconds, imports = min(runs, key=lambda r: r[0])
+        startup = seconds - base
+        deferred = sorted(set(module.split('.')[0] for module, _, _ in imports
+                              if module.split('.')[0] in DEFERRED_MODULES))
+        over = startup > args.budget
+        print('%-40s %8.3f s  (+%.3f s of %.3f s)%s'
+              % (name, seconds, startup, args.budget, '  OVER BUDGET' if over else ''))
+        if deferred:
+            print('  imports %s' % ', '.join(deferred))
+        top_level = sorted((i for i in imports if i[2] == 0 and i[0] != 'site'),
+                           key=lambda i: -i[1])
+        for module, cumulative, _ in top_level[:args.slowest]:
+            print('    %-36s %8.3f s' % (module, cumulative))
+        failed = failed or over or bool(deferred)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Measures how fast `ChatThreadParser` gets through the events of a large
+thread file, against the raw iterparse throughput it is bounded by. The
+parser is also timed with timestamp parsing stubbed out, which leaves the
+cost of handling the events themselves.
+
+    python -m benchmarks.bench_thread_parser [--messages N]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+from datetime import datetime
+import io
+import os
+import shutil
+import tempfile
+
+from fbchat_archive_parser import parser
+from fbchat_archive_parser.parser import (ChatThreadParser, iterparse, available_engines,
+                                          _THREAD_TAGS)
+
+from .common import best_of, report
+from .generator import generate_archive, SPLIT_WITH_IMAGES_FORMAT
+
+
+def _count_events(path, engine):
+    with io.open(path, 'rb') as f:
+        return sum(1 for _ in iterparse(f, engine, _THREAD_TAGS))
+
+
+def _parse(path, engine):
+    with io.open(path, 'rb') as f:
+        return ChatThreadParser(iterparse(f, engine, _THREAD_TAGS)).parse(())
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--messages', type=int, default=100000)
+    args = arg_parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        generate_archive(root, SPLIT_WITH_IMAGES_FORMAT, 1, args.messages, uniform=True)
+        path = os.path.join(root, 'messages', '0.html')
+        size = os.path.getsize(path)
+        print("thread file: %.1f MB, %d messages" % (size / 1e6, args.messages))
+        for engine in available_engines():
+            events = _count_events(path, engine)
+            report('iterparse (%s)' % engine, best_of(lambda: _count_events(path, engine)),
+                   size, events, 'events')
+            report('ChatThreadParser (%s)' % engine, best_of(lambda: _parse(path, engine)),
+                   size, events, 'events')
+            parse_timestamp = parser.parse_timestamp
+            parser.parse_timestamp = lambda *args: datetime(2013, 10, 4)
+            try:
+                report('  without timestamps (%s)' % engine,
+                       best_of(lambda: _parse(path, engine)), size, events, 'events')
+            finally:
+                parser.parse_timestamp = parse_timestamp
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Measures how fast `parse_timestamp` gets through the timestamps of a
+generated archive (see `benchmarks.generator`), in archive order, for each
+locale of `FACEBOOK_TIMESTAMP_FORMATS`:
+
+  arrow     -- parsing with arrow alone, the way timestamps used to be
+               parsed (with the right format, so at best)
+  uncached  -- `parse_timestamp` without `TIMESTAMP_CACHE`
+  cached    -- `parse_timestamp` as is
+
+    python -m benchmarks.bench_timestamps [--messages N] [--locales en_us,lt_lt]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import io
+import re
+import shutil
+import tempfile
+
+from fbchat_archive_parser import time
+from fbchat_archive_parser.time import (parse_timestamp, FACEBOOK_TIMESTAMP_FORMATS,
+                                        TIMESTAMP_CACHE)
+
+from .common import best_of, report
+from .generator import generate_archive, LEGACY_FORMAT
+
+_META = re.compile(r'<span class="meta">([^<]*)</span>')
+
+
+def _timestamps(locale, messages):
+    directory = tempfile.mkdtemp()
+    try:
+        archive = generate_archive(directory, LEGACY_FORMAT, threads=max(1, messages // 100),
+                                   messages=100, locale=locale, control_chars=0)
+        with io.open(archive.path, encoding='utf-8') as f:
+            return _META.findall(f.read()), archive.timezone_hints
+    finally:
+        shutil.rmtree(directory)
+
+
+def _parse_all(timestamps, hints):
+    TIMESTAMP_CACHE.clear()
+    for raw_timestamp in timestamps:
+        parse_timestamp(raw_timestamp, True, hints)
+
+
+def _parse_all_with_arrow(date_parser, timestamps):
+    for raw_timestamp in timestamps:
+        date_parser.parse(raw_timestamp.rsplit(" ", 1)[0])
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--messages', type=int, default=5000)
+    arg_parser.add_argument('--locales', default=None,
+                            help='Locales or indexes of the timestamp formats to measure '
+                                 '(default: all)')
+    args = arg_parser.parse_args()
+
+    if args.locales:
+        locales = [int(l) if l.isdigit() else l for l in args.locales.split(',')]
+    else:
+        locales = list(range(len(FACEBOOK_TIMESTAMP_FORMATS)))
+    maxsize = TIMESTAMP_CACHE.maxsize
+    for locale in locales:
+        try:
+            timestamps, hints = _timestamps(locale, args.messages)
+        except ValueError as e:
+            print("%s: skipped (%s)" % (locale, e))
+            continue
+        index = locale if isinstance(locale, int) else \
+            [f[0] for f in FACEBOOK_TIMESTAMP_FORMATS].index(locale)
+        timestamp_format = FACEBOOK_TIMESTAMP_FORMATS[index]
+        print("%s %s: %d timestamps, %d distinct"
+              % (timestamp_format[0], timestamp_format[1], len(timestamps),
+                 len(set(timestamps))))
+        date_parser = time._LOCALIZED_DATE_PARSERS[index]
+        report('  arrow', best_of(lambda: _parse_all_with_arrow(date_parser, timestamps), 1),
+               count=len(timestamps), unit='parses')
+        try:
+            TIMESTAMP_CACHE.maxsize = 0
+            report('  uncached', best_of(lambda: _parse_all(timestamps, hints)),
+                   count=len(timestamps), unit='parses')
+        finally:
+            TIMESTAMP_CACHE.maxsize = maxsize
+        report('  cached', best_of(lambda: _parse_all(timestamps, hints)),
+               count=len(timestamps), unit='parses')
+        print("  hit rate: %.1f%%" % (TIMESTAMP_CACHE.hit_rate * 100))
+
+
+if __name__ == '__main__':
+    main()
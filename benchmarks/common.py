@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks are run from the repository root as modules, e.g.
+
+    python -m benchmarks.bench_safe_stream
+
+The archives they run on are generated by `benchmarks.generator`.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import timeit
+
+
+class ChunkStream(object):
+    """
+    A read-only binary file object over an iterator of byte chunks, so that
+    archives far larger than memory can be fed to the parsers.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+        self.position = 0
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.position += len(chunk)
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def best_of(func, repeat=3):
+    """
+    Times a function, returning the best of several runs in seconds.
+    """
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def report(name, seconds, size_bytes=None, count=None, unit='ops'):
+    line = '%-40s %9.3f s' % (name, seconds)
+    if size_bytes is not None:
+        line += '  %8.1f MB/s' % (size_bytes / seconds / 1e6)
+    if count is not None:
+        line += '  %10.0f %s/s' % (count / seconds, unit)
+    print(line)
@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+"""
+Generates synthetic archives in each of the formats `fbcap` supports, for
+measuring how parsing scales.
+
+The archives aim to look like real downloads: thread lengths have a long
+tail, messages come in bursts and are listed newest first, timestamps are
+rendered in any of the locales of `FACEBOOK_TIMESTAMP_FORMATS` with either
+UTC offsets or (possibly ambiguous) timezone abbreviations, and legacy
+archives split long threads into several parts. Every benchmark builds its
+archives here, either on disk (`generate_archive`) or streamed
+(`iter_legacy_archive`).
+
+    python -m benchmarks.generator DIRECTORY [--layout legacy] [--size 100M]
+        [--threads N] [--messages N] [--uniform] [--participants 1-3]
+        [--locale fr_fr] [--timezones offset] [--control-chars 0.05] [--seed 0]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+from collections import namedtuple
+from datetime import datetime, timedelta
+import io
+import os
+import random
+import re
+
+import arrow
+
+from fbchat_archive_parser.parser import (LEGACY_FORMAT, SPLIT_FORMAT,
+                                          SPLIT_WITH_IMAGES_FORMAT)
+from fbchat_archive_parser.time import FACEBOOK_TIMESTAMP_FORMATS
+
+LAYOUTS = (LEGACY_FORMAT, SPLIT_FORMAT, SPLIT_WITH_IMAGES_FORMAT)
+
+OFFSET_TIMEZONES = 'offset'
+ABBREVIATED_TIMEZONES = 'abbreviation'
+TIMEZONE_STYLES = (OFFSET_TIMEZONES, ABBREVIATED_TIMEZONES)
+
+OWNER = "First User 一"
+
+# Legacy archives split threads into parts of at most this many messages.
+_LEGACY_THREAD_PART = 10000
+
+_FIRST_NAMES = ["Second", "Third", "Zoë", "José", "Анна", "Олег", "美咲", "健太",
+                "Łukasz", "Søren", "Ngozi", "Aoife", "Mateus", "Priya", "Kai", "Émile"]
+_LAST_NAMES = ["User 二", "User 三", "Smith", "Müller", "Иванова", "Петров", "佐藤",
+               "Nowak", "Jørgensen", "Okafor", "Ó Briain", "Gonçalves", "Iyer", "Lee",
+               "Dubois", "Rossi"]
+_WORDS = ["hello", "ok", "lol", "see", "you", "tomorrow", "Что", "это", "白人看不懂",
+          "ymmärrä", "&amp;", "&lt;3", "&quot;quoted&quot;", "haha", "😂", "ça", "va"]
+
+# (offset hours, offset minutes) of the UTC offsets timestamps are given in.
+_OFFSETS = [(-8, 0), (-7, 0), (-5, 0), (-3, 0), (0, 0), (1, 0), (2, 0), (5, 30), (8, 0),
+            (9, 0), (-3, -30)]
+# (standard name, offset, daylight saving name, offset) of the abbreviations
+# timestamps are given in. Some of them are ambiguous without hints.
+_ABBREVIATIONS = [("PST", (-8, 0), "PDT", (-7, 0)),
+                  ("EST", (-5, 0), "EDT", (-4, 0)),
+                  ("CET", (1, 0), "CEST", (2, 0)),
+                  ("GMT", (0, 0), "BST", (1, 0))]
+
+_PEOPLE = ["%s %s" % (first, last) for first in _FIRST_NAMES for last in _LAST_NAMES]
+
+_TIME_TOKENS = re.compile(r'h:mmA|HH:mm|H:mm')
+_START = datetime(2010, 1, 1)
+_SPAN_MINUTES = 8 * 365 * 24 * 60
+
+
+class Archive(namedtuple('Archive', ['path', 'layout', 'threads', 'messages', 'size',
+                                     'timezone_hints'])):
+    """
+    A generated archive.
+
+    path           -- the `messages.htm` file to parse
+    layout         -- one of `LAYOUTS`
+    threads        -- the number of threads (not counting the parts of
+                      legacy threads)
+    messages       -- the total number of messages
+    size           -- the total size of the archive files in bytes
+    timezone_hints -- the hints needed to parse the timestamps, as
+                      name -> (hours, minutes)
+    """
+
+    def timezone_option(self):
+        """
+        :return: The hints as the argument of `fbcap -z` (`None` if none).
+        """
+        if not self.timezone_hints:
+            return None
+        return ','.join('%s=%s%02d%02d' % (name, '-' if hours < 0 else '+', abs(hours),
+                                           abs(minutes))
+                        for name, (hours, minutes) in sorted(self.timezone_hints.items()))
+
+
+class TimestampRenderer(object):
+    """
+    Renders timestamps the way Facebook does for one of the entries of
+    `FACEBOOK_TIMESTAMP_FORMATS`.
+
+    The date is rendered by arrow (once per day), and the time of day by
+    hand, which keeps the generator quick enough for archives of several
+    gigabytes.
+    """
+
+    def __init__(self, timestamp_format):
+        self.locale_id, fmt = timestamp_format[:2]
+        # Optional letters (e.g. "a las?") are left out.
+        fmt = fmt.replace('?', '')
+        m = _TIME_TOKENS.search(fmt)
+        if not m:
+            raise ValueError("no time of day in %r" % fmt)
+        self.date_format, self.time_format = fmt[:m.start()], m.group()
+        self.suffix = fmt[m.end():]
+        try:
+            arrow.get(_START).format(self.date_format, locale=self.locale_id)
+        except ValueError:
+            raise ValueError("locale %s is not supported by arrow" % self.locale_id)
+        self.dates = {}
+
+    def _date(self, day):
+        date = self.dates.get(day)
+        if date is None:
+            date = self.dates[day] = arrow.get(day).format(self.date_format,
+                                                           locale=self.locale_id)
+        return date
+
+    def render(self, timestamp):
+        date = self._date(timestamp.date())
+        if self.time_format == 'h:mmA':
+            hour = timestamp.hour % 12 or 12
+            time = '%d:%02d%s' % (hour, timestamp.minute, 'pm' if timestamp.hour >= 12 else 'am')
+        elif self.time_format == 'HH:mm':
+            time = '%02d:%02d' % (timestamp.hour, timestamp.minute)
+        else:
+            time = '%d:%02d' % (timestamp.hour, timestamp.minute)
+        return date + time + self.suffix
+
+
+def _timestamp_format(locale):
+    """
+    Looks up an entry of `FACEBOOK_TIMESTAMP_FORMATS` by index or locale.
+    """
+    if isinstance(locale, int):
+        return FACEBOOK_TIMESTAMP_FORMATS[locale]
+    for timestamp_format in FACEBOOK_TIMESTAMP_FORMATS:
+        if timestamp_format[0] == locale:
+            return timestamp_format
+    raise ValueError("no timestamp format for locale %s" % locale)
+
+
+def _format_offset(offset):
+    hours, minutes = offset
+    sign = '-' if hours < 0 or minutes < 0 else '+'
+    if minutes:
+        return 'UTC%s%02d:%02d' % (sign, abs(hours), abs(minutes))
+    return 'UTC%s%02d' % (sign, abs(hours))
+
+
+class _ThreadWriter(object):
+    """
+    Renders the threads of an archive.
+    """
+
+    def __init__(self, rand, renderer, timezone_style, control_chars, images):
+        self.rand = rand
+        self.renderer = renderer
+        self.timezone_style = timezone_style
+        self.control_chars = control_chars
+        self.images = images
+        self.timezone_hints = {}
+
+    def _zone(self):
+        """
+        :return: A function of a timestamp to the name of its timezone.
+        """
+        if self.timezone_style == OFFSET_TIMEZONES:
+            name = _format_offset(self.rand.choice(_OFFSETS))
+            return lambda timestamp: name
+        standard, standard_offset, daylight, daylight_offset = \
+            self.rand.choice(_ABBREVIATIONS)
+        self.timezone_hints[standard] = standard_offset
+        self.timezone_hints[daylight] = daylight_offset
+        return lambda timestamp: daylight if 3 < timestamp.month < 11 else standard
+
+    def _content(self):
+        rand = self.rand
+        if self.images and rand.random() < 0.02:
+            return '<img src="messages/photos/%d.jpg" />' % rand.randint(10000, 99999)
+        content = ' '.join(rand.choice(_WORDS) for _ in range(int(rand.expovariate(0.15)) + 1))
+        if self.control_chars and rand.random() < self.control_chars:
+            position = rand.randint(0, len(content))
+            content = content[:position] + rand.choice('\x0b\x1f\x08\x7f') + content[position:]
+        return content
+
+    def messages(self, senders, count):
+        """
+        Renders the messages of a thread, newest first.
+
+        :param senders: The names of whoever takes part in the thread.
+        :param count: The number of messages.
+        :return: A list of the HTML of each message.
+        """
+        rand = self.rand
+        zone = self._zone()
+        render = self.renderer.render
+        # Walk back from the newest message: most follow each other within
+        # a minute or so, with the odd gap of hours or days.
+        timestamp = _START + timedelta(minutes=rand.randint(_SPAN_MINUTES // 2, _SPAN_MINUTES))
+        out = []
+        for _ in range(count):
+            out.append(
+                '<div class="message"><div class="message_header">'
+                '<span class="user">%s</span><span class="meta">%s %s</span></div></div>\n'
+                '<p>%s</p>\n'
+                % (rand.choice(senders), render(timestamp), zone(timestamp), self._content()))
+            if rand.random() < 0.02:
+                timestamp -= timedelta(minutes=rand.randint(60, 60 * 24 * 14))
+            else:
+                timestamp -= timedelta(seconds=int(rand.expovariate(1 / 40.0)))
+        return out
+
+
+def _thread_length(rand, messages):
+    # Pareto distributed with a mean of `messages`: most threads are short,
+    # and a few go on and on.
+    return max(1, int(rand.paretovariate(1.5) * messages / 3.0))
+
+
+def _people(rand, participants):
+    low, high = participants
+    return sorted(rand.sample(_PEOPLE, rand.randint(low, high)))
+
+
+def _threads(rand, writer, participants, messages, uniform):
+    """
+    Renders threads for as long as they are asked for.
+
+    :return: An iterator of (the participants besides the owner, the HTML of
+             each message) per thread.
+    """
+    while True:
+        people = _people(rand, participants)
+        count = messages if uniform else _thread_length(rand, messages)
+        yield people, writer.messages([OWNER] + people, count)
+
+
+def generate_archive(directory, layout=LEGACY_FORMAT, threads=100, messages=100, size=None,
+                     participants=(1, 3), locale=0, timezone_style=OFFSET_TIMEZONES,
+                     control_chars=0.05, seed=0, uniform=False):
+    """
+    Writes a synthetic archive into a directory.
+
+    :param directory: Where to write the archive (created if need be).
+    :param layout: One of `LAYOUTS`.
+    :param threads: The number of threads.
+    :param messages: The average number of messages per thread.
+    :param size: If given, threads are added until the archive is at least
+                 this many bytes, regardless of `threads`.
+    :param participants: The (least, most) participants of a thread, besides
+                         the owner of the archive.
+    :param locale: The index or locale of the entry of
+                   `FACEBOOK_TIMESTAMP_FORMATS` to render timestamps with.
+    :param timezone_style: One of `TIMEZONE_STYLES`.
+    :param control_chars: The share of messages to put an illegal control
+                          character in.
+    :param seed: The random seed used to generate the content.
+    :param uniform: Whether every thread has exactly `messages` messages,
+                    rather than a long tailed number of them.
+    :return: An `Archive`.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError("unknown layout %s" % layout)
+    if timezone_style not in TIMEZONE_STYLES:
+        raise ValueError("unknown timezone style %s" % timezone_style)
+    rand = random.Random(seed)
+    writer = _ThreadWriter(rand, TimestampRenderer(_timestamp_format(locale)), timezone_style,
+                           control_chars, layout == SPLIT_WITH_IMAGES_FORMAT)
+    html_dir = os.path.join(directory, 'html')
+    messages_dir = os.path.join(directory, 'messages')
+    for d in (html_dir, messages_dir) if layout != LEGACY_FORMAT else (html_dir,):
+        if not os.path.isdir(d):
+            os.makedirs(d)
+    path = os.path.join(html_dir, 'messages.htm')
+    rendered_threads = _threads(rand, writer, participants, messages, uniform)
+
+    thread_count, message_count, written = 0, 0, 0
+    with io.open(path, 'wb') as f:
+        written += f.write(_header(OWNER))
+        while (thread_count < threads) if size is None else (written < size):
+            people, rendered = next(rendered_threads)
+            if layout == LEGACY_FORMAT:
+                for part in _legacy_thread(people, rendered):
+                    written += f.write(part)
+            else:
+                thread_path = os.path.join(messages_dir, '%d.html' % thread_count)
+                with io.open(thread_path, 'wb') as thread_file:
+                    written += thread_file.write(
+                        _thread_file(people, rendered, layout == SPLIT_WITH_IMAGES_FORMAT))
+                written += f.write(('<a href="../messages/%d.html">%s</a><br />\n'
+                                    % (thread_count, _participants_text(people))
+                                    ).encode('utf-8'))
+            thread_count += 1
+            message_count += len(rendered)
+        written += f.write(_footer())
+
+    return Archive(path, layout, thread_count, message_count, written,
+                   dict(writer.timezone_hints))
+
+
+def iter_legacy_archive(threads=100, messages=100, participants=(1, 3), locale=0,
+                        control_chars=0.05, seed=0, uniform=False):
+    """
+    Generates the `messages.htm` of a legacy archive piece by piece, the way
+    `generate_archive` writes it, so that archives larger than memory (or
+    disk) can be streamed into the parsers.
+
+    Timestamps are always given with UTC offsets, so no hints are needed to
+    parse them. The parameters are those of `generate_archive`.
+
+    :return: An iterator of UTF-8 encoded chunks: the header, each part of
+             each thread, and the footer.
+    """
+    rand = random.Random(seed)
+    writer = _ThreadWriter(rand, TimestampRenderer(_timestamp_format(locale)), OFFSET_TIMEZONES,
+                           control_chars, False)
+    rendered_threads = _threads(rand, writer, participants, messages, uniform)
+    yield _header(OWNER)
+    for _ in range(threads):
+        for part in _legacy_thread(*next(rendered_threads)):
+            yield part
+    yield _footer()
+
+
+def _participants_text(names):
+    return ', '.join(names).replace('&', '&amp;').replace('<', '&lt;')
+
+
+def _header(owner):
+    return ('<html>\n<head><meta charset="UTF-8" /><title>%s - Messages</title></head>\n'
+            '<body>\n<div class="nav"><ul><li><a href="../index.htm">Profile</a></li>'
+            '<li class="selected">Messages</li></ul></div>\n'
+            '<div class="contents"><h1>%s</h1>\n<div>\n' % (owner, owner)).encode('utf-8')
+
+
+def _footer():
+    return '</div>\n</div>\n</body>\n</html>\n'.encode('utf-8')
+
+
+def _legacy_thread(people, rendered):
+    # Facebook listed the owner among the participants.
+    names = _participants_text([OWNER] + people)
+    for part in range(0, len(rendered), _LEGACY_THREAD_PART):
+        yield ('<div class="thread">%s\n%s</div>\n'
+               % (names, ''.join(rendered[part:part + _LEGACY_THREAD_PART]))).encode('utf-8')
+
+
+def _thread_file(people, rendered, images):
+    title = _participants_text(people)
+    preamble = 'Participants: %s' % _participants_text([OWNER] + people) if images else '\n'
+    return ('<html>\n<head><meta charset="UTF-8" /><title>Conversation with %s</title></head>\n'
+            '<body><a href="../html/messages.htm">Messages</a><br /><br />\n'
+            '<div class="thread"><h3>Conversation with %s</h3>%s%s</div>\n</body>\n</html>\n'
+            % (title, title, preamble, ''.join(rendered))).encode('utf-8')
+
+
+def parse_size(text):
+    """
+    Parses a size such as `500K`, `10M` or `5G` (powers of 1000) into bytes.
+    """
+    m = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*$', text, re.IGNORECASE)
+    if not m:
+        raise ValueError("invalid size %r" % text)
+    return int(float(m.group(1)) * 1000 ** ' KMG'.index(m.group(2).upper() or ' '))
+
+
+def _range(text):
+    low, _, high = text.partition('-')
+    return int(low), int(high or low)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('directory')
+    arg_parser.add_argument('--layout', choices=LAYOUTS, default=LEGACY_FORMAT)
+    arg_parser.add_argument('--size', type=parse_size, default=None,
+                            help='Approximate size of the archive (overrides --threads)')
+    arg_parser.add_argument('--threads', type=int, default=100)
+    arg_parser.add_argument('--messages', type=int, default=100,
+                            help='Average number of messages per thread')
+    arg_parser.add_argument('--uniform', action='store_true',
+                            help='Give every thread exactly --messages messages')
+    arg_parser.add_argument('--participants', type=_range, default=(1, 3),
+                            help='Participants per thread besides the owner (e.g. 1-3)')
+    arg_parser.add_argument('--locale', default='0',
+                            help='Index or locale of the timestamp format to use')
+    arg_parser.add_argument('--timezones', choices=TIMEZONE_STYLES, default=OFFSET_TIMEZONES)
+    arg_parser.add_argument('--control-chars', type=float, default=0.05,
+                            help='Share of messages with illegal control characters')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    locale = int(args.locale) if args.locale.isdigit() else args.locale
+    archive = generate_archive(
+        args.directory, args.layout, args.threads, args.messages, args.size,
+        args.participants, locale, args.timezones, args.control_chars, args.seed, args.uniform)
+    print("%s: %d threads, %d messages, %.1f MB"
+          % (archive.path, archive.threads, archive.messages, archive.size / 1e6))
+    if archive.timezone_hints:
+        print("parse with: -z %s" % archive.timezone_option())
+
+
+if __name__ == '__main__':
+    main()
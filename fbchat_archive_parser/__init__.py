@@ -1,19 +1,145 @@
-from collections import namedtuple
+from array import array
+from collections import namedtuple, Counter
+from datetime import datetime, timedelta
+import functools
 import hashlib
+import re
+import struct
+import sys
 
-from ._version import get_versions
-__version__ = get_versions()['version']
-del get_versions
+from six.moves import zip
+
+
+def _get_version():
+    from ._version import get_versions
+    return get_versions()['version']
+
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        # The version is worked out on first use, as versioneer may have to
+        # run git for it.
+        if name == '__version__':
+            global __version__
+            __version__ = _get_version()
+            return __version__
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+else:
+    __version__ = _get_version()
+
+try:
+    _new_signature = functools.partial(hashlib.blake2b, digest_size=16)
+except AttributeError:
+    # blake2b is only available from Python 3.6 onwards.
+    _new_signature = hashlib.md5
+
+# The wall time (year, month, day, hour, minute, second and microsecond),
+# UTC offset (in seconds) and lengths of the UTF-8 encoded sender and
+# content of each message in a signature, which the two follow.
+_SIGNATURE_FIELDS = struct.Struct('<HBBBBBIiII')
+# Stands in for the UTC offset of naive timestamps.
+_NO_OFFSET = -2 ** 31
+
+# The participant that stands in for each deleted (or blocking) user an
+# archive has a thread with, numbered in the order of the archive.
+UNKNOWN_USER = 'Unknown user #{:03d}'
+_UNKNOWN_USER = re.compile(r'Unknown user #(\d+)$')
+
+try:
+    _LONG = _MICROSECONDS = array('q').typecode
+except ValueError:
+    # Python 2 has no 64-bit integer arrays. Doubles hold every whole number
+    # of microseconds since the epoch until the 23rd century.
+    _LONG, _MICROSECONDS = 'l', 'd'
+_EPOCH = datetime(1970, 1, 1)
 
 
 class FacebookChatHistory:
     """
     Represents the Facebook chat history between the owner of
     the history and their contacts.
+
+    locale -- the locale the timestamps of the archive were in (e.g.
+              "en_us"), if known
+    symbols -- the `SymbolTable` of the senders of the threads, if their
+               messages are kept column by column (see `MessageColumns`)
+    interner -- the `StringInterner` the messages were interned with, which
+                those merged in are interned with too
     """
-    def __init__(self, user, threads=None):
+    def __init__(self, user, threads=None, locale=None, symbols=None, interner=None):
         self.threads = threads if threads else {}
         self.user = user
+        self.locale = locale
+        self.symbols = symbols
+        self.interner = interner
+        # How many times each message occurs, along with the number of
+        # messages it was counted from (see `merge`).
+        self._message_counts = None
+
+    def merge(self, other):
+        """
+        Merges the threads of another chat history of the same user into
+        this one, such as a later download of the same account.
+
+        Messages are told apart by their thread, (UTC) timestamp, sender
+        and content, and only those this history doesn't already have are
+        added. A message that occurs several times in a thread is added as
+        many times as it occurs in either history. Messages are appended,
+        so call `sort` once done merging.
+
+        Threads with unknown users (see `UNKNOWN_USER`) are numbered by
+        each archive on its own, so the same number needn't be the same
+        person. They are added as threads of their own, numbered after
+        those this history has.
+
+        other -- the chat history to merge in (its threads are taken over)
+
+        :return: This chat history.
+        """
+        if other.user != self.user:
+            raise ValueError("Can't merge the chat history of %s into that of %s"
+                             % (other.user, self.user))
+        if self.locale is None:
+            self.locale = other.locale
+        counts = self._message_index()
+        for key, thread in sorted(other.threads.items(), key=_merge_order):
+            if _unknown_user_number(thread.participants) is not None:
+                key = UNKNOWN_USER.format(self._unknown_user_count())
+                existing = self.threads[key] = ChatThread([key], self.symbols)
+            else:
+                existing = self.threads.get(key)
+            if existing is None:
+                existing = self.threads[key] = ChatThread(thread.participants, self.symbols)
+            seen = Counter()
+            for m in thread.messages:
+                message_key = _message_key(key, m)
+                seen[message_key] += 1
+                if seen[message_key] > counts[message_key]:
+                    counts[message_key] += 1
+                    if self.interner is not None:
+                        m = self.interner.intern_message(m)
+                    existing.add_message(m)
+        self._message_counts = (self._message_count(), counts)
+        return self
+
+    def _unknown_user_count(self):
+        numbers = [int(m.group(1)) for m in map(_UNKNOWN_USER.match, self.threads) if m]
+        return max(numbers) + 1 if numbers else 0
+
+    def _message_count(self):
+        return sum(len(thread) for thread in self.threads.values())
+
+    def _message_index(self):
+        # Kept between merges, unless messages were added in the meantime.
+        if self._message_counts is not None:
+            message_count, counts = self._message_counts
+            if message_count == self._message_count():
+                return counts
+        counts = Counter()
+        for key, thread in self.threads.items():
+            for m in thread.messages:
+                counts[_message_key(key, m)] += 1
+        return counts
 
     def sort(self):
         """
@@ -29,10 +155,19 @@ class ChatThread(object):
     and a list of participants. Messages are stored in sorted
     order.
     """
-    def __init__(self, participants):
+    def __init__(self, participants, symbols=None):
+        """
+        participants -- the participants of the thread (excluding the
+                        owner of the history)
+        symbols      -- a `SymbolTable` to code the senders with, for
+                        keeping the messages in `MessageColumns` rather
+                        than in a list (default None)
+        """
         self.participants = list(participants)
         self.participants.sort()
-        self.messages = list()
+        self.messages = list() if symbols is None else MessageColumns(symbols)
+        self._signature = _new_signature()
+        self._digest = None
 
     def add_message(self, message):
         """
@@ -40,18 +175,38 @@ class ChatThread(object):
 
         message -- the message to add
         """
-        self.messages += [message]
+        self.messages.append(message)
+        self._signature.update(_encode_message(message))
+        self._digest = None
         return self
 
     @property
     def signature(self):
-        signature = hashlib.md5()
+        """
+        A digest of the messages of the thread in the order they were
+        added, which is kept up to date as they are added.
+        """
+        if self._digest is None:
+            self._digest = self._signature.digest()
+        return self._digest
 
-        for m in self.messages:
-            signature.update(str(m.timestamp).encode('utf-8'))
-            signature.update(m.sender.encode('utf-8'))
-            signature.update(m.content.encode('utf-8'))
-        return signature
+    def __getstate__(self):
+        # Hash objects can't be pickled, so the signature is rebuilt from
+        # the messages when unpickling instead.
+        state = self.__dict__.copy()
+        del state['_signature']
+        return state
+
+    def __setstate__(self, state):
+        messages = state['messages']
+        self.__dict__.update(state)
+        if isinstance(messages, MessageColumns):
+            self.messages = MessageColumns(messages.symbols)
+        else:
+            self.messages = []
+        self._signature = _new_signature()
+        for m in messages:
+            self.add_message(m)
 
     def __lt__(self, other):
         return len(self.messages) < len(other.messages)
@@ -60,6 +215,42 @@ class ChatThread(object):
         return len(self.messages)
 
 
+def _unknown_user_number(participants):
+    if len(participants) == 1:
+        match = _UNKNOWN_USER.match(participants[0])
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def _merge_order(item):
+    # Threads with unknown users go last, by number, and the others are left
+    # in their order.
+    number = _unknown_user_number(item[1].participants)
+    return (0, 0) if number is None else (1, number)
+
+
+def _message_key(thread_key, message):
+    timestamp = message.timestamp
+    offset = timestamp.utcoffset()
+    if offset is not None:
+        timestamp = timestamp.replace(tzinfo=None) - offset
+    return thread_key, timestamp, message.sender, message.content
+
+
+def _encode_message(message):
+    timestamp = message.timestamp
+    offset = timestamp.utcoffset()
+    offset = _NO_OFFSET if offset is None else offset.days * 86400 + offset.seconds
+    sender = message.sender.encode('utf-8')
+    content = message.content.encode('utf-8')
+    return b''.join((_SIGNATURE_FIELDS.pack(timestamp.year, timestamp.month, timestamp.day,
+                                            timestamp.hour, timestamp.minute, timestamp.second,
+                                            timestamp.microsecond, offset,
+                                            len(sender), len(content)),
+                     sender, content))
+
+
 # More recent messages have a lower magnitude sequence number.
 _ChatMessageT = namedtuple('_ChatMessageT',
                            ['timestamp', 'seq_num', 'sender', 'content'])
@@ -80,3 +271,277 @@ class ChatMessage(_ChatMessageT):
         """
         return super(ChatMessage, cls) \
             .__new__(cls, timestamp, seq_num, sender, content)
+
+    def __getnewargs__(self):
+        # The constructor takes its arguments in a different order from the
+        # fields, which would otherwise scramble them when unpickling.
+        return self.timestamp, self.sender, self.content, self.seq_num
+
+
+# Creates a `ChatMessage` from its fields in order, skipping its constructor.
+_new_message = tuple.__new__
+
+
+class SymbolTable(object):
+    """
+    Gives each distinct string (such as the senders of a chat history) a
+    small integer code, so that it is only held once however many times
+    it occurs.
+    """
+    def __init__(self):
+        self.symbols = []
+        self._codes = {}
+
+    def code(self, symbol):
+        """
+        Gets the code of a string, giving it the next one if it is new.
+
+        symbol -- the string to code
+
+        :return: The code of the string.
+        """
+        code = self._codes.get(symbol)
+        if code is None:
+            code = self._add(symbol)
+        return code
+
+    def _add(self, symbol):
+        # Gives a string that has no code yet the next one.
+        code = self._codes[symbol] = len(self.symbols)
+        self.symbols.append(symbol)
+        return code
+
+    def __getitem__(self, code):
+        return self.symbols[code]
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __getstate__(self):
+        # The codes are worked out again from the order of the symbols.
+        return {'symbols': self.symbols}
+
+    def __setstate__(self, state):
+        self.symbols = state['symbols']
+        self._codes = dict((symbol, code) for code, symbol in enumerate(self.symbols))
+
+
+class MessageColumns(object):
+    """
+    The messages of a thread, kept column by column in arrays rather than
+    as a `ChatMessage` each, which takes a fraction of the memory. Messages
+    are created as they are read, so are equal to, but not the same as,
+    those added.
+
+    Of the operations of a list, supports `len`, iteration, indexing and
+    slicing (which gives a list), `==` and `!=` with lists and other
+    `MessageColumns`, `append` and `sort`. Messages can't be replaced or
+    removed.
+
+    timestamps   -- microseconds since the epoch (in UTC, unless naive)
+    offsets      -- UTC offsets in seconds (`_NO_OFFSET` if naive)
+    seq_nums     -- sequence numbers
+    senders      -- codes of the senders in `symbols`
+    content      -- the UTF-8 encoded content, one after another
+    content_ends -- where the content of each message ends in `content`
+    """
+    def __init__(self, symbols):
+        """
+        symbols -- the `SymbolTable` to code the senders with, usually
+                   shared by all the threads of a history
+        """
+        self.symbols = symbols
+        self._clear()
+
+    def _clear(self):
+        self.timestamps = array(_MICROSECONDS)
+        self.offsets = array('i')
+        self.seq_nums = array(_LONG)
+        self.senders = array('i')
+        self.content = bytearray()
+        self.content_ends = array(_LONG)
+        # The epoch in the timezone of each UTC offset (taken from the first
+        # timestamp added with that offset), which timestamps are read as
+        # microseconds since.
+        self._epochs = {_NO_OFFSET: _EPOCH}
+
+    def append(self, message):
+        """
+        Adds a message after the others.
+
+        message -- the `ChatMessage` to add
+        """
+        timestamp = message.timestamp
+        offset = timestamp.utcoffset()
+        wall_time = timestamp.replace(tzinfo=None) - _EPOCH
+        if offset is None:
+            offset_seconds = _NO_OFFSET
+        else:
+            wall_time -= offset
+            offset_seconds = offset.days * 86400 + offset.seconds
+            if offset_seconds not in self._epochs:
+                self._epochs[offset_seconds] = (_EPOCH + offset).replace(
+                    tzinfo=self._fixed_tzinfo(timestamp.tzinfo, offset))
+        self.timestamps.append(
+            (wall_time.days * 86400 + wall_time.seconds) * 1000000 + wall_time.microseconds)
+        self.offsets.append(offset_seconds)
+        self.seq_nums.append(message.seq_num)
+        self.senders.append(self.symbols.code(message.sender))
+        self.content += message.content.encode('utf-8')
+        self.content_ends.append(len(self.content))
+
+    @staticmethod
+    def _fixed_tzinfo(tz_info, offset):
+        # Timezones with daylight saving time can't stand in for every
+        # timestamp with one of their offsets.
+        if tz_info.utcoffset(None) == offset:
+            return tz_info
+        from .time import offset_tzinfo
+        return offset_tzinfo(offset)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("message index out of range")
+        start = self.content_ends[index - 1] if index else 0
+        return _new_message(ChatMessage, (
+            self._epochs[self.offsets[index]] + timedelta(0, 0, self.timestamps[index]),
+            self.seq_nums[index],
+            self.symbols.symbols[self.senders[index]],
+            self.content[start:self.content_ends[index]].decode('utf-8')))
+
+    def __iter__(self):
+        epochs = self._epochs
+        symbols = self.symbols.symbols
+        content = self.content
+        start = 0
+        for timestamp, offset, seq_num, sender, end in zip(
+                self.timestamps, self.offsets, self.seq_nums, self.senders, self.content_ends):
+            yield _new_message(ChatMessage, (epochs[offset] + timedelta(0, 0, timestamp),
+                                             seq_num, symbols[sender],
+                                             content[start:end].decode('utf-8')))
+            start = end
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, MessageColumns)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    # Mutable, like a list.
+    __hash__ = None
+
+    def sort(self, key=None, reverse=False):
+        """
+        Sorts the messages in place, in the same order as a list of them
+        would be.
+
+        key     -- a function of a message to compare it by instead, for
+                   which the messages are all created and added again
+        reverse -- whether to sort in descending order
+        """
+        if key is not None:
+            messages = sorted(self, key=key, reverse=reverse)
+            self._clear()
+            for m in messages:
+                self.append(m)
+            return
+        count = len(self)
+        # Senders are compared by name, which is what their rank stands for.
+        ranks = [0] * len(self.symbols)
+        for rank, code in enumerate(sorted(range(len(self.symbols)),
+                                           key=self.symbols.__getitem__)):
+            ranks[code] = rank
+        keys = list(zip(self.timestamps, self.seq_nums, [ranks[c] for c in self.senders]))
+        order = sorted(range(count), key=keys.__getitem__)
+        # Messages only told apart by their content are rare, as sequence
+        # numbers usually differ, and are ordered by their UTF-8 encoding
+        # (which sorts the same as the text).
+        if len(set(keys)) < count:
+            content = self._encoded_content()
+            order.sort(key=lambda i: keys[i] + (content[i],))
+        # Messages that compare equal are identical, so reversing the order
+        # is as good as a stable sort in reverse.
+        if reverse:
+            order.reverse()
+        if order == list(range(count)):
+            return
+        content = self._encoded_content()
+        for name in ('timestamps', 'offsets', 'seq_nums', 'senders'):
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, [column[i] for i in order]))
+        content = [content[i] for i in order]
+        self.content = bytearray(b''.join(content))
+        self.content_ends = array(_LONG)
+        end = 0
+        for chunk in content:
+            end += len(chunk)
+            self.content_ends.append(end)
+
+    def _encoded_content(self):
+        starts = array(_LONG, [0])
+        starts.extend(self.content_ends[:-1])
+        return [bytes(self.content[start:end]) for start, end in zip(starts, self.content_ends)]
+
+
+class StringInterner(SymbolTable):
+    """
+    Keeps a single copy of each sender name for all the messages of a
+    chat history to share, and optionally of each content string short
+    enough to be likely to recur ("ok", "lol", ...). The code of a string
+    (see `SymbolTable`) can stand in for it as an id.
+
+    max_content_length -- the longest content to intern, in characters, or
+                          `None` to leave content alone (the default, as
+                          every distinct string interned is held on to)
+    """
+    def __init__(self, max_content_length=None):
+        super(StringInterner, self).__init__()
+        self.max_content_length = max_content_length
+
+    def intern(self, string):
+        """
+        :return: The copy of a string kept by the interner.
+        """
+        code = self._codes.get(string)
+        if code is None:
+            self._add(string)
+            return string
+        return self.symbols[code]
+
+    def intern_content(self, content):
+        """
+        :return: The copy of some content kept by the interner, if content
+                 is interned and this is short enough, or else the content
+                 itself.
+        """
+        if self.max_content_length is None or len(content) > self.max_content_length:
+            return content
+        return self.intern(content)
+
+    def intern_message(self, message):
+        """
+        :return: A `ChatMessage` like the one given, with its sender and
+                 (short) content interned.
+        """
+        return _new_message(ChatMessage, (message.timestamp, message.seq_num,
+                                          self.intern(message.sender),
+                                          self.intern_content(message.content)))
+
+    def __getstate__(self):
+        state = super(StringInterner, self).__getstate__()
+        state['max_content_length'] = self.max_content_length
+        return state
+
+    def __setstate__(self, state):
+        super(StringInterner, self).__setstate__(state)
+        self.max_content_length = state['max_content_length']
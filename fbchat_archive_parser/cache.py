@@ -0,0 +1,201 @@
+from __future__ import unicode_literals
+
+from datetime import datetime, timedelta
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import zlib
+
+import pytz
+
+from . import ChatMessage
+from .time import offset_tzinfo
+
+# Bump whenever the layout of cache entries changes.
+CACHE_FORMAT_VERSION = 1
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+_EXTENSION = '.fbcap'
+_EPOCH = datetime(1970, 1, 1)
+_replace = getattr(os, 'replace', os.rename)
+
+
+def default_cache_dir():
+    """
+    :return: `$XDG_CACHE_HOME/fbcap`, or `~/.cache/fbcap` if unset.
+    """
+    root = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(root, 'fbcap')
+
+
+class ThreadCache(object):
+    """
+    An on-disk cache of parsed thread files, so that archives that are
+    parsed over and over again only have their changed files re-parsed.
+
+    Entries are keyed by the path, size and modification time of a thread
+    file along with the options that affect the parsed timestamps. Each
+    entry holds what was parsed from the file as a zlib compressed pickle
+    of plain tuples. Once the cache grows beyond its maximum size, the
+    least recently used entries are evicted.
+
+    directory -- where to store the cache (see `default_cache_dir`)
+    max_size  -- the size in bytes to prune the cache down to
+    """
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory or default_cache_dir()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # Whether writing an entry has failed (see `put`).
+        self.failed = False
+
+    def key(self, path, timezone_hints, use_utc):
+        """
+        Determines the key of a thread file.
+
+        path           -- the path to the thread file
+        timezone_hints -- the timezone hints it is parsed with
+        use_utc        -- whether its timestamps are converted to UTC
+
+        :return: The key, or `None` if the file can't be found.
+        """
+        from . import __version__
+        path = os.path.realpath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        identity = (CACHE_FORMAT_VERSION, __version__, path, stat.st_size,
+                    getattr(stat, 'st_mtime_ns', stat.st_mtime),
+                    sorted((timezone_hints or {}).items()), bool(use_utc))
+        return hashlib.sha1(repr(identity).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _EXTENSION)
+
+    def __contains__(self, key):
+        return key is not None and os.path.exists(self._path(key))
+
+    def get(self, key):
+        """
+        Looks up a parsed thread file.
+
+        :return: The (participants line, missing sender, messages) tuple
+                 that was stored, or `None` if there is none.
+        """
+        if key is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = f.read()
+            # Mark the entry as recently used.
+            os.utime(path, None)
+            result = _decode(entry)
+        except Exception:
+            # Missing, or unreadable for whatever reason, which is treated
+            # no differently.
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """
+        Stores a parsed thread file. Caching is best-effort: should the
+        entry fail to be written (the directory can't be created, or the
+        disk is full, say), a warning is given and the cache is no longer
+        written to for the rest of the run.
+
+        key    -- the key of the thread file (see `key`)
+        result -- a (participants line, missing sender, messages) tuple
+        """
+        if key is None or self.failed:
+            return
+        temp_path = None
+        try:
+            try:
+                os.makedirs(self.directory, 0o700)
+            except OSError:
+                if not os.path.isdir(self.directory):
+                    raise
+            # Written to a temporary file first, so that nobody ever reads a
+            # partially written entry.
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_encode(result))
+            _replace(temp_path, self._path(key))
+        except (IOError, OSError) as e:
+            if temp_path is not None:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+            self.failed = True
+            sys.stderr.write("\rWARNING: Parsed thread files can't be cached in %s (%s), so "
+                             "they won't be.\n" % (self.directory, e))
+
+    def prune(self):
+        """
+        Evicts the least recently used entries until the cache fits within
+        its maximum size.
+        """
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        entries = []
+        for name in names:
+            if not name.endswith(_EXTENSION):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+def _encode(result):
+    participants_line, missing_sender, messages = result
+    senders = {}
+    rows = []
+    for m in messages:
+        timestamp = m.timestamp
+        if timestamp.tzinfo is pytz.utc:
+            offset = None
+        else:
+            offset = int(timestamp.utcoffset().total_seconds())
+        wall_time = timestamp.replace(tzinfo=None) - _EPOCH
+        rows.append((wall_time.days, wall_time.seconds, wall_time.microseconds, offset,
+                     m.seq_num, senders.setdefault(m.sender, len(senders)), m.content))
+    sender_table = sorted(senders, key=senders.get)
+    payload = (participants_line, missing_sender, sender_table, rows)
+    return zlib.compress(pickle.dumps(payload, 2))
+
+
+def _decode(entry):
+    participants_line, missing_sender, sender_table, rows = pickle.loads(zlib.decompress(entry))
+    tz_infos = {None: pytz.utc}
+    messages = []
+    for days, seconds, microseconds, offset, seq_num, sender, content in rows:
+        tz_info = tz_infos.get(offset)
+        if tz_info is None:
+            tz_info = tz_infos[offset] = offset_tzinfo(timedelta(seconds=offset))
+        timestamp = (_EPOCH + timedelta(days, seconds, microseconds)).replace(tzinfo=tz_info)
+        messages.append(ChatMessage(timestamp, sender_table[sender], content, seq_num))
+    return participants_line, missing_sender, messages
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import io
+import itertools
 import re
 import sys
 
@@ -8,12 +10,14 @@ import six
 
 import contextlib
 
-from .writers import BUILTIN_WRITERS, write
-from .parser import parse, MissingReferenceError
+from .writers import BUILTIN_WRITERS, write, write_threads
+from .parser import (parse, iter_threads, resolve_engine, MissingReferenceError,
+                     AUTO_ENGINE, ENGINES)
 from .time import AmbiguousTimeZoneError, UnexpectedTimeFormatError
 from .utils import (set_stream_color, set_all_color, error,
                     reset_terminal_styling)
-from .name_resolver import FacebookNameResolver
+from .cache import ThreadCache
+from .profiling import Profiler, phase, SORT
 from .stats import ChatHistoryStatistics
 
 # Python 3 is supposed to be smart enough to not ever default to the 'ascii'
@@ -68,6 +72,7 @@ def collect_facebook_credentials(ctx, param, value):
         u"Facebook password", type=click.STRING,
         hide_input=True, confirmation_prompt=True)
 
+    from .name_resolver import FacebookNameResolver
     return FacebookNameResolver(email, password)
 
 
@@ -78,6 +83,14 @@ def parse_thread_filters(ctx, param, value):
     return tuple(friend.strip() for friend in thread.split(","))
 
 
+def validate_engine(ctx, param, value):
+    try:
+        resolve_engine(value)
+        return value
+    except ValueError:
+        raise click.BadParameter("%s is not installed" % value)
+
+
 @contextlib.contextmanager
 def colorize_output(nocolor):
 
@@ -94,19 +107,15 @@ class ProcessingFailure(Exception):
     pass
 
 
-def _process_history(path, thread, timezones, utc, noprogress, resolve):
-
+@contextlib.contextmanager
+def processing_errors():
+    """
+    Reports the errors that can come up while processing chat history, and
+    raises `ProcessingFailure` in their place.
+    """
     try:
-        with path as f:
-            fbch = parse(
-                handle=f, thread_filter=thread, timezone_hints=timezones,
-                progress_output=not noprogress, use_utc=utc, name_resolver=resolve)
-        sort_message = u'Sorting messages...'
-        sys.stderr.write(sort_message)
-        fbch.sort()
-        sys.stderr.write('\r%s\r' % (" " * len(sort_message)))
-        return fbch
-
+        yield
+        return
     except AmbiguousTimeZoneError as atze:
         error(u"\nAmbiguous timezone offset found [%s]. Please re-run the "
               u"parser with the -z TZ=OFFSET[,TZ=OFFSET2[,...]] flag."
@@ -136,6 +145,106 @@ def _process_history(path, thread, timezones, utc, noprogress, resolve):
     raise ProcessingFailure()
 
 
+@contextlib.contextmanager
+def profiling_report(path):
+    """
+    Profiles whatever is run within, writing the report as JSON to `path`
+    ('-' for stderr) once done.
+    """
+    if not path:
+        yield
+        return
+    profiler = Profiler()
+    try:
+        with profiler:
+            yield
+    finally:
+        if path == '-':
+            profiler.write_json(sys.stderr)
+        else:
+            with io.open(path, 'w', encoding='utf-8') as f:
+                profiler.write_json(f)
+
+
+def _get_cache(no_cache, cache_dir):
+    if no_cache:
+        return None
+    return ThreadCache(cache_dir)
+
+
+def _process_history(path, thread, timezones, utc, noprogress, resolve, jobs=1,
+                     engine=None, cache=None):
+
+    with processing_errors():
+        with path as f:
+            fbch = parse(
+                handle=f, thread_filter=thread, timezone_hints=timezones,
+                progress_output=not noprogress, use_utc=utc, name_resolver=resolve,
+                workers=jobs, engine=engine, cache=cache)
+        _sort_history(fbch)
+        return fbch
+
+
+def _merge_histories(paths, thread, timezones, utc, noprogress, resolve, jobs=1,
+                     engine=None, cache=None):
+    """
+    Parses each archive in turn, merging it into those parsed before it.
+    """
+    with processing_errors():
+        merged = None
+        for path in paths:
+            with path as f:
+                fbch = parse(
+                    handle=f, thread_filter=thread, timezone_hints=timezones,
+                    progress_output=not noprogress, use_utc=utc, name_resolver=resolve,
+                    workers=jobs, engine=engine, cache=cache)
+            if merged is None:
+                merged = fbch
+            elif fbch.user != merged.user:
+                error(u"\nThe archive \"%s\" belongs to %s rather than %s. Only "
+                      u"downloads of the same account can be merged.\n"
+                      % (path.name, fbch.user, merged.user))
+                raise ProcessingFailure()
+            else:
+                merged.merge(fbch)
+        _sort_history(merged)
+        return merged
+
+
+def _sort_history(fbch):
+    sort_message = u'Sorting messages...'
+    sys.stderr.write(sort_message)
+    with phase(SORT):
+        fbch.sort()
+    sys.stderr.write('\r%s\r' % (" " * len(sort_message)))
+
+
+def _stream_history(fmt, stream_or_dir, path, thread, timezones, utc, noprogress, resolve,
+                    jobs=1, engine=None, cache=None):
+    """
+    Writes out each thread as soon as it has been parsed and sorted.
+    """
+    with processing_errors():
+        with path as f:
+            stream = iter_threads(
+                handle=f, thread_filter=thread, timezone_hints=timezones,
+                progress_output=not noprogress, use_utc=utc, name_resolver=resolve,
+                workers=jobs, engine=engine, cache=cache)
+            threads = (_sorted(t) for t in stream)
+            # The owner of the history is only known once the archive has
+            # been read up to the first thread.
+            first = next(threads, None)
+            if first is not None:
+                threads = itertools.chain([first], threads)
+            write_threads(fmt, stream.user, threads, stream_or_dir)
+
+
+def _sorted(thread):
+    with phase(SORT):
+        thread.messages.sort()
+    return thread
+
+
 @click.group()
 def fbcap():
     """
@@ -143,7 +252,7 @@ def fbcap():
     """
 
 
-def common_options(f):
+def parse_options(f):
     f = click.option('-z', '--timezones', callback=validate_timezones, type=click.STRING,
                      help='Timezone disambiguators (TZ=OFFSET,[TZ=OFFSET[...]])')(f)
     f = click.option('-u', '--utc', is_flag=True,
@@ -154,7 +263,28 @@ def common_options(f):
                      help='Do not show progress output')(f)
     f = click.option('-r', '--resolve', callback=collect_facebook_credentials, is_flag=True,
                      help='[BETA] Resolve profile IDs to names by connecting to Facebook')(f)
-    f = click.argument('path', type=click.File('rt', encoding='utf8'))(f)
+    f = click.option('-j', '--jobs', default=1, type=click.IntRange(min=1),
+                     help='Number of processes to parse thread files with '
+                          '(split archives only / default 1)')(f)
+    f = click.option('-e', '--engine', default=AUTO_ENGINE, callback=validate_engine,
+                     type=click.Choice((AUTO_ENGINE,) + ENGINES),
+                     help='XML engine to parse with (default: etree, falling back to '
+                          'lxml if installed and needed)')(f)
+    f = click.option('--cache-dir', default=None, type=click.Path(file_okay=False),
+                     help='Directory to cache parsed thread files in (split archives '
+                          'only / default: ~/.cache/fbcap)')(f)
+    f = click.option('--no-cache', is_flag=True,
+                     help='Do not cache parsed thread files')(f)
+    f = click.option('--profile', default=None, metavar='PATH',
+                     type=click.Path(dir_okay=False, allow_dash=True),
+                     help='Write a JSON report of where the time went to PATH '
+                          '(- for stderr)')(f)
+    return f
+
+
+def common_options(f):
+    f = parse_options(f)
+    f = click.argument('path', type=click.File('rb'))(f)
     return f
 
 
@@ -170,16 +300,68 @@ def common_options(f):
 @click.option('-d', '--directory', default=None, type=click.Path(),
               help='Write all output as a file per thread into a directory '
                    '(subdirectory will be created)')
+@click.option('-s', '--stream', is_flag=True,
+              help='Write each thread as soon as it is parsed (threads are '
+                   'written in archive order, and continued threads are '
+                   'not merged)')
 @common_options
-def messages(path, thread, fmt, nocolor, timezones, utc, noprogress, resolve, directory):
+def messages(path, thread, fmt, nocolor, timezones, utc, noprogress, resolve, jobs, engine,
+             no_cache, cache_dir, profile, directory, stream):
     """
     Conversion of Facebook chat history.
     """
-    with colorize_output(nocolor):
+    with colorize_output(nocolor), profiling_report(profile):
+        if stream:
+            if directory:
+                # Parsing and writing are interleaved, so this also leaves the
+                # progress output uncolored.
+                set_all_color(enabled=False)
+            try:
+                _stream_history(
+                    fmt=fmt, stream_or_dir=directory or sys.stdout, path=path,
+                    thread=thread, timezones=timezones, utc=utc, noprogress=noprogress,
+                    resolve=resolve, jobs=jobs, engine=engine,
+                    cache=_get_cache(no_cache, cache_dir))
+            except ProcessingFailure:
+                pass
+            return
         try:
             chat_history = _process_history(
                 path=path, thread=thread, timezones=timezones,
-                utc=utc, noprogress=noprogress, resolve=resolve)
+                utc=utc, noprogress=noprogress, resolve=resolve, jobs=jobs,
+                engine=engine, cache=_get_cache(no_cache, cache_dir))
+        except ProcessingFailure:
+            return
+        if directory:
+            set_all_color(enabled=False)
+        write(fmt, chat_history, directory or sys.stdout)
+
+
+@fbcap.command()
+@click.option('-f', '--format', 'fmt', default='text',
+              type=click.Choice(BUILTIN_WRITERS),
+              help='Format to convert to.')
+@click.option('-t', '--thread', callback=parse_thread_filters,
+              default=None, type=click.STRING,
+              help='Only include threads involving exactly the following '
+                   'comma-separated participants in output '
+                   '(-t \'Billy,Steve Smith\')')
+@click.option('-d', '--directory', default=None, type=click.Path(),
+              help='Write all output as a file per thread into a directory '
+                   '(subdirectory will be created)')
+@parse_options
+@click.argument('paths', nargs=-1, required=True, type=click.File('rb'))
+def merge(paths, thread, fmt, nocolor, timezones, utc, noprogress, resolve, jobs, engine,
+          no_cache, cache_dir, profile, directory):
+    """
+    Merging of several downloads of the same Facebook chat history.
+    """
+    with colorize_output(nocolor), profiling_report(profile):
+        try:
+            chat_history = _merge_histories(
+                paths=paths, thread=thread, timezones=timezones,
+                utc=utc, noprogress=noprogress, resolve=resolve, jobs=jobs,
+                engine=engine, cache=_get_cache(no_cache, cache_dir))
         except ProcessingFailure:
             return
         if directory:
@@ -200,13 +382,15 @@ def messages(path, thread, fmt, nocolor, timezones, utc, noprogress, resolve, di
               help='Number threads to include in the output [--fmt text only] ('
                    '-1 for no limit / default 10)')
 @common_options
-def stats(path, fmt, nocolor, timezones, utc, noprogress, most_common, resolve, length):
+def stats(path, fmt, nocolor, timezones, utc, noprogress, most_common, resolve, jobs, engine,
+          no_cache, cache_dir, profile, length):
     """Analysis of Facebook chat history."""
-    with colorize_output(nocolor):
+    with colorize_output(nocolor), profiling_report(profile):
         try:
             chat_history = _process_history(
                 path=path, thread='', timezones=timezones,
-                utc=utc, noprogress=noprogress, resolve=resolve)
+                utc=utc, noprogress=noprogress, resolve=resolve, jobs=jobs,
+                engine=engine, cache=_get_cache(no_cache, cache_dir))
         except ProcessingFailure:
             return
         statistics = ChatHistoryStatistics(
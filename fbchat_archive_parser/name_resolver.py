@@ -3,11 +3,10 @@ from __future__ import unicode_literals
 import json
 import re
 
-from bs4 import BeautifulSoup
-import requests
-from requests.exceptions import RequestException
 import six
 
+from .profiling import timed, NAME_RESOLUTION
+
 _EMAIL_REMOVER = re.compile(r"@facebook.com$")
 _MANUAL_NAME_MATCHER = re.compile(r"<span id=\"fb-timeline-cover-name\">([^<]+)</span>")
 
@@ -27,6 +26,10 @@ class FacebookNameResolver(object):
     def _login(self):
         if self._session:
             return
+        # Only needed by `--resolve`.
+        from bs4 import BeautifulSoup
+        import requests
+        from requests.exceptions import RequestException
         payload = {
             'email': self.username,
             'pass': self.password
@@ -145,6 +148,7 @@ class FacebookNameResolver(object):
         self._cached_profiles[facebook_id] = name
         return name
 
+    @timed(NAME_RESOLUTION)
     def resolve(self, facebook_id_string):
         facebook_id = self._parse_id(facebook_id_string)
         if not facebook_id:
@@ -161,5 +165,6 @@ class DummyNameResolver(FacebookNameResolver):
         super(DummyNameResolver, self).__init__(None, None)
         self._cached_profiles = {}
 
+    @timed(NAME_RESOLUTION)
     def resolve(self, facebook_id_string):
         return facebook_id_string
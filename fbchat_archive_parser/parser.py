@@ -1,20 +1,26 @@
 from __future__ import unicode_literals
 
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 import io
+import itertools
 import os
 import platform
 import re
 import sys
+from timeit import default_timer
 import xml.etree.ElementTree as ET
 from xml.etree.ElementTree import XMLParser
 
 import six
 
-from . import (ChatThread, ChatMessage, FacebookChatHistory)
+from . import (ChatThread, ChatMessage, FacebookChatHistory, SymbolTable, StringInterner,
+               UNKNOWN_USER)
 from .name_resolver import DummyNameResolver
+from .profiling import (Profiler, active as active_profiler, phase, timed, timed_iter,
+                        SNIFF, MANIFEST, PREAMBLE, THREADS, XML)
+from .progress import ProgressReporter
 from .utils import yellow, magenta
-from .time import parse_timestamp
+from .time import parse_timestamp, LocaleDetector
 
 
 class UnsuitableParserError(Exception):
@@ -34,6 +40,15 @@ class SafeXMLStream(object):
     Let's implement our own stream filter to remove the inexplicably present
     control characters for us. We will analyze the incoming byte stream and
     remove any instances of the offending characters.
+
+    Both text and binary streams are accepted. Binary streams are scrubbed
+    directly on their UTF-8 bytes, which saves decoding everything only to
+    have the XML parser encode and decode it all over again.
+
+    Parsers that understand HTML entities themselves don't need the entity
+    declaration below (see `html_entities`). `&nbsp;` is then replaced on the
+    byte stream instead, so that it decodes the same way it does with the
+    declaration.
     """
 
     # The XML parser is super basic and can't understand special HTML-specific
@@ -41,7 +56,23 @@ class SafeXMLStream(object):
     # stream to tell guide the parser on what the token signifies.
     HTML_ENTITY_DEF = b"<!DOCTYPE html [<!ENTITY nbsp ' '>]>"
 
-    def __init__(self, stream):
+    # The UTF-8 encoded forms of the same illegal characters as below, so
+    # that they can be removed without decoding the stream. The single byte
+    # ones are stripped with `bytes.translate`, which is far faster than any
+    # regex. The multibyte ones all start with one of a handful of lead bytes,
+    # which lets the regex engine skip quickly through clean data.
+    CONTROL_BYTES = bytes(bytearray(
+        list(range(0x00, 0x09)) + list(range(0x0B, 0x20)) + [0x7F]))
+    MULTIBYTE_SCRUBBER = re.compile(
+        b'[\xC2\xED\xEF\xF0-\xF4](?:'
+        b'(?<=\xC2)[\x80-\x84\x86-\x9F]'                     # U+0080 - U+009F
+        b'|(?<=\xED)[\xA0-\xBF][\x80-\xBF]'                  # U+D800 - U+DFFF
+        b'|(?<=\xEF)\xB7[\x90-\x9F]'                         # U+FDD0 - U+FDDF
+        b'|(?<=\xEF)\xBF[\xBE\xBF]'                          # U+FFFE - U+FFFF
+        b'|(?<=[\xF0-\xF4])[\x8F\x9F\xAF\xBF]\xBF[\xBE\xBF])'  # U+1FFFE - U+10FFFF
+    )
+
+    def __init__(self, stream, html_entities=False):
 
         # Create a regex for matching all illegal characters within the
         # XML 1.1 spec so that we can filter them out.
@@ -63,7 +94,12 @@ class SafeXMLStream(object):
                           for (low, high) in illegal_unichrs]
         self.scrubber = re.compile('[%s]' % ''.join(illegal_ranges))
         self.stream = stream
-        self.returned_dtd = False
+        self.html_entities = html_entities
+        self.returned_dtd = html_entities
+        # Trailing bytes of a multibyte character cut in half by `read(size)`.
+        self.partial = b''
+        # A trailing entity reference cut in half by `read(size)`.
+        self.partial_entity = b''
 
     def read(self, size=-1):
 
@@ -71,11 +107,162 @@ class SafeXMLStream(object):
             self.returned_dtd = True
             return self.HTML_ENTITY_DEF
 
-        buff = self.stream.read(size)
-        # The XML parser is dumb and seems to only utilize UTF-8
-        # encoders/decoders if we hand it a byte stream. Fortunately, it
-        # doesn't seem to care if it got more or less bytes then it asked for.
-        return re.sub(self.scrubber, '', buff).encode('utf-8')
+        while True:
+            buff = self.stream.read(size)
+            if isinstance(buff, six.text_type):
+                # The XML parser is dumb and seems to only utilize UTF-8
+                # encoders/decoders if we hand it a byte stream. Fortunately, it
+                # doesn't seem to care if it got more or less bytes then it asked for.
+                scrubbed = re.sub(self.scrubber, '', buff).encode('utf-8')
+            else:
+                scrubbed = self._scrub_bytes(buff, size)
+            if self.html_entities:
+                scrubbed = self._replace_nbsp(scrubbed, not buff)
+            # An empty return signals the end of the stream to the parser, so
+            # a chunk consisting of nothing but illegal characters can't be
+            # handed back as is.
+            if scrubbed or not buff:
+                return scrubbed
+
+    def _scrub_bytes(self, buff, size):
+        while True:
+            if not buff:
+                # End of the stream; whatever is left over goes out as is.
+                buff, self.partial = self.partial, b''
+                break
+            if self.partial:
+                buff = self.partial + buff
+            buff, self.partial = _split_partial_utf8(buff)
+            if buff:
+                break
+            # Everything read was a fragment of a single character, so keep
+            # reading until it is complete.
+            buff = self.stream.read(size)
+        buff = buff.translate(None, self.CONTROL_BYTES)
+        if self.MULTIBYTE_SCRUBBER.search(buff) is None:
+            return buff
+        return self.MULTIBYTE_SCRUBBER.sub(b'', buff)
+
+    def _replace_nbsp(self, buff, eof):
+        buff, self.partial_entity = self.partial_entity + buff, b''
+        if not eof:
+            amp = buff.rfind(b'&', -5)
+            if amp != -1 and b';' not in buff[amp:]:
+                buff, self.partial_entity = buff[:amp], buff[amp:]
+        return buff.replace(b'&nbsp;', b' ')
+
+
+def _split_partial_utf8(buff):
+    """
+    Splits off an incomplete UTF-8 sequence from the end of a byte string.
+
+    :param buff: The bytes to split.
+    :return: A tuple of the complete bytes and the incomplete trailing bytes.
+    """
+    tail = bytearray(buff[-3:])
+    for i in range(1, len(tail) + 1):
+        byte = tail[-i]
+        if byte < 0x80:
+            break
+        if byte >= 0xC0:
+            expected = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            if expected > i:
+                return buff[:-i], buff[-i:]
+            break
+    return buff, b''
+
+
+ETREE_ENGINE = 'etree'
+LXML_ENGINE = 'lxml'
+AUTO_ENGINE = 'auto'
+ENGINES = (ETREE_ENGINE, LXML_ENGINE)
+
+# The only elements any of the parsers look at.
+_THREAD_TAGS = ('div', 'span', 'p', 'img')
+_LEGACY_TAGS = _THREAD_TAGS + ('html', 'h1')
+_MANIFEST_TAGS = ('html', 'h1', 'div', 'a')
+
+# lxml is only needed by `--engine lxml` and the fallback to it (see
+# `_lxml_etree`).
+_UNCHECKED = object()
+_lxml_etree_module = _UNCHECKED
+
+
+def _lxml_etree():
+    """
+    :return: The `lxml.etree` module, or `None` if lxml isn't installed.
+    """
+    global _lxml_etree_module
+    if _lxml_etree_module is _UNCHECKED:
+        try:
+            from lxml import etree as _lxml_etree_module
+        except ImportError:
+            _lxml_etree_module = None
+    return _lxml_etree_module
+
+
+def available_engines():
+    """
+    :return: The names of the XML engines usable in this environment,
+             fastest first.
+    """
+    if _lxml_etree() is None:
+        return [ETREE_ENGINE]
+    return [ETREE_ENGINE, LXML_ENGINE]
+
+
+def resolve_engine(engine=None):
+    """
+    Resolves the name of an XML engine, picking the fastest available one
+    if none (or `AUTO_ENGINE`) is given. See `parse` for how the automatic
+    choice falls back to lxml.
+
+    :param engine: The engine name.
+    :return: The engine name.
+    :raises ValueError: If the engine is unknown or not installed.
+    """
+    if engine in (None, AUTO_ENGINE):
+        # ElementTree is always available, and the fastest.
+        return ETREE_ENGINE
+    if engine not in available_engines():
+        raise ValueError("XML engine '%s' is not available" % engine)
+    return engine
+
+
+def iterparse(handle, engine=ETREE_ENGINE, tags=None):
+    """
+    Iterates through the start and end events of an archive HTML file.
+
+    ElementTree is a strict XML parser, so it relies on `SafeXMLStream` to
+    declare the HTML entities it can't do without. lxml is run with its HTML
+    parser in recovery mode instead, and only reports events for `tags`.
+    Even so, ElementTree gets through the flat markup of the archives faster,
+    as its elements are cheaper to hand to Python than lxml's proxies.
+
+    :param handle: The file to parse (text or binary).
+    :param engine: The name of the XML engine to use.
+    :param tags: The tags of the elements of interest. Events for other
+                 elements may or may not be reported.
+    :return: An iterator of (event, element) tuples.
+    """
+    if engine == LXML_ENGINE:
+        events = _lxml_etree().iterparse(
+            SafeXMLStream(handle, html_entities=True), events=("start", "end"),
+            tag=tags, html=True, recover=True, encoding='utf-8', huge_tree=True)
+    else:
+        # Cast to str to ensure not unicode under Python 2, as the parser
+        # doesn't like that.
+        parser = XMLParser(encoding=str('UTF-8'))
+        events = ET.iterparse(SafeXMLStream(handle), events=("start", "end"), parser=parser)
+    return timed_iter(XML, events)
+
+
+def _warn_missing_sender():
+    sys.stderr.write(
+        "\rWARNING: The sender was missing in one or more parsed messages. "
+        "This is an error on Facebook's end that unfortunately cannot be "
+        "recovered from. Some or all messages in the output may show the "
+        "sender as 'Unknown' within each thread.\n")
 
 
 def _truncate(string, length=60):
@@ -85,18 +272,24 @@ def _truncate(string, length=60):
 
 
 def _tag_and_class_attr(element):
-    if element.attrib:
-        class_attr = element.attrib.get('class', [])
-    else:
-        class_attr = element.get('class', [])
     tag = element.tag if element.tag else element.name
-    return tag, class_attr
+    return tag, element.get('class', [])
 
 
 class ChatThreadParser(object):
+    """
+    Parses the messages of a single thread out of an XML element iterator.
+
+    Elements are released from the tree as soon as they have been consumed.
+    Once a direct child of the thread element (a `div.message` or its `<p>`)
+    has ended, everything collected under the thread so far is dropped. The
+    element tree held at any point is therefore bounded by the size of a
+    single message, no matter how long the thread is.
+    """
 
     def __init__(self, element_iter, timezone_hints=None, use_utc=True, name_resolver=None,
-                 no_sender_warning_status=True, seq_num=0):
+                 no_sender_warning_status=True, seq_num=0, thread_element=None,
+                 locale_detector=None, symbols=None, interner=None):
 
         self.name_resolver = name_resolver or DummyNameResolver()
 
@@ -112,18 +305,32 @@ class ChatThreadParser(object):
         self.no_sender_warning_status = no_sender_warning_status
         self.messages = []
         self.messages_started = False
+        self.missing_sender = False
+        # The `div.thread` element, if it has already been consumed from
+        # the iterator by the caller.
+        self.thread_element = thread_element
+        self.locale_detector = locale_detector
+        # Passed on to the thread (see `ChatThread`).
+        self.symbols = symbols
+        # Interns the senders and short content, if given.
+        self.interner = interner
 
     def parse(self, participants):
         self.messages = []
         self.current_sender = None
         self.current_timestamp = None
 
+        handlers = _THREAD_EVENT_HANDLERS
         for pos, element in self.element_iter:
-            finished = self._process_element(pos, element)
-            if finished:
+            key = (pos, element.tag, element.get('class'))
+            try:
+                handler = handlers[key]
+            except KeyError:
+                handler = handlers[key] = _thread_event_handler(*key)
+            if handler is not None and handler(self, element):
                 break
 
-        thread = ChatThread(participants)
+        thread = ChatThread(participants, self.symbols)
         for m in self.messages:
             thread.add_message(m)
         return self.no_sender_warning_status, thread
@@ -132,81 +339,166 @@ class ChatThreadParser(object):
         """
         Eats through the input iterator without recording the content.
         """
+        handlers = _THREAD_EVENT_HANDLERS
         for pos, element in self.element_iter:
-            tag, class_attr = _tag_and_class_attr(element)
-            if tag == "div" and "thread" in class_attr and pos == "end":
+            key = (pos, element.tag, element.get('class'))
+            try:
+                handler = handlers[key]
+            except KeyError:
+                handler = handlers[key] = _thread_event_handler(*key)
+            if handler is _END_THREAD:
                 break
+            elif handler is _START_THREAD:
+                self.thread_element = element
+            elif pos == "end":
+                self._release(element)
 
-    def _process_element(self, pos, e):
+    def _release(self, element):
         """
-        Parses an incoming HTML element/node for data.
+        Drops all children of the thread element once its most recent child
+        has been fully consumed.
 
-        pos -- the part of the element being parsed
-               (start/end)
-        e   -- the element being parsed
+        element -- the element that just ended
         """
-        tag, class_attr = _tag_and_class_attr(e)
+        if self.thread_element is None:
+            return
+        # The length of an lxml element is found by counting its children,
+        # so the last child is looked up directly instead.
+        try:
+            last_child = self.thread_element[-1]
+        except IndexError:
+            return
+        if last_child is element:
+            del self.thread_element[:]
 
-        start_of_message = tag == 'div' and class_attr == 'message' and pos == 'start'
-        end_of_thread = tag == 'div' and 'thread' in class_attr and pos == 'end'
+    # The event handlers below are looked up by `_thread_event_handler`.
+    # They return `True` once the end of the thread has been reached.
 
-        if start_of_message and not self.messages_started:
-            self.messages_started = True
-        elif tag == "span" and pos == "end":
-            if "user" in class_attr:
-                self.current_sender = self.name_resolver.resolve(e.text)
-            elif "meta" in class_attr:
-                self.current_timestamp =\
-                    parse_timestamp(e.text, self.use_utc, self.timezone_hints)
-        elif tag == 'p' and pos == 'end':
-            # This is only necessary because of accidental double <p> nesting on
-            # Facebook's end. Clearly, QA and testing is one of Facebook's strengths ;)
-            if not self.current_text:
-                self.current_text = e.text.strip() if e.text else ''
-        elif tag == 'img' and pos == 'start':
-            self.current_text = '(image reference: {})'.format(e.attrib['src'])
-        elif (start_of_message or end_of_thread) and self.messages_started:
-            if not self.current_timestamp:
-                # This is the typical error when the new Facebook format is
-                # used with the legacy parser.
-                raise UnsuitableParserError
-            if not self.current_sender:
-                if not self.no_sender_warning_status:
-                    sys.stderr.write(
-                        "\rWARNING: The sender was missing in one or more parsed messages. "
-                        "This is an error on Facebook's end that unfortunately cannot be "
-                        "recovered from. Some or all messages in the output may show the "
-                        "sender as 'Unknown' within each thread.\n")
-                    self.no_sender_warning_status = True
-                self.current_sender = "Unknown"
+    def _start_thread(self, e):
+        self.thread_element = e
 
-            cm = ChatMessage(timestamp=self.current_timestamp,
-                             sender=self.current_sender,
-                             content=self.current_text or '',
-                             seq_num=self.seq_num)
-            self.messages += [cm]
+    def _end_thread(self, e):
+        if self.messages_started:
+            self._record_message()
+        return True
 
-            self.seq_num -= 1
-            self.current_sender, self.current_timestamp, self.current_text = None, None, None
+    def _start_message(self, e):
+        if self.messages_started:
+            self._record_message()
+        else:
+            self.messages_started = True
 
-        return end_of_thread
+    def _end_sender(self, e):
+        self.current_sender = self.name_resolver.resolve(e.text)
+        if self.interner is not None:
+            self.current_sender = self.interner.intern(self.current_sender)
+        self._release(e)
+
+    def _end_timestamp(self, e):
+        self.current_timestamp = parse_timestamp(e.text, self.use_utc, self.timezone_hints,
+                                                 self.locale_detector)
+        self._release(e)
+
+    def _end_text(self, e):
+        # This is only necessary because of accidental double <p> nesting on
+        # Facebook's end. Clearly, QA and testing is one of Facebook's strengths ;)
+        if not self.current_text:
+            self.current_text = e.text.strip() if e.text else ''
+        self._release(e)
+
+    def _end_image(self, e):
+        self.current_text = '(image reference: {})'.format(e.attrib['src'])
+        self._release(e)
+
+    def _record_message(self):
+        if not self.current_timestamp:
+            # This is the typical error when the new Facebook format is
+            # used with the legacy parser.
+            raise UnsuitableParserError
+        if not self.current_sender:
+            if not self.no_sender_warning_status:
+                _warn_missing_sender()
+                self.no_sender_warning_status = True
+            self.missing_sender = True
+            self.current_sender = "Unknown"
+
+        content = self.current_text or ''
+        # Content kept column by column is copied anyway.
+        if self.interner is not None and self.symbols is None:
+            content = self.interner.intern_content(content)
+        cm = ChatMessage(timestamp=self.current_timestamp,
+                         sender=self.current_sender,
+                         content=content,
+                         seq_num=self.seq_num)
+        self.messages += [cm]
+
+        self.seq_num -= 1
+        self.current_sender, self.current_timestamp, self.current_text = None, None, None
+
+
+# The `ChatThreadParser` handler of each (event, tag, class attribute) that
+# has come along so far, filled in by `_thread_event_handler`. Threads are
+# made up of the same few kinds of elements over and over again, so after
+# the first message every event is a single lookup.
+_THREAD_EVENT_HANDLERS = {}
+
+# Handlers are kept as plain functions, as unbound methods of Python 2 are
+# created anew on every lookup and so can't be compared by identity.
+_unbound = six.get_unbound_function
+_START_THREAD = _unbound(ChatThreadParser._start_thread)
+_END_THREAD = _unbound(ChatThreadParser._end_thread)
+
+
+def _thread_event_handler(pos, tag, class_attr):
+    """
+    Determines how `ChatThreadParser` handles an event.
+
+    :param pos: The event (start/end).
+    :param tag: The tag of the element.
+    :param class_attr: The class attribute of the element (if any).
+    :return: The `ChatThreadParser` method to call with the element, or
+             `None` if the event can be ignored.
+    """
+    class_attr = class_attr or ''
+    if tag == 'div' and 'thread' in class_attr:
+        return _START_THREAD if pos == 'start' else _END_THREAD
+    if pos == 'start':
+        # Aside from the thread itself, the start of a message is the only
+        # start of an element that matters.
+        if tag == 'div' and class_attr == 'message':
+            return _unbound(ChatThreadParser._start_message)
+        return None
+    if tag == 'span':
+        if 'user' in class_attr:
+            return _unbound(ChatThreadParser._end_sender)
+        if 'meta' in class_attr:
+            return _unbound(ChatThreadParser._end_timestamp)
+    elif tag == 'p':
+        return _unbound(ChatThreadParser._end_text)
+    elif tag == 'img':
+        return _unbound(ChatThreadParser._end_image)
+    return _unbound(ChatThreadParser._release)
 
 
 class MessageHtmlParser(object):
 
     def __init__(self, handle, timezone_hints=None, use_utc=True,
-                 progress_output=False, thread_filter=None, name_resolver=None):
+                 progress_output=False, thread_filter=None, name_resolver=None,
+                 workers=1, engine=None, max_pending=None, cache=None, columnar=False,
+                 interner=None):
 
         self.name_resolver = name_resolver or DummyNameResolver()
 
         self.chat_threads = dict()
+        # The number of messages produced so far per set of participants.
+        self.thread_lengths = dict()
         self.message_cache = None
         self.user = None
 
-        self.last_line_len = 0
-
-        self.handle = SafeXMLStream(handle)
+        self.handle = handle
+        self.engine = resolve_engine(engine)
         self.progress_output = progress_output
+        self.progress = ProgressReporter() if progress_output else None
         self.thread_filter = (
             tuple(p.lower() for p in thread_filter) if thread_filter else None)
         self.seq_num = 0
@@ -214,6 +506,26 @@ class MessageHtmlParser(object):
         self.timezone_hints = timezone_hints or {}
         self.use_utc = use_utc
         self.no_sender_warning = False
+        self.workers = workers
+        # The most thread files to have parsed by workers ahead of the
+        # consumer of the threads (no limit if `None`).
+        self.max_pending = max_pending
+        self.cache = cache
+        # Locks in the timestamp format of the archive (see `locale`).
+        self.locale_detector = LocaleDetector()
+        # The senders of the threads, if their messages are kept column by
+        # column.
+        self.symbols = SymbolTable() if columnar else None
+        # Shared by all the messages of the history (see `StringInterner`).
+        self.interner = interner if interner is not None else StringInterner()
+
+    @property
+    def locale(self):
+        """
+        :return: The locale of the timestamps parsed so far (e.g. "en_us"),
+                 or `None` if still undetermined.
+        """
+        return self.locale_detector.locale
 
     def should_record_thread(self, participants):
         """
@@ -255,9 +567,43 @@ class MessageHtmlParser(object):
         return len(matched) == len(participants)
 
     def parse(self):
-        self.parse_impl()
+        for thread in self.iter_threads():
+            self.save_thread(thread)
+        return FacebookChatHistory(self.user, self.chat_threads, self.locale, self.symbols,
+                                   self.interner)
+
+    def iter_threads(self):
+        """
+        Parses the threads one at a time, without holding on to them.
+
+        Duplicate threads are left out, but a thread that is continued
+        in several places of the archive is produced once for each part.
+
+        :return: An iterator of `ChatThread` objects.
+        """
+        for thread in self.parse_impl():
+
+            if thread is None:
+                continue
+
+            signature = thread.signature
+
+            if signature in self.thread_signatures:
+                # FIXME: Suppressed until use of a logging library is
+                #        implemented
+                # error("Duplicate thread detected: %s\n "
+                #        % str(self.current_thread.participants))
+                continue
+
+            self.thread_signatures.add(signature)
+            participants = ", ".join(thread.participants)
+            self.thread_lengths[participants] = \
+                self.thread_lengths.get(participants, 0) + len(thread)
+            if self.progress is not None:
+                self.progress.update(messages=len(thread))
+            yield thread
+
         self._clear_output()
-        return FacebookChatHistory(self.user, self.chat_threads)
 
     def parse_impl(self):
         #
@@ -267,12 +613,11 @@ class MessageHtmlParser(object):
         #  2. Parse the user.
         #  3. Facilitate the parsing of a thread by identifying
         #     participants and providing an element iterator.
-        #  4. Save the thread.
-        #  5. Return the history object.
+        #  4. Yield the thread.
         #
         raise NotImplementedError
 
-    def parse_thread(self, participants, element_iter, require_flush):
+    def parse_thread(self, participants, element_iter, require_flush, thread_element=None):
         """
         Parses a thread with appropriate CLI feedback.
 
@@ -280,63 +625,62 @@ class MessageHtmlParser(object):
         :param element_iter: The XML iterator to parse the data from.
         :param require_flush: Whether the iterator needs to be flushed if it is
                               determined that the thread should be skipped.
+        :param thread_element: The `div.thread` element, if its start has
+                               already been consumed from `element_iter`.
         :return: A `ChatThread` object if not skipped, otherwise `None`.
         """
+        skip_thread = self.announce_thread(participants)
+
+        parser = ChatThreadParser(
+            element_iter, self.timezone_hints, self.use_utc, self.name_resolver,
+            self.no_sender_warning, self.seq_num, thread_element, self.locale_detector,
+            self.symbols, self.interner)
+
+        if skip_thread:
+            if require_flush:
+                parser.skip()
+        else:
+            with phase(THREADS, ", ".join(participants)):
+                self.no_sender_warning, thread = parser.parse(participants)
+            return thread
+
+    def announce_thread(self, participants):
+        """
+        Decides whether a thread should be skipped and reports the decision
+        as CLI feedback.
+
+        :param participants: The participants in this thread.
+        :return: `True` if the thread should be skipped, otherwise `False`.
+        """
 
         # Very rarely threads may lack information on who the
         # participants are. We will consider those threads corrupted
         # and skip them.
-        participants_text = _truncate(', '.join(participants), 60)
+        skip_thread = not participants or not self.should_record_thread(participants)
+        if self.progress is None:
+            return skip_thread
         if participants:
-            skip_thread = not self.should_record_thread(participants)
-            participants_text = yellow("[%s]" % participants_text)
+            participants_text = yellow("[%s]" % _truncate(', '.join(participants), 60))
         else:
             participants_text = "unknown participants"
-            skip_thread = True
         if skip_thread:
-            line = "\rSkipping chat thread with %s..." % \
+            line = "Skipping chat thread with %s..." % \
                    yellow(participants_text)
         else:
             participants_key = ", ".join(participants)
-            if participants_key in self.chat_threads:
-                thread_current_len = len(self.chat_threads[participants_key])
-                line = "\rContinuing chat thread with %s %s..." \
+            if participants_key in self.thread_lengths:
+                thread_current_len = self.thread_lengths[participants_key]
+                line = "Continuing chat thread with %s %s..." \
                        % (yellow(participants_text), magenta("<@%d messages>" % thread_current_len))
             else:
-                line = "\rDiscovered chat thread with %s..." \
+                line = "Discovered chat thread with %s..." \
                        % yellow(participants_text)
-        if self.progress_output:
-            sys.stderr.write(line.ljust(self.last_line_len))
-            sys.stderr.flush()
-        self.last_line_len = len(line)
-
-        parser = ChatThreadParser(
-            element_iter, self.timezone_hints, self.use_utc, self.name_resolver,
-            self.no_sender_warning, self.seq_num)
-
-        if skip_thread:
-            if require_flush:
-                parser.skip()
-        else:
-            self.no_sender_warning, thread = parser.parse(participants)
-            return thread
+        self.progress.update(status=line)
+        return skip_thread
 
     def save_thread(self, thread):
 
-        if thread is None:
-            return
-
-        signature = thread.signature
-
-        if signature in self.thread_signatures:
-            # FIXME: Suppressed until use of a logging library is
-            #        implemented
-            # error("Duplicate thread detected: %s\n "
-            #        % str(self.current_thread.participants))
-            return
-
         participants = ", ".join(thread.participants)
-        self.thread_signatures.add(signature)
 
         if participants not in self.chat_threads:
             self.chat_threads[participants] = thread
@@ -346,15 +690,17 @@ class MessageHtmlParser(object):
                 existing_thread.add_message(m)
 
     def parse_participants(self, participants):
-        if len(participants) == 0:
-            return ()
         if not isinstance(participants, six.string_types):
+            # Elements are checked by text rather than by length, as the
+            # length of an element is its number of children.
             if not participants.text:
                 return ()
             if participants.attrib:
                 participants = participants.text.strip()
             else:
                 participants = participants.contents[0].strip()
+        if len(participants) == 0:
+            return ()
         participants = [self.name_resolver.resolve(p)
                         for p in participants.split(", ")]
         participants.sort()
@@ -367,16 +713,136 @@ class MessageHtmlParser(object):
         Clears progress output (if any) that was written to the screen.
         """
         # If progress output was being written, clear it from the screen.
-        if self.progress_output:
-            sys.stderr.write("\r".ljust(self.last_line_len))
-            sys.stderr.write("\r")
-            sys.stderr.flush()
+        if self.progress is not None:
+            self.progress.finish()
 
 
 def using_windows():
     return 'windows' in platform.platform().lower()
 
 
+class ThreadSkippingStream(object):
+    """
+    Drops the threads of a legacy archive that are of no interest before
+    they ever reach the XML parser.
+
+    Threads are found by their opening tag, and the participants that
+    precede the first message are handed to `skip_thread` to decide on.
+    The bytes of a skipped thread are then discarded by counting the `div`
+    tags in each chunk read up to its closing tag, which is far faster than
+    tokenizing them. Message content is escaped in the archive, so it can't
+    be mistaken for a tag.
+
+    Each `read` returns at most the data up to the next thread, so that the
+    XML parser has processed everything before a thread (the owner of the
+    archive in particular) by the time it's decided on.
+    """
+
+    THREAD_TAG = b'<div class="thread">'
+    CHUNK_SIZE = 64 * 1024
+    # Enough to complete a tag that a read cut in half.
+    _TAIL_SIZE = len(THREAD_TAG) - 1
+
+    def __init__(self, stream, skip_thread):
+        """
+        :param stream: The archive (text or binary).
+        :param skip_thread: Called with the participants text of each thread,
+                            returning whether the thread is to be dropped.
+        """
+        self.stream = stream
+        self.skip_thread = skip_thread
+        self.buffer = b''
+        # Where to look for the next thread in the buffer.
+        self.scan_from = 0
+        self.eof = False
+
+    def read(self, size=-1):
+        while True:
+            start = self.buffer.find(self.THREAD_TAG, self.scan_from)
+            if start > 0:
+                # Everything before the thread goes out first.
+                return self._take(start if size < 0 else min(start, size))
+            if start == 0:
+                end = self.buffer.find(b'<', len(self.THREAD_TAG))
+                if end == -1 and not self.eof:
+                    self._fill()
+                    continue
+                participants = self.buffer[len(self.THREAD_TAG):end if end != -1 else None]
+                participants = participants.decode('utf-8', 'replace')
+                if self.skip_thread(_unescape(participants).strip()):
+                    self._drop_thread()
+                else:
+                    self.scan_from = len(self.THREAD_TAG)
+                continue
+            if self.eof:
+                return self._take(len(self.buffer) if size < 0 else size)
+            safe = len(self.buffer) - self._TAIL_SIZE
+            if safe > 0 and (size < 0 or safe >= size):
+                return self._take(safe if size < 0 else size)
+            self._fill()
+
+    def _take(self, size):
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        self.scan_from = max(0, self.scan_from - size)
+        return data
+
+    def _fill(self):
+        chunk = self.stream.read(self.CHUNK_SIZE)
+        if isinstance(chunk, six.text_type):
+            chunk = chunk.encode('utf-8')
+        if chunk:
+            self.buffer += chunk
+        else:
+            self.eof = True
+
+    def _drop_thread(self):
+        """
+        Discards the thread at the start of the buffer up to its closing tag.
+        """
+        depth = 0
+        # Past the opening tag of the thread itself.
+        search_from = 1
+        while True:
+            next_thread = self.buffer.find(self.THREAD_TAG, search_from)
+            search_from = 0
+            if next_thread != -1:
+                limit = next_thread
+            elif self.eof:
+                limit = len(self.buffer)
+            else:
+                # Stop short of a tag that may have been cut in half.
+                limit = max(self.buffer.rfind(b'<'), 0)
+            region = self.buffer[:limit]
+            opened = depth + region.count(b'<div') - region.count(b'</div>')
+            if opened > 0 and next_thread == -1 and not self.eof:
+                # Still inside the thread, so none of this is needed.
+                depth = opened
+                self.buffer = self.buffer[limit:]
+                self._fill()
+                continue
+            if opened == 0 and next_thread != -1:
+                # Nothing but whitespace separates threads, so the thread
+                # ends with the last closing tag before the next one.
+                end = self.buffer.rfind(b'</div>', 0, limit) + len(b'</div>')
+                self.buffer = self.buffer[end:]
+                self.scan_from = 0
+                return
+            # The thread closes within the region; find out where exactly.
+            for match in _DIV_TAG.finditer(self.buffer, 0, limit):
+                depth += 1 if match.group() == b'<div' else -1
+                if depth == 0:
+                    self.buffer = self.buffer[match.end():]
+                    self.scan_from = 0
+                    return
+            # Unterminated at the end of the archive.
+            self.buffer = self.buffer[limit:]
+            self.scan_from = 0
+            return
+
+
+_DIV_TAG = re.compile(br'<div|</div>')
+
+
 class LegacyMessageHtmlParser(MessageHtmlParser):
     """
     A parser for the original archive format Facebook used until October 2017.
@@ -387,21 +853,108 @@ class LegacyMessageHtmlParser(MessageHtmlParser):
         Parses the HTML content as a stream. This is far less memory
         intensive than loading the entire HTML file into memory, like
         BeautifulSoup does.
+
+        Each thread is removed from the tree once it has been parsed (see
+        `ChatThreadParser` for how messages are released within a thread).
+        Aside from the parsed messages themselves, memory use is bounded by
+        the largest single message plus the parser's read buffer.
         """
 
-        # Cast to str to ensure not unicode under Python 2, as the parser
-        # doesn't like that.
-        parser = XMLParser(encoding=str('UTF-8'))
-        element_iter = ET.iterparse(self.handle, events=("start", "end"), parser=parser)
+        if self.progress is not None:
+            size = _handle_size(self.handle)
+            # The position of a text handle is an opaque number.
+            binary = 'b' in getattr(self.handle, 'mode', '')
+            self.progress.set_totals(
+                total_bytes=size, position=self.handle.tell if size and binary else None)
+
+        handle = self.handle
+        if self.thread_filter:
+            handle = ThreadSkippingStream(handle, self._skips_thread)
+        element_iter = iterparse(handle, self.engine, _LEGACY_TAGS)
+        # The currently open elements outside of any thread. ElementTree has
+        # no parent pointers, so this is the only way to find the element
+        # a finished thread needs to be removed from.
+        open_elements = []
         for pos, element in element_iter:
             tag, class_attr = _tag_and_class_attr(element)
-            if tag == "h1" and pos == "end":
+            if tag == "div" and "thread" in class_attr and pos == "start":
+                # The participants are the text leading up to the first
+                # message, which is only sure to have been parsed once the
+                # next event has come along.
+                lookahead = next(element_iter, None)
+                participants = self.parse_participants(element)
+                thread_iter = itertools.chain([lookahead], element_iter) \
+                    if lookahead else element_iter
+                yield self.parse_thread(participants, thread_iter, True, element)
+                # lxml elements do know their parent, which isn't necessarily
+                # on the stack when events are filtered by tag.
+                parent = element.getparent() if hasattr(element, 'getparent') \
+                    else open_elements[-1] if open_elements else None
+                if parent is not None:
+                    parent.remove(element)
+                continue
+            if pos == "start":
+                if tag == "html" and element.get('lang'):
+                    self.locale_detector.prefer(element.get('lang'))
+                open_elements.append(element)
+                continue
+            open_elements.pop()
+            if tag == "h1":
                 if not self.user:
                     self.user = element.text.strip()
-            elif tag == "div" and "thread" in class_attr and pos == "start":
-                participants = self.parse_participants(element)
-                thread = self.parse_thread(participants, element_iter, True)
-                self.save_thread(thread)
+
+    def _skips_thread(self, participants):
+        """
+        Decides whether to drop a thread before it is parsed, based on the
+        participants text it starts with.
+        """
+        if self.user is None:
+            # The owner still has to be left out of the participants, so
+            # the thread is left to be skipped while it is parsed.
+            return False
+        participants = self.parse_participants(participants)
+        if participants and self.should_record_thread(participants):
+            return False
+        return self.announce_thread(participants)
+
+
+# How much of a thread file to look at for the participants line.
+_PREAMBLE_SIZE = 5000
+_PARTICIPANTS_LINE = re.compile(br'</h3>Participants: ([^<]+)<div')
+# How many thread files, and how much of each, to sample timestamps from
+# (see `SplitMessageHtmlParser._detect_locale`).
+_LOCALE_SAMPLE_FILES = 3
+_LOCALE_SAMPLE_SIZE = 16 * 1024
+_TIMESTAMP = re.compile(br'<span class="meta">([^<]+)</span>')
+
+if six.PY2:
+    from HTMLParser import HTMLParser
+    _unescape = HTMLParser().unescape
+else:
+    from html import unescape as _unescape
+
+
+@timed(PREAMBLE)
+def _read_participants_line(thread_file):
+    """
+    Reads the participants line from the preamble of a thread file, leaving
+    the file rewound to the start. The preamble is well within the file's
+    read buffer, so the rewind costs nothing.
+
+    :return: The un-escaped participants text, or `None` if there is none.
+    """
+    m = _PARTICIPANTS_LINE.search(thread_file.read(_PREAMBLE_SIZE))
+    thread_file.seek(0)
+    if m:
+        return _unescape(m.group(1).decode('utf-8'))
+
+
+def _read_participants_line_of(file_path):
+    try:
+        with io.open(file_path, 'rb') as thread_file:
+            return _read_participants_line(thread_file)
+    except FileNotFoundError:
+        raise MissingReferenceError(file_path)
 
 
 class SplitMessageHtmlParser(MessageHtmlParser):
@@ -409,6 +962,10 @@ class SplitMessageHtmlParser(MessageHtmlParser):
     A parser for the archive format Facebook started using around October 2017.
     """
 
+    # Whether the participants have to be read from the thread files rather
+    # than taken from the manifest.
+    PARTICIPANTS_IN_THREAD_FILES = False
+
     def __init__(self, handle, *args, **kwargs):
         super(SplitMessageHtmlParser, self).__init__(handle, *args, **kwargs)
         self.root = os.path.realpath(handle.name)
@@ -418,11 +975,10 @@ class SplitMessageHtmlParser(MessageHtmlParser):
     def parse_impl(self):
 
         self.user, thread_references = self._get_manifest_data()
+        self._detect_locale(thread_references)
+        return self.process_threads(thread_references)
 
-        for participants, thread_path in thread_references:
-            self.process_thread(participants, thread_path)
-        self._clear_output()
-
+    @timed(MANIFEST)
     def _get_manifest_data(self):
 
         user, thread_references = None, []
@@ -430,18 +986,20 @@ class SplitMessageHtmlParser(MessageHtmlParser):
         ignore_anchors = True
         saw_anchor = False
 
-        # Cast to str to ensure not unicode under Python 2, as the parser
-        # doesn't like that.
-        parser = XMLParser(encoding=str('UTF-8'))
-        element_iter = ET.iterparse(self.handle, events=("start", "end"), parser=parser)
+        element_iter = iterparse(self.handle, self.engine, _MANIFEST_TAGS)
         for pos, element in element_iter:
             tag, class_attr = _tag_and_class_attr(element)
-            if tag == "h1" and pos == "end":
+            if tag == "html" and pos == "start":
+                if element.get('lang'):
+                    self.locale_detector.prefer(element.get('lang'))
+            elif tag == "h1" and pos == "end":
                 if not self.user:
                     user = element.text.strip()
             elif tag == "div" and "content" in class_attr and pos == "start":
                 ignore_anchors = False
-            elif tag == "a" and pos == "start":
+            elif tag == "a" and pos == "end":
+                # The participants are read at the end of the anchor, when
+                # its text is sure to have been parsed.
                 if ignore_anchors:
                     continue
                 saw_anchor = True
@@ -457,19 +1015,246 @@ class SplitMessageHtmlParser(MessageHtmlParser):
 
         return user, thread_references
 
+    def _detect_locale(self, thread_references):
+        """
+        Locks in the timestamp format from the first timestamps of the first
+        few thread files, so that every thread file is parsed with it right
+        away (by worker processes too).
+        """
+        detector = self.locale_detector
+        timestamps = []
+        for _, path in thread_references[:_LOCALE_SAMPLE_FILES]:
+            try:
+                with io.open(path, 'rb') as thread_file:
+                    head = thread_file.read(_LOCALE_SAMPLE_SIZE)
+            except (IOError, OSError):
+                continue
+            timestamps += [_unescape(t.decode('utf-8', 'replace'))
+                           for t in _TIMESTAMP.findall(head)]
+            if len(timestamps) >= detector.sample_size:
+                break
+        detector.sample(timestamps[:detector.sample_size])
+        if timestamps and self.workers > 1:
+            # Sets up whatever parsing timestamps takes (such as the table
+            # of timezone abbreviations) for worker processes to inherit.
+            parse_timestamp(timestamps[0], self.use_utc, self.timezone_hints, detector)
+
+    def process_threads(self, thread_references):
+        """
+        Parses the referenced threads, spreading the thread files over a pool
+        of worker processes if more than one worker was requested.
+
+        :param thread_references: (participants, thread path) tuples in
+                                  manifest order.
+        :return: An iterator of the threads in manifest order (`None` for
+                 skipped threads).
+        """
+        sizes = [_file_size(path) for _, path in thread_references]
+        if self.progress is not None:
+            self.progress.set_totals(total_bytes=sum(sizes),
+                                     total_files=len(thread_references))
+
+        if self.workers < 2 or len(thread_references) < 2:
+            threads = (self.process_thread(participants, thread_path)
+                       for participants, thread_path in thread_references)
+        else:
+            threads = self._process_threads_in_pool(thread_references, sizes)
+        for i, thread in enumerate(threads):
+            if self.progress is not None:
+                self.progress.update(bytes_done=sizes[i], files_done=1)
+            yield thread
+        if self.cache is not None:
+            self.cache.prune()
+
+    def _process_threads_in_pool(self, thread_references, sizes):
+
+        import multiprocessing
+        pool = multiprocessing.Pool(min(self.workers, len(thread_references)))
+        try:
+            resolved = None
+            if self.PARTICIPANTS_IN_THREAD_FILES and self.thread_filter:
+                # Reading the participants of every thread file up front costs
+                # next to nothing compared to parsing the unwanted ones.
+                resolved = [self.thread_participants(participants,
+                                                     _read_participants_line_of(path))
+                            for participants, path in thread_references]
+            # Only the threads that will be kept go to the pool, if that can
+            # be known up front.
+            if resolved is not None:
+                wanted = [i for i, participants in enumerate(resolved)
+                          if participants and self.should_record_thread(participants)]
+            elif self.PARTICIPANTS_IN_THREAD_FILES:
+                wanted = list(range(len(thread_references)))
+            else:
+                wanted = [i for i, (participants, _) in enumerate(thread_references)
+                          if participants and self.should_record_thread(participants)]
+            max_pending = self.max_pending
+            if max_pending is None:
+                # The largest files are scheduled first so that no worker is
+                # left chewing on a big file while the others sit idle at the
+                # end.
+                wanted.sort(key=lambda i: -sizes[i])
+                max_pending = len(wanted)
+            # Otherwise files are scheduled in manifest order, a few at a time,
+            # so that only so many parsed threads wait to be consumed.
+            pending = iter(wanted)
+            results = {}
+            cache_keys = {}
+            # Workers record the thread files they parse with profilers of
+            # their own, which are added up here.
+            profiler = active_profiler()
+            parse_thread_file = _parse_thread_file if profiler is None \
+                else _parse_thread_file_profiled
+
+            def submit(count):
+                while count > 0:
+                    i = next(pending, None)
+                    if i is None:
+                        return
+                    cache_keys[i] = self._cache_key(thread_references[i][1])
+                    if self.cache is not None and cache_keys[i] in self.cache:
+                        continue
+                    results[i] = pool.apply_async(
+                        parse_thread_file,
+                        (thread_references[i][1], self.timezone_hints, self.use_utc,
+                         self.seq_num, self.PARTICIPANTS_IN_THREAD_FILES, self.engine,
+                         self.locale_detector))
+                    count -= 1
+
+            def collect(i):
+                if i in results:
+                    result = results.pop(i).get()
+                    submit(1)
+                    if profiler is not None:
+                        result, state = result
+                        profiler.absorb(state)
+                    if cache_keys[i] is not None:
+                        self.cache.put(cache_keys[i], result)
+                    return result
+                # In the cache, unless it went missing in the meantime.
+                with phase(THREADS, thread_references[i][1]):
+                    result = self.cache.get(cache_keys[i])
+                    if result is None:
+                        result = _parse_thread_file(
+                            thread_references[i][1], self.timezone_hints, self.use_utc,
+                            self.seq_num, self.PARTICIPANTS_IN_THREAD_FILES, self.engine,
+                            self.locale_detector)
+                return result
+
+            submit(max_pending)
+
+            # Threads are produced in manifest order, which keeps continued
+            # threads and duplicate detection identical to parsing serially.
+            for i, (participants, _) in enumerate(thread_references):
+                if resolved is not None:
+                    if self.announce_thread(resolved[i]):
+                        yield None
+                        continue
+                    _, missing_sender, messages = collect(i)
+                    participants = resolved[i]
+                elif self.PARTICIPANTS_IN_THREAD_FILES:
+                    participants_line, missing_sender, messages = collect(i)
+                    participants = self.thread_participants(participants, participants_line)
+                    if self.announce_thread(participants):
+                        yield None
+                        continue
+                else:
+                    if self.announce_thread(participants):
+                        yield None
+                        continue
+                    _, missing_sender, messages = collect(i)
+                yield self._build_thread(participants, messages, missing_sender)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _cache_key(self, file_path):
+        if self.cache is None:
+            return None
+        return self.cache.key(file_path, self.timezone_hints, self.use_utc)
+
+    def _build_thread(self, participants, messages, missing_sender):
+        """
+        Assembles a thread from messages parsed out of a thread file (by a
+        worker process or not).
+        """
+        if missing_sender and not self.no_sender_warning:
+            _warn_missing_sender()
+            self.no_sender_warning = True
+        # Thread files are parsed with a dummy resolver, as a real one can't
+        # be shared between processes (or cached). The names are resolved
+        # here instead.
+        resolve = None
+        if not isinstance(self.name_resolver, DummyNameResolver):
+            resolve = self.name_resolver.resolve
+        # Neither are their strings interned, as they come from another
+        # process (or the cache). Content kept column by column is copied
+        # anyway, so only the senders are interned then.
+        intern = self.interner.intern
+        intern_content = self.interner.intern_content if self.symbols is None else None
+        thread = ChatThread(participants, self.symbols)
+        for m in messages:
+            sender = intern(m.sender if resolve is None else resolve(m.sender))
+            content = m.content if intern_content is None else intern_content(m.content)
+            thread.add_message(ChatMessage(m.timestamp, sender, content, m.seq_num))
+        return thread
+
     def process_thread(self, participants, thread_path):
 
         file_path = os.path.join(self.root, thread_path)
 
+        if not self.PARTICIPANTS_IN_THREAD_FILES:
+            # The manifest says all there is to know about the participants,
+            # so skipped thread files aren't even opened.
+            if self.announce_thread(participants):
+                return None
+            return self._load_thread(participants, file_path)
+
         try:
-            with io.open(file_path, 'rt', encoding='utf8') as thread_file:
-                parser = XMLParser(encoding=str('UTF-8'))
-                element_iter = ET.iterparse(
-                    SafeXMLStream(thread_file), events=("start", "end"), parser=parser)
-                thread = self.parse_thread(participants, element_iter, False)
+            with io.open(file_path, 'rb') as thread_file:
+                participants_line = _read_participants_line(thread_file)
+                participants = self.thread_participants(participants, participants_line)
+                if self.announce_thread(participants):
+                    return None
+                return self._load_thread(participants, file_path, thread_file,
+                                         participants_line)
         except FileNotFoundError:
             raise MissingReferenceError(file_path)
-        self.save_thread(thread)
+
+    def _load_thread(self, participants, file_path, thread_file=None, participants_line=None):
+        """
+        Gets the messages of a thread file that is to be kept out of the
+        cache, or parses them (from `thread_file` if already open).
+        """
+        with phase(THREADS, file_path):
+            cache_key = self._cache_key(file_path)
+            cached = self.cache.get(cache_key) if cache_key is not None else None
+
+            if cached is not None:
+                _, missing_sender, messages = cached
+            else:
+                if thread_file is None:
+                    _, missing_sender, messages = _parse_thread_file(
+                        file_path, self.timezone_hints, self.use_utc, self.seq_num, False,
+                        self.engine, self.locale_detector)
+                else:
+                    missing_sender, messages = _parse_thread_messages(
+                        thread_file, self.timezone_hints, self.use_utc, self.seq_num,
+                        self.engine, self.locale_detector)
+                if cache_key is not None:
+                    self.cache.put(cache_key, (participants_line, missing_sender, messages))
+
+            return self._build_thread(participants, messages, missing_sender)
+
+    def thread_participants(self, participants, participants_line):
+        """
+        Determines the participants of a thread.
+
+        :param participants: The participants according to the manifest.
+        :param participants_line: The participants line of the thread file.
+        :return: The participants of the thread.
+        """
+        return participants
 
 
 class SplitMessageHtmlWithImagesParser(SplitMessageHtmlParser):
@@ -477,59 +1262,320 @@ class SplitMessageHtmlWithImagesParser(SplitMessageHtmlParser):
     A parser for the archive format Facebook started using around January 2018.
     """
 
-    _PARTICIPANT_PARSER = re.compile(r'</h3>Participants: ([^<]+)<div')
+    # Trying to correlate the manifest to anything is janky as hell and more or less
+    # a lost cause at this point. Facebook made the participant information lossy
+    # in the manifest, so we have to get it from the thread files. To maintain backwards
+    # compatibility (and honestly sanity...), let's just dredge the lossless
+    # participant data directly from the message HTML files with regex and then parse them.
+    PARTICIPANTS_IN_THREAD_FILES = True
 
-    def parse_impl(self):
+    def __init__(self, handle, *args, **kwargs):
+        super(SplitMessageHtmlWithImagesParser, self).__init__(handle, *args, **kwargs)
+        self.unknown_user_count = 0
 
-        # Trying to correlate the manifest to anything is janky as hell and more or less
-        # a lost cause at this point. Facebook made the participant information lossy
-        # in the manifest, so we have to get it from the thread files. To maintain backwards
-        # compatibility (and honestly sanity...), let's just dredge the lossless
-        # participant data directly from the message HTML files with regex and then parse them.
+    def thread_participants(self, participants, participants_line):
 
-        self.user, thread_references = self._get_manifest_data()
+        if participants_line is not None:
+            participants = self.parse_participants(participants_line)
+        else:
+            # Sometimes threads will appear without participants. These appear to be
+            # users who have deleted themselves or blocked you. Not sure why this
+            # occurs. We will throw them in with the "Facebook User"s and deal with
+            # it downstream.
+            if participants:
+                raise UnsuitableParserError
+            participants = ('Facebook User',)
+
+        # Under certain circumstances, conversation history for disabled users, or
+        # users who have blocked you, will be saved under the name "Facebook User".
+        # We should artificially differentiate these threads so all the messages don't
+        # get lumped into a single chat thread.
+        if participants == ('Facebook User',):
+            participants = (UNKNOWN_USER.format(self.unknown_user_count),)
+            self.unknown_user_count += 1
+        return participants
+
+
+def _handle_size(handle):
+    try:
+        return os.fstat(handle.fileno()).st_size
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
 
-        unknown_user_count = 0
-
-        for participants, thread_path in thread_references:
-            with io.open(thread_path, 'rt', encoding='utf8') as f:
-                # Let's just read enough for the preamble (~5,000 characters
-                # is probably sufficient.
-                m = self._PARTICIPANT_PARSER.search(f.read(5000))
-                if m:
-                    # Un-escape any HTML entities.
-                    import bs4
-                    unescaped = six.text_type(bs4.BeautifulSoup(m.group(1), 'html.parser'))
-                    participants = self.parse_participants(unescaped)
-                else:
-                    # Sometimes threads will appear without participants. These appear to be
-                    # users who have deleted themselves or blocked you. Not sure why this
-                    # occurs. We will throw them in with the "Facebook User"s and deal with
-                    # it downstream.
-                    if participants:
-                        raise UnsuitableParserError
-                    participants = ('Facebook User',)
-
-                # Under certain circumstances, conversation history for disabled users, or
-                # users who have blocked you, will be saved under the name "Facebook User".
-                # We should artificially differentiate these threads so all the messages don't
-                # get lumped into a single chat thread.
-                if participants == ('Facebook User',):
-                    participants = ('Unknown user #{:03d}'.format(unknown_user_count),)
-                    unknown_user_count += 1
-                self.process_thread(participants, thread_path)
+
+def _parse_thread_messages(thread_file, timezone_hints, use_utc, seq_num, engine,
+                           locale_detector=None):
+    thread_parser = ChatThreadParser(
+        iterparse(thread_file, engine, _THREAD_TAGS), timezone_hints, use_utc,
+        seq_num=seq_num, locale_detector=locale_detector)
+    _, thread = thread_parser.parse(())
+    return thread_parser.missing_sender, thread.messages
+
+
+def _parse_thread_file(file_path, timezone_hints, use_utc, seq_num, read_participants,
+                       engine=ETREE_ENGINE, locale_detector=None):
+    """
+    Parses the messages out of a single thread file. This runs in worker
+    processes, so it only takes and returns picklable values. A worker gets
+    a copy of `locale_detector` with the timestamp format locked in so far.
+
+    :return: A tuple of the participants line (if `read_participants` is
+             set), whether any message was missing its sender and the
+             parsed messages.
+    """
+    participants_line = None
+    try:
+        with io.open(file_path, 'rb') as thread_file:
+            if read_participants:
+                participants_line = _read_participants_line(thread_file)
+            missing_sender, messages = _parse_thread_messages(
+                thread_file, timezone_hints, use_utc, seq_num, engine, locale_detector)
+    except FileNotFoundError:
+        raise MissingReferenceError(file_path)
+    return participants_line, missing_sender, messages
+
+
+def _parse_thread_file_profiled(file_path, *args):
+    """
+    Parses a thread file (see `_parse_thread_file`) in a worker process,
+    recording where the time went.
+
+    :return: A tuple of the result and the `Profiler.state` of the profiler
+             it was recorded with.
+    """
+    with Profiler() as profiler:
+        with profiler.phase(THREADS, file_path):
+            result = _parse_thread_file(file_path, *args)
+    return result, profiler.state()
+
+
+LEGACY_FORMAT = 'legacy'
+SPLIT_FORMAT = 'split'
+SPLIT_WITH_IMAGES_FORMAT = 'split-with-images'
+
+_FORMAT_PARSERS = {
+    LEGACY_FORMAT: LegacyMessageHtmlParser,
+    SPLIT_FORMAT: SplitMessageHtmlParser,
+    SPLIT_WITH_IMAGES_FORMAT: SplitMessageHtmlWithImagesParser,
+}
+
+# How much of `messages.htm` to look at when sniffing its format. The first
+# thread or thread reference comes right after the navigation header.
+_SNIFF_SIZE = 64 * 1024
+# How many referenced thread files to look at before giving up.
+_SNIFF_MAX_THREADS = 3
+
+_LEGACY_THREAD = re.compile(br'<div class="thread">')
+_THREAD_REFERENCE = re.compile(br'<a href="\.\./(messages/[^"]+)">([^<]*)</a>')
+
+
+class ArchiveFormat(namedtuple('ArchiveFormat', ['name', 'parser', 'bytes_read', 'seconds'])):
+    """
+    The result of sniffing an archive's format.
+
+    name       -- one of the *_FORMAT constants (`None` if undetermined)
+    parser     -- the parser class for the format (`None` if undetermined)
+    bytes_read -- how many bytes were read to decide
+    seconds    -- how long it took to decide
+    """
+
+
+def sniff_format(handle):
+    """
+    Determines the format of an archive from the start of its `messages.htm`
+    and, for split archives, the preamble of the thread files it references.
+    The handle is rewound afterwards.
+
+    :param handle: The `messages.htm` file (text or binary).
+    :return: An `ArchiveFormat`.
+    """
+    start = default_timer()
+    prefix = handle.read(_SNIFF_SIZE)
+    handle.seek(0)
+    if isinstance(prefix, six.text_type):
+        prefix = prefix.encode('utf-8')
+    bytes_read = len(prefix)
+
+    name = None
+    if _LEGACY_THREAD.search(prefix):
+        name = LEGACY_FORMAT
+    elif getattr(handle, 'name', None):
+        root = os.path.dirname(os.path.dirname(os.path.realpath(handle.name)))
+        references = _THREAD_REFERENCE.findall(prefix)[:_SNIFF_MAX_THREADS]
+        for thread_path, participants in references:
+            thread_path = os.path.join(root, *thread_path.decode('utf-8').split('/'))
+            try:
+                with io.open(thread_path, 'rb') as thread_file:
+                    preamble = thread_file.read(_PREAMBLE_SIZE)
+            except (IOError, OSError):
+                continue
+            bytes_read += len(preamble)
+            if _PARTICIPANTS_LINE.search(preamble):
+                name = SPLIT_WITH_IMAGES_FORMAT
+                break
+            elif participants.strip():
+                # Only the images format leaves the participants out of the
+                # thread file, and then only for deleted users (who also have
+                # none in the manifest).
+                name = SPLIT_FORMAT
+                break
+
+    return ArchiveFormat(name, _FORMAT_PARSERS.get(name), bytes_read,
+                         default_timer() - start)
 
 
 def parse(handle, *args, **kwargs):
+    """
+    Parses a Facebook chat archive of any of the supported formats.
+
+    :param handle: The `messages.htm` file, preferably opened in binary mode.
+    :param timezone_hints: Timezone name to (hours, minutes) offset mappings
+                           for disambiguating timestamps.
+    :param use_utc: Whether to convert all timestamps to UTC.
+    :param progress_output: Whether to report progress on stderr.
+    :param thread_filter: Only include threads with these participants.
+    :param name_resolver: Used to resolve profile IDs into names.
+    :param workers: The number of processes to parse thread files with
+                    (split archives only).
+    :param engine: The name of the XML engine to parse with. By default,
+                   ElementTree is used and, should it reject the markup of
+                   the archive, lxml is tried (if installed).
+    :param cache: A `ThreadCache` to keep the parsed thread files of split
+                  archives in.
+    :param archive_format: The `ArchiveFormat` of the archive, if already
+                           known from `sniff_format`.
+    :param columnar: Whether to keep the messages of each thread column by
+                     column (see `MessageColumns`), which takes a fraction
+                     of the memory of a `ChatMessage` each.
+    :param interner: The `StringInterner` to share the senders (and,
+                     if it interns content, short content) of messages
+                     with. By default, a new one that interns senders only.
+    :return: A `FacebookChatHistory` object.
+    """
+    return _run_parser(handle, args, kwargs, lambda parser: parser.parse())
+
+
+class ThreadStream(object):
+    """
+    An iterator of the threads of an archive as they are parsed (see
+    `iter_threads`).
+
+    user   -- the owner of the chat history, known once the first thread
+              has been produced
+    locale -- the locale of the timestamps of the archive (see
+              `MessageHtmlParser.locale`)
+    """
+
+    def __init__(self, handle, args, kwargs):
+        self.parser = None
+        self.threads = self._iter_threads(handle, args, kwargs)
+
+    @property
+    def user(self):
+        return self.parser.user if self.parser else None
+
+    @property
+    def locale(self):
+        return self.parser.locale if self.parser else None
+
+    def _start(self, parser):
+        self.parser = parser
+        threads = parser.iter_threads()
+        # Parsers only turn out to be unsuitable once they get going, so the
+        # first thread is parsed right away to leave room to fall back.
+        return next(threads, None), threads
+
+    def _iter_threads(self, handle, args, kwargs):
+        first, threads = _run_parser(handle, args, kwargs, self._start)
+        if first is None:
+            return
+        yield first
+        for thread in threads:
+            yield thread
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.threads)
+
+    next = __next__
+
+
+def iter_threads(handle, *args, **kwargs):
+    """
+    Parses a Facebook chat archive one thread at a time, without ever
+    holding more than the thread being parsed in memory.
+
+    Takes the same arguments as `parse`. Unlike with `parse`, threads
+    continued in several places of the archive aren't merged, and the
+    messages of each thread are left in the order of the archive. Falling
+    back to another parser (or engine) is only possible until the first
+    thread has been produced.
+
+    :return: A `ThreadStream` of `ChatThread` objects.
+    """
+    # Parsed threads are consumed one at a time, so workers needn't get
+    # too far ahead.
+    kwargs.setdefault('max_pending', 2 * kwargs.get('workers', 1))
+    return ThreadStream(handle, args, kwargs)
+
+
+def iter_messages(handle, *args, **kwargs):
+    """
+    Parses a Facebook chat archive one message at a time (see
+    `iter_threads`).
+
+    :return: An iterator of (participants, `ChatMessage`) tuples.
+    """
+    for thread in iter_threads(handle, *args, **kwargs):
+        participants = tuple(thread.participants)
+        for message in thread.messages:
+            yield participants, message
+
+
+def _run_parser(handle, args, kwargs, run):
+    """
+    Runs the parser suited to an archive, falling back to the others (and
+    to lxml) as necessary.
+
+    :param run: Called with the parser to get the result from it.
+    :return: The result of `run`.
+    """
+    archive_format = kwargs.pop('archive_format', None)
+    if archive_format is None:
+        with phase(SNIFF):
+            archive_format = sniff_format(handle)
+    engine = kwargs.pop('engine', None)
 
     # We support every archive format since Facebook invented the
-    # 'Download your Data' feature. We successively back-peddle
-    # until we find a parser that works.
-    for parser in (SplitMessageHtmlWithImagesParser,
-                   SplitMessageHtmlParser,
-                   LegacyMessageHtmlParser):
+    # 'Download your Data' feature. The sniffed format is tried first.
+    # Should it be undetermined or turn out to be wrong, we successively
+    # back-peddle through the rest until we find a parser that works.
+    parsers = [SplitMessageHtmlWithImagesParser,
+               SplitMessageHtmlParser,
+               LegacyMessageHtmlParser]
+    if archive_format.parser:
+        parsers.remove(archive_format.parser)
+        parsers.insert(0, archive_format.parser)
+    for parser in parsers:
         try:
-            return parser(handle, *args, **kwargs).parse()
+            try:
+                return run(parser(handle, *args, engine=engine, **kwargs))
+            except ET.ParseError:
+                if engine not in (None, AUTO_ENGINE) or _lxml_etree() is None:
+                    raise
+                # ElementTree only understands well-formed XML, whereas lxml's
+                # HTML parser recovers from whatever else Facebook produced.
+                handle.seek(0)
+                return run(parser(handle, *args, engine=LXML_ENGINE, **kwargs))
         except UnsuitableParserError:
             # Rewind for the next parser.
             handle.seek(0)
@@ -0,0 +1,243 @@
+from __future__ import unicode_literals
+
+import functools
+import heapq
+import json
+from timeit import default_timer
+
+# The phases parsing is broken down into. Phases nest: the time spent on a
+# thread includes that of tokenizing its XML, parsing its timestamps and
+# resolving its names, and so on.
+SNIFF = 'sniff'
+MANIFEST = 'manifest'
+PREAMBLE = 'preamble'
+THREADS = 'threads'
+XML = 'xml'
+PARSE_TIMESTAMP = 'parse_timestamp'
+NAME_RESOLUTION = 'name_resolution'
+SORT = 'sort'
+WRITER = 'writer'
+
+# The profiler that phases are currently recorded with, if any.
+_active = None
+
+
+def active():
+    """
+    :return: The `Profiler` currently recording, or `None`.
+    """
+    return _active
+
+
+class Profiler(object):
+    """
+    Records where the time goes while an archive is parsed and written.
+
+    Phases are only recorded while the profiler is in use as a context
+    manager. Otherwise, every hook comes down to checking whether there is
+    an active profiler, so they can stay in place for good.
+
+        profiler = Profiler()
+        with profiler:
+            history = parse(handle)
+        print(profiler.report())
+
+    Each phase has its cumulative time (with and without that of the phases
+    nested within it) and number of calls, along with the slowest subjects
+    (threads or thread files) it was recorded for. Thread files parsed by
+    worker processes are recorded by the workers and added up here, so the
+    time of those phases can exceed the time that actually went by.
+
+    clock   -- the time source, in seconds
+    slowest -- how many of the slowest subjects to keep per phase
+    """
+
+    def __init__(self, clock=default_timer, slowest=10):
+        self.clock = clock
+        self.slowest = slowest
+        # Phase name -> [seconds, self seconds, calls]
+        self.phases = {}
+        # Phase name -> heap of the slowest (seconds, subject) tuples.
+        self.subjects = {}
+        self.seconds = 0.0
+        self._started = None
+        self._previous = None
+        # The open phases, as [name, subject, start, seconds of children].
+        self._stack = []
+
+    def __enter__(self):
+        global _active
+        self._previous, _active = _active, self
+        self._started = self.clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        self.seconds += self.clock() - self._started
+        self._started = None
+        _active, self._previous = self._previous, None
+
+    def start(self, name, subject=None):
+        """
+        Opens a phase, which has to be closed with `stop`.
+
+        :param name: The name of the phase.
+        :param subject: What the phase is being run for (e.g. a file path).
+        """
+        self._stack.append([name, subject, self.clock(), 0.0])
+
+    def stop(self):
+        """
+        Closes the most recently opened phase.
+        """
+        name, subject, start, children = self._stack.pop()
+        seconds = self.clock() - start
+        if self._stack:
+            self._stack[-1][3] += seconds
+        self._add(name, seconds, seconds - children, 1)
+        if subject is not None:
+            self._add_subject(name, seconds, subject)
+
+    def phase(self, name, subject=None):
+        """
+        :return: A context manager recording a phase.
+        """
+        return _Phase(self, name, subject)
+
+    def _add(self, name, seconds, self_seconds, calls):
+        totals = self.phases.get(name)
+        if totals is None:
+            totals = self.phases[name] = [0.0, 0.0, 0]
+        totals[0] += seconds
+        totals[1] += self_seconds
+        totals[2] += calls
+
+    def _add_subject(self, name, seconds, subject):
+        heap = self.subjects.setdefault(name, [])
+        if len(heap) < self.slowest:
+            heapq.heappush(heap, (seconds, subject))
+        else:
+            heapq.heappushpop(heap, (seconds, subject))
+
+    def state(self):
+        """
+        :return: What has been recorded, as plain values (see `absorb`).
+        """
+        return self.phases, self.subjects
+
+    def absorb(self, state):
+        """
+        Adds up what another profiler recorded, such as one run by a worker
+        process.
+
+        :param state: The `state` of the other profiler.
+        """
+        phases, subjects = state
+        for name, (seconds, self_seconds, calls) in phases.items():
+            self._add(name, seconds, self_seconds, calls)
+        for name, heap in subjects.items():
+            for seconds, subject in heap:
+                self._add_subject(name, seconds, subject)
+
+    def report(self):
+        """
+        :return: A dictionary of what has been recorded, such as:
+
+            {"seconds": 1.5,
+             "phases": {"threads": {"seconds": 1.2, "self_seconds": 0.1,
+                                    "calls": 40, "slowest": [...]}, ...}}
+        """
+        seconds = self.seconds
+        if self._started is not None:
+            seconds += self.clock() - self._started
+        phases = {}
+        for name, (total, self_seconds, calls) in self.phases.items():
+            phases[name] = {
+                'seconds': round(total, 6),
+                'self_seconds': round(self_seconds, 6),
+                'calls': calls,
+            }
+            if name in self.subjects:
+                phases[name]['slowest'] = [
+                    {'subject': subject, 'seconds': round(s, 6)}
+                    for s, subject in sorted(self.subjects[name], reverse=True)]
+        return {'seconds': round(seconds, 6), 'phases': phases}
+
+    def write_json(self, stream, pretty=True):
+        stream.write(json.dumps(self.report(), indent=2 if pretty else None,
+                                sort_keys=True) + '\n')
+
+
+class _Phase(object):
+
+    __slots__ = ('profiler', 'name', 'subject')
+
+    def __init__(self, profiler, name, subject):
+        self.profiler = profiler
+        self.name = name
+        self.subject = subject
+
+    def __enter__(self):
+        if self.profiler is not None:
+            self.profiler.start(self.name, self.subject)
+
+    def __exit__(self, *exc_info):
+        if self.profiler is not None:
+            self.profiler.stop()
+
+
+def phase(name, subject=None):
+    """
+    Records a phase with the active profiler (if any):
+
+        with phase(SORT):
+            history.sort()
+
+    :param name: The name of the phase.
+    :param subject: What the phase is being run for (e.g. a file path).
+    :return: A context manager.
+    """
+    return _Phase(_active, name, subject)
+
+
+def timed(name):
+    """
+    A decorator recording every call of a function as a phase with the
+    active profiler (if any).
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _active
+            if profiler is None:
+                return func(*args, **kwargs)
+            profiler.start(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.stop()
+        return wrapper
+    return decorate
+
+
+def timed_iter(name, iterable):
+    """
+    Records getting each item of an iterator as a phase with the profiler
+    active right now. Without one, the iterator is returned as is.
+    """
+    profiler = _active
+    if profiler is None:
+        return iterable
+    return _timed_iter(profiler, name, iter(iterable))
+
+
+def _timed_iter(profiler, name, iterator):
+    while True:
+        profiler.start(name)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            profiler.stop()
+        yield item
@@ -0,0 +1,173 @@
+from __future__ import unicode_literals, division
+
+import json
+import sys
+import time
+
+
+class ProgressReporter(object):
+    """
+    Reports the progress of parsing an archive on a stream (stderr by
+    default), redrawing no more than a few times a second however many
+    threads go by.
+
+    On a terminal, a single status line is kept up to date with the share
+    of the archive parsed so far, the throughput and the time remaining.
+    Anywhere else, the same figures are written as one JSON object per
+    line instead, such as:
+
+        {"event": "progress", "elapsed": 1.5, "bytes": 1048576, ...}
+
+    The amount of work done is measured in bytes when the total is known
+    (the size of a legacy archive, or of all the thread files of a split
+    one), and in files otherwise.
+    """
+
+    def __init__(self, stream=None, max_redraws=10, machine_readable=None, clock=time.time):
+        """
+        :param stream: Where to report progress (default: stderr).
+        :param max_redraws: The most times to report progress per second.
+        :param machine_readable: Whether to write JSON events rather than a
+                                 status line (default: unless the stream is a
+                                 terminal).
+        :param clock: The time source, in seconds.
+        """
+        self.stream = stream or sys.stderr
+        if machine_readable is None:
+            isatty = getattr(self.stream, 'isatty', None)
+            machine_readable = not (isatty and isatty())
+        self.machine_readable = machine_readable
+        self.interval = 1.0 / max_redraws
+        self.clock = clock
+
+        self.start_time = clock()
+        self.last_draw = None
+        self.last_line_len = 0
+
+        self.total_bytes = None
+        self.total_files = None
+        self.position = None
+        self.bytes_done = 0
+        self.files_done = 0
+        self.messages = 0
+        self.status = ''
+
+    def set_totals(self, total_bytes=None, total_files=None, position=None):
+        """
+        Declares how much work there is to do.
+
+        :param total_bytes: The number of bytes to parse.
+        :param total_files: The number of files to parse.
+        :param position: Returns the number of bytes parsed so far, for when
+                         they are read through a single handle. Only called
+                         when progress is about to be reported.
+        """
+        self.total_bytes = total_bytes
+        self.total_files = total_files
+        self.position = position
+
+    def update(self, status=None, bytes_done=0, files_done=0, messages=0):
+        """
+        Records progress, reporting it if it has been long enough since the
+        last report.
+
+        :param status: What is being done now (for the status line).
+        :param bytes_done: The number of bytes parsed since the last update.
+        :param files_done: The number of files parsed since the last update.
+        :param messages: The number of messages parsed since the last update.
+        """
+        if status is not None:
+            self.status = status
+        self.bytes_done += bytes_done
+        self.files_done += files_done
+        self.messages += messages
+        now = self.clock()
+        if self.last_draw is None or now - self.last_draw >= self.interval:
+            self.last_draw = now
+            self._draw(now)
+
+    def finish(self):
+        """
+        Reports the final figures (as JSON) or clears the status line.
+        """
+        if self.machine_readable:
+            self._write_event('done', self.clock())
+        else:
+            self.stream.write("\r".ljust(self.last_line_len + 1))
+            self.stream.write("\r")
+            self.stream.flush()
+            self.last_line_len = 0
+
+    def snapshot(self, now=None):
+        """
+        :return: A dictionary of the progress made so far.
+        """
+        now = self.clock() if now is None else now
+        elapsed = max(now - self.start_time, 1e-9)
+        bytes_done = self._bytes_done()
+        figures = {
+            'elapsed': round(elapsed, 3),
+            'bytes': bytes_done,
+            'total_bytes': self.total_bytes,
+            'files': self.files_done,
+            'total_files': self.total_files,
+            'messages': self.messages,
+            'bytes_per_second': round(bytes_done / elapsed, 1),
+            'messages_per_second': round(self.messages / elapsed, 1),
+            'fraction': None,
+            'eta': None,
+        }
+        if self.total_bytes:
+            done, total = bytes_done, self.total_bytes
+        else:
+            done, total = self.files_done, self.total_files
+        if total:
+            figures['fraction'] = round(min(done / total, 1.0), 4)
+            if done:
+                figures['eta'] = round(max(total - done, 0) * elapsed / done, 1)
+        return figures
+
+    def _bytes_done(self):
+        if self.position is None:
+            return self.bytes_done
+        try:
+            return self.position()
+        except (AttributeError, IOError, OSError, ValueError):
+            # The handle can't tell where it is.
+            self.position = None
+            return self.bytes_done
+
+    def _draw(self, now):
+        if self.machine_readable:
+            self._write_event('progress', now)
+            return
+        line = "\r%s %s" % (_format_figures(self.snapshot(now)), self.status)
+        self.stream.write(line.ljust(self.last_line_len))
+        self.stream.flush()
+        self.last_line_len = len(line)
+
+    def _write_event(self, event, now):
+        figures = self.snapshot(now)
+        figures['event'] = event
+        self.stream.write(json.dumps(figures, sort_keys=True) + "\n")
+        self.stream.flush()
+
+
+def _format_figures(figures):
+    parts = []
+    if figures['fraction'] is not None:
+        parts.append("%3d%%" % (figures['fraction'] * 100))
+    if figures['bytes']:
+        parts.append("%.1f MB/s" % (figures['bytes_per_second'] / 1e6))
+    parts.append("%d msgs/s" % figures['messages_per_second'])
+    if figures['eta'] is not None:
+        parts.append("ETA %s" % _format_duration(figures['eta']))
+    return "[%s]" % " | ".join(parts)
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return "%d:%02d:%02d" % (hours, minutes, seconds)
+    return "%d:%02d" % (minutes, seconds)
@@ -4,7 +4,6 @@ from collections import defaultdict, Counter
 
 import json
 import re
-import yaml
 
 import six
 
@@ -212,6 +211,7 @@ class ChatHistoryStatistics(object):
         stream.write('\n')
 
     def write_yaml(self, stream):
+        import yaml
         data = yaml.safe_dump(
             self.compute_stats(), default_flow_style=False, allow_unicode=True)
         if six.PY2:
@@ -2,7 +2,11 @@
 
 from __future__ import unicode_literals
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 from datetime import datetime, tzinfo, time, timedelta as dt_timedelta
 import re
 
@@ -10,8 +14,7 @@ import pytz
 from pytz.exceptions import NonExistentTimeError, AmbiguousTimeError
 from pytz import timezone as pytz_timezone
 
-import arrow
-from babel import Locale
+from .profiling import timed, PARSE_TIMESTAMP
 
 _MIN_VALID_TIMEZONE_OFFSET = dt_timedelta(hours=-12)
 _MAX_VALID_TIMEZONE_OFFSET = dt_timedelta(hours=14)
@@ -73,10 +76,29 @@ FACEBOOK_TIMESTAMP_FORMATS = [
 ]
 
 
+# The tokens of the timestamp formats, as understood by arrow.
+_FORMAT_TOKENS = re.compile(r'\[[^\]]*\]|dddd|MMMM|YYYY|HH|mm|[HhAD]|\s+|.')
+
+
+def _literal_pattern(text):
+    # Question marks make the preceding letter optional (e.g. "a las?").
+    pattern = r'\s+'.join(re.escape(word) for word in text.split())
+    return pattern.replace(re.escape('?'), '?')
+
+
+def _alternation(names):
+    # Longest first, so that no name is cut short by another it starts with.
+    return '|'.join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+
+
 class LocalizedDateParser(object):
     """
     Maps the day and month names back to numeric values for a provided locale code and performs
     parsing.
+
+    Each format is compiled into a regular expression with a lookup table of month names, which
+    `match` parses with directly. arrow is only resorted to by `parse` for whatever that doesn't
+    match.
     """
 
     def __init__(self, locale_id, timestamp_format, hints=None):
@@ -85,6 +107,8 @@ class LocalizedDateParser(object):
         self.original_timestamp_format = timestamp_format
         self.timestamp_format = timestamp_format.replace('dddd', 'd').replace('MMMM', 'M')
 
+        # Only needed once timestamps are parsed (not by `--help`).
+        from babel import Locale
         locale = Locale(locale_id.split('_')[0])
         self.translation_map = {k: str(v) for k, v in hints.items()} if hints else {}
         # Add in the month and day name data.
@@ -95,10 +119,75 @@ class LocalizedDateParser(object):
                 self.translation_map[attr_name.lower()] = str(i + offset)
         self.matcher = re.compile('|'.join(self.translation_map.keys()))
 
+        # Names are matched regardless of case, in both their inflected and
+        # stand-alone forms. The hints don't tell months from days, so they
+        # go in with both.
+        self.month_numbers = {k.lower(): v for k, v in hints.items()} if hints else {}
+        day_names = set(self.month_numbers)
+        for context in ('format', 'stand-alone'):
+            for i, name in locale.months[context]['wide'].items():
+                self.month_numbers[name.lower()] = i
+            day_names.update(name.lower() for name in locale.days[context]['wide'].values())
+        self.pattern = self._compile(timestamp_format, self.month_numbers, day_names)
+
+    @staticmethod
+    def _compile(timestamp_format, month_names=None, day_names=None):
+        """
+        Compiles a format into a regular expression. Without the names of
+        the months and days, any text stands in for them, which makes for
+        the shape of the timestamps of the format.
+        """
+        parts = []
+        for token in _FORMAT_TOKENS.findall(timestamp_format):
+            if token.startswith('['):
+                parts.append(_literal_pattern(token[1:-1]))
+            elif token == 'dddd':
+                parts.append('(?:%s)' % (_alternation(day_names) if day_names else '.+?'))
+            elif token == 'MMMM':
+                parts.append('(?P<month>%s)'
+                             % (_alternation(month_names) if month_names else '.+?'))
+            elif token == 'YYYY':
+                parts.append(r'(?P<year>\d{4})')
+            elif token == 'D':
+                parts.append(r'(?P<day>\d{1,2})')
+            elif token in ('HH', 'H', 'h'):
+                parts.append(r'(?P<hour>\d{1,2})')
+            elif token == 'mm':
+                parts.append(r'(?P<minute>\d{2})')
+            elif token == 'A':
+                parts.append(r'\s*(?P<meridiem>[ap])\.?m\.?')
+            elif token.isspace():
+                parts.append(r'\s+')
+            else:
+                parts.append(re.escape(token))
+        # Whole words only, so that "1:54pm" is not taken for 24-hour time.
+        return re.compile(r'(?<!\w)%s(?!\w)' % ''.join(parts), re.IGNORECASE | re.UNICODE)
+
+    def match(self, timestamp):
+        """
+        Parses a timestamp with the compiled format alone.
+
+        :return: A naive `datetime`, or `None` if the timestamp doesn't match.
+        """
+        m = self.pattern.search(timestamp)
+        if m is None:
+            return None
+        hour = int(m.group('hour'))
+        if self.pattern.groupindex.get('meridiem') and m.group('meridiem'):
+            hour %= 12
+            if m.group('meridiem').lower() == 'p':
+                hour += 12
+        try:
+            return datetime(int(m.group('year')), self.month_numbers[m.group('month').lower()],
+                            int(m.group('day')), hour, int(m.group('minute')))
+        except (KeyError, ValueError):
+            return None
+
     def _translate(self, timestamp):
         return self.matcher.sub(lambda match: self.translation_map[match.group(0)], timestamp)
 
     def _parse_fallback(self, timestamp):
+        import arrow
         try:
             return arrow.get(timestamp,
                              self.original_timestamp_format,
@@ -107,6 +196,7 @@ class LocalizedDateParser(object):
             return None
 
     def parse(self, timestamp):
+        import arrow
         if self.use_fallback:
             return self._parse_fallback(timestamp)
         else:
@@ -122,41 +212,124 @@ class LocalizedDateParser(object):
                     if 'unsupported' not in str(ve).lower():
                         raise ve
 
-_LOCALIZED_DATE_PARSERS = [
-    LocalizedDateParser(x[0], x[1], x[2] if len(x) > 2 else {})
-    for x in FACEBOOK_TIMESTAMP_FORMATS]
 
-# Generate a mapping of all timezones to their offsets.
-#
-#  e.g. {
-#          'PST': {
-#              (-7, 0): ['Pacific/US', ...]
-#           }
-#       }
-TIMEZONE_MAP = defaultdict(lambda: defaultdict(set))
-for tz_name in pytz.all_timezones:
-    recorded_codes = set()
-    now = datetime.combine(datetime(datetime.now().year, 1, 1).date(), time.min)
-    # This is a stupid way of detecting the codes for daylight savings time, but timezones in
-    # general are stupid and this is an easy way.
-    for d in range(0, 365, 30):
-        # Sometimes we can come up with invalid days/times. We will try adding a day if that happens.
-        try:
-            tz = pytz_timezone(tz_name).localize(now + dt_timedelta(days=d), is_dst=None)
-        except (NonExistentTimeError, AmbiguousTimeError):
-            tz = pytz_timezone(tz_name).localize(now + dt_timedelta(days=d + 1), is_dst=None)
-        timezone_code = tz.strftime("%Z")
-        if tz_name in recorded_codes:
-            continue
-        offset_raw = tz.strftime("%z")
-        if offset_raw[0] == '-':
-            offset = (-1 * int(offset_raw[1:3]), -1 * int(offset_raw[3:5]))
-        else:
-            offset = (int(offset_raw[1:3]), int(offset_raw[3:5]))
-        offset += (offset_raw,)
-        TIMEZONE_MAP[timezone_code][offset].add(tz_name)
-        # Apparently Facebook also uses the literal names. Let's throw those in too.
-        TIMEZONE_MAP[tz_name][offset] = set()
+class _LazyDateParsers(object):
+    """
+    The `LocalizedDateParser` of each timestamp format, created the first
+    time the format is tried.
+
+    Every parser loads the locale data of its language from Babel, whereas
+    an archive only has timestamps in one of the formats. Formats are only
+    tried on timestamps that fit their shape (see `fits`), so the locale
+    data of those that can't possibly match is never loaded.
+    """
+
+    def __init__(self, timestamp_formats):
+        self.timestamp_formats = timestamp_formats
+        self.parsers = [None] * len(timestamp_formats)
+        self.shapes = [None] * len(timestamp_formats)
+
+    def __len__(self):
+        return len(self.parsers)
+
+    def __getitem__(self, number):
+        date_parser = self.parsers[number]
+        if date_parser is None:
+            timestamp_format = self.timestamp_formats[number]
+            date_parser = self.parsers[number] = LocalizedDateParser(
+                timestamp_format[0], timestamp_format[1],
+                timestamp_format[2] if len(timestamp_format) > 2 else {})
+        return date_parser
+
+    def __iter__(self):
+        return (self[number] for number in range(len(self)))
+
+    def index(self, date_parser):
+        return self.parsers.index(date_parser)
+
+    def locale_id(self, number):
+        return self.timestamp_formats[number][0]
+
+    def fits(self, number, timestamp_string):
+        """
+        Determines whether a timestamp has the shape of a format, i.e.
+        matches it with any words for the names of the day and month.
+        """
+        shape = self.shapes[number]
+        if shape is None:
+            shape = self.shapes[number] = LocalizedDateParser._compile(
+                self.timestamp_formats[number][1])
+        return shape.search(timestamp_string) is not None
+
+
+_LOCALIZED_DATE_PARSERS = _LazyDateParsers(FACEBOOK_TIMESTAMP_FORMATS)
+
+def _build_timezone_map(year):
+    """
+    Maps all timezones to their offsets over the course of a year.
+
+     e.g. {
+             'PST': {
+                 (-7, 0, '-0700'): {'Pacific/US', ...}
+              }
+          }
+    """
+    timezone_map = defaultdict(lambda: defaultdict(set))
+    start = datetime.combine(datetime(year, 1, 1).date(), time.min)
+    for tz_name in pytz.all_timezones:
+        tz = pytz_timezone(tz_name)
+        # This is a stupid way of detecting the codes for daylight savings time, but timezones in
+        # general are stupid and this is an easy way.
+        for d in range(0, 365, 30):
+            # Sometimes we can come up with invalid days/times. We will try adding a day if that
+            # happens.
+            try:
+                localized = tz.localize(start + dt_timedelta(days=d), is_dst=None)
+            except (NonExistentTimeError, AmbiguousTimeError):
+                localized = tz.localize(start + dt_timedelta(days=d + 1), is_dst=None)
+            minutes = int(localized.utcoffset().total_seconds()) // 60
+            sign = -1 if minutes < 0 else 1
+            hours, minutes = divmod(abs(minutes), 60)
+            offset = (sign * hours, sign * minutes,
+                      '%s%02d%02d' % ('-' if sign < 0 else '+', hours, minutes))
+            timezone_map[localized.tzname()][offset].add(tz_name)
+            # Apparently Facebook also uses the literal names. Let's throw those in too.
+            timezone_map[tz_name][offset] = set()
+    return timezone_map
+
+
+class _LazyTimezoneMap(Mapping):
+    """
+    The mapping of all timezones to their offsets in the current year (see
+    `_build_timezone_map`).
+
+    Going through every timezone takes a while, so that is put off until the
+    first timestamp with a timezone abbreviation comes along. Timestamps
+    with a UTC offset never need it.
+    """
+
+    def __init__(self):
+        self._map = None
+
+    def _timezones(self):
+        if self._map is None:
+            self._map = _build_timezone_map(datetime.now().year)
+        return self._map
+
+    def __getitem__(self, key):
+        return self._timezones()[key]
+
+    def __contains__(self, key):
+        return key in self._timezones()
+
+    def __iter__(self):
+        return iter(self._timezones())
+
+    def __len__(self):
+        return len(self._timezones())
+
+
+TIMEZONE_MAP = _LazyTimezoneMap()
 
 
 class UnexpectedTimeFormatError(Exception):
@@ -164,6 +337,9 @@ class UnexpectedTimeFormatError(Exception):
         self.time_string = time_string
         super(UnexpectedTimeFormatError, self).__init__()
 
+    def __reduce__(self):
+        return self.__class__, (self.time_string,)
+
 
 class AmbiguousTimeZoneError(Exception):
 
@@ -172,6 +348,9 @@ class AmbiguousTimeZoneError(Exception):
         self.tz_options = tz_options
         super(AmbiguousTimeZoneError, self).__init__()
 
+    def __reduce__(self):
+        return self.__class__, (self.tz_name, self.tz_options)
+
 
 class TzInfoByOffset(tzinfo):
     """
@@ -186,6 +365,11 @@ class TzInfoByOffset(tzinfo):
             raise ValueError("outside valid timezone range")
         self.time_delta = time_delta
 
+    def __reduce__(self):
+        # Unpickled through the intern table, so that the timestamps parsed
+        # by worker processes share their timezones too.
+        return offset_tzinfo, (self.time_delta,)
+
     def utcoffset(self, dt):
         return self.time_delta
 
@@ -206,7 +390,240 @@ class TzInfoByOffset(tzinfo):
         return unicode(str(self))
 
 
-def parse_timestamp(raw_timestamp, use_utc, hints):
+# The timezone of each UTC offset come across so far, shared by all the
+# timestamps with that offset (see `offset_tzinfo`).
+_TZ_INFOS = {}
+# The timedelta of each (hours, minutes) UTC offset come across so far.
+_OFFSET_DELTAS = {}
+
+
+def offset_tzinfo(time_delta):
+    """
+    Gets the one `TzInfoByOffset` of a UTC offset. Sharing them keeps the
+    timestamps of a history from holding millions of identical timezones,
+    and lets comparisons of timestamps with the same timezone skip looking
+    up their offsets.
+
+    :param time_delta: The UTC offset, as a `timedelta`.
+    :return: A `TzInfoByOffset`.
+    """
+    tz_info = _TZ_INFOS.get(time_delta)
+    if tz_info is None:
+        tz_info = _TZ_INFOS[time_delta] = TzInfoByOffset(time_delta)
+    return tz_info
+
+
+class TimestampCache(object):
+    """
+    A least recently used cache of parsed timestamps.
+
+    Timestamps only go down to the minute, so the messages of a busy thread
+    share the same few raw timestamps over and over again.
+
+    maxsize -- the most timestamps to keep (0 to disable the cache)
+    """
+
+    def __init__(self, maxsize=8192):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        :return: The timestamp cached for the key, or `None` if there is none.
+        """
+        try:
+            timestamp = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        # Put back as the most recently used.
+        self.entries[key] = timestamp
+        self.hits += 1
+        return timestamp
+
+    def put(self, key, timestamp):
+        if self.maxsize <= 0:
+            return
+        self.entries[key] = timestamp
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    @property
+    def hit_rate(self):
+        """
+        :return: The share of lookups that were hits (0 if there were none).
+        """
+        lookups = self.hits + self.misses
+        return self.hits / float(lookups) if lookups else 0.0
+
+    def clear(self):
+        """
+        Empties the cache and resets its counters.
+        """
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# The cache `parse_timestamp` goes through.
+TIMESTAMP_CACHE = TimestampCache()
+
+
+def _hints_key(hints):
+    if not hints:
+        return ()
+    return tuple(sorted((name, tuple(offset)) for name, offset in hints.items()))
+
+
+def _language(locale_id):
+    # "pt_BR", "pt-br" and "pt" are all Portuguese.
+    return locale_id.replace('-', '_').split('_')[0].lower() if locale_id else None
+
+
+class LocaleDetector(object):
+    """
+    Works out which of the timestamp formats an archive is in, so that the
+    rest of its timestamps are only matched against that one.
+
+    The first few timestamps are matched against every format, narrowing
+    the candidates down to the formats all of them match. Once a single
+    one is left, or enough timestamps have been sampled, the first of the
+    candidates is locked in. Detection only starts over when a timestamp
+    doesn't match the locked in format.
+
+    sample_size -- the most timestamps to sample before locking in
+    lang        -- the language of the archive (e.g. the `lang` attribute of
+                   its `<html>` element), whose formats are preferred
+    """
+
+    def __init__(self, sample_size=5, lang=None):
+        self.sample_size = sample_size
+        # How many times the locked in format stopped matching.
+        self.redetections = 0
+        self.prefer(lang)
+
+    def prefer(self, lang):
+        """
+        Puts the formats of a language first, and starts detection over.
+
+        :param lang: A language or locale code (`None` for no preference).
+        """
+        self.lang = _language(lang)
+        # The numbers of the formats, in the order they are tried.
+        self.order = list(range(len(_LOCALIZED_DATE_PARSERS)))
+        if self.lang:
+            self.order.sort(
+                key=lambda n: _language(_LOCALIZED_DATE_PARSERS.locale_id(n)) != self.lang)
+        self.locked = None
+        self.candidates = None
+        self.sampled = 0
+
+    @property
+    def locale(self):
+        """
+        :return: The locale ID of the locked in format (e.g. "en_us"), or
+                 `None` if none has been locked in yet.
+        """
+        return self.locked.locale_id if self.locked is not None else None
+
+    @property
+    def timestamp_format(self):
+        """
+        :return: The locked in format (see `FACEBOOK_TIMESTAMP_FORMATS`), or
+                 `None` if none has been locked in yet.
+        """
+        return self.locked.original_timestamp_format if self.locked is not None else None
+
+    def match(self, timestamp_string):
+        """
+        Parses a timestamp (without its timezone) with the locked in format,
+        or with those that are still candidates.
+
+        :return: A naive `datetime`, or `None` if no format matches.
+        """
+        locked = self.locked
+        if locked is not None:
+            timestamp = locked.match(timestamp_string)
+            if timestamp is not None:
+                return timestamp
+            self.redetections += 1
+            self.locked = None
+        timestamp = self._sample(timestamp_string)
+        if timestamp is None and locked is not None:
+            # Nothing else matches either, so the format stays as it was.
+            self.locked = locked
+        return timestamp
+
+    def sample(self, raw_timestamps):
+        """
+        Detects the format from a handful of raw timestamps up front, locking
+        in the best candidate even if they weren't enough to tell for sure.
+
+        :param raw_timestamps: Timestamps as they appear in the archive.
+        :return: The locale ID of the locked in format, or `None`.
+        """
+        for raw_timestamp in raw_timestamps:
+            if self.locked is not None:
+                break
+            self.match(raw_timestamp.rsplit(" ", 1)[0])
+        if self.locked is None and self.candidates:
+            self.locked = self.candidates[0]
+            self.candidates = None
+        return self.locale
+
+    def _sample(self, timestamp_string):
+        matches = self._matches(self.candidates, timestamp_string) if self.candidates else []
+        if not matches:
+            # Nothing has been sampled yet, or the format has changed.
+            self.sampled = 0
+            matches = self._matches(
+                [_LOCALIZED_DATE_PARSERS[n] for n in self.order
+                 if _LOCALIZED_DATE_PARSERS.fits(n, timestamp_string)],
+                timestamp_string)
+            if not matches:
+                self.candidates = None
+                return None
+        if self.lang:
+            matches = [m for m in matches if _language(m[0].locale_id) == self.lang] or matches
+        self.candidates = [date_parser for date_parser, _ in matches]
+        self.sampled += 1
+        if len(self.candidates) == 1 or self.sampled >= self.sample_size:
+            self.locked = self.candidates[0]
+            self.candidates = None
+        return matches[0][1]
+
+    @staticmethod
+    def _matches(parsers, timestamp_string):
+        matches = []
+        for date_parser in parsers:
+            timestamp = date_parser.match(timestamp_string)
+            if timestamp is not None:
+                matches.append((date_parser, timestamp))
+        return matches
+
+    def __getstate__(self):
+        # Worker processes have parsers of their own, so only the choice
+        # made so far is passed on.
+        locked = self.locked
+        return {'sample_size': self.sample_size, 'lang': self.lang,
+                'redetections': self.redetections,
+                'locked': _LOCALIZED_DATE_PARSERS.index(locked) if locked is not None else None}
+
+    def __setstate__(self, state):
+        self.__init__(state['sample_size'], state['lang'])
+        self.redetections = state['redetections']
+        if state['locked'] is not None:
+            self.locked = _LOCALIZED_DATE_PARSERS[state['locked']]
+
+
+# The detector `parse_timestamp` goes through unless given one of its own.
+LOCALE_DETECTOR = LocaleDetector()
+
+
+@timed(PARSE_TIMESTAMP)
+def parse_timestamp(raw_timestamp, use_utc, hints, locale_detector=None):
     """
     Facebook is highly inconsistent with their timezone formatting.
     Sometimes it's in UTC+/-HH:MM form, and other times its in the
@@ -214,9 +631,26 @@ def parse_timestamp(raw_timestamp, use_utc, hints):
 
     We have to handle the ambiguity by asking for cues from the user.
 
-    raw_timestamp -- The timestamp string to parse and convert to UTC.
+    Parsed timestamps are kept in `TIMESTAMP_CACHE`.
+
+    raw_timestamp   -- The timestamp string to parse and convert to UTC.
+    locale_detector -- The `LocaleDetector` of the archive the timestamp is
+                       from (`LOCALE_DETECTOR` if not given).
     """
-    global FACEBOOK_TIMESTAMP_FORMATS
+    locale_detector = locale_detector or LOCALE_DETECTOR
+    key = (raw_timestamp, bool(use_utc), _hints_key(hints))
+    timestamp = TIMESTAMP_CACHE.get(key)
+    if timestamp is None:
+        timestamp = _parse_timestamp(raw_timestamp, use_utc, hints, locale_detector)
+        TIMESTAMP_CACHE.put(key, timestamp)
+    elif locale_detector.locked is None:
+        # Cached from another archive, which doesn't tell the detector
+        # anything about this one.
+        locale_detector.match(raw_timestamp.rsplit(" ", 1)[0])
+    return timestamp
+
+
+def _parse_timestamp(raw_timestamp, use_utc, hints, locale_detector):
     timestamp_string, offset = raw_timestamp.rsplit(" ", 1)
     if "UTC+" in offset or "UTC-" in offset:
         if offset[3] == '-':
@@ -239,23 +673,31 @@ def parse_timestamp(raw_timestamp, use_utc, hints):
         # as UTC+X (e.g UTC+8)
         offset += [0]
 
-    delta = dt_timedelta(hours=offset[0], minutes=offset[1])
+    offset = (offset[0], offset[1])
+    delta = _OFFSET_DELTAS.get(offset)
+    if delta is None:
+        delta = _OFFSET_DELTAS[offset] = dt_timedelta(hours=offset[0], minutes=offset[1])
 
     # Facebook changes the format depending on whether the user is using
     # 12-hour or 24-hour clock settings.
-    for number, date_parser in enumerate(_LOCALIZED_DATE_PARSERS):
-        timestamp = date_parser.parse(timestamp_string)
-        if timestamp is None:
-            continue
-        # Re-orient the list to ensure that the one that worked is tried first next time.
-        if number > 0:
-            del FACEBOOK_TIMESTAMP_FORMATS[number]
-            FACEBOOK_TIMESTAMP_FORMATS = [date_parser] + FACEBOOK_TIMESTAMP_FORMATS
-        break
-    else:
-        raise UnexpectedTimeFormatError(raw_timestamp)
+    timestamp = locale_detector.match(timestamp_string)
+    if timestamp is None:
+        # None of the compiled formats match, so let arrow have a go.
+        timestamp = _parse_with_arrow(raw_timestamp, timestamp_string, locale_detector.locked)
     if use_utc:
         timestamp -= delta
         return timestamp.replace(tzinfo=pytz.utc)
     else:
-        return timestamp.replace(tzinfo=TzInfoByOffset(delta))
+        return timestamp.replace(tzinfo=offset_tzinfo(delta))
+
+
+def _parse_with_arrow(raw_timestamp, timestamp_string, preferred=None):
+    # The format locked in for the archive (if any) is tried first.
+    date_parsers = _LOCALIZED_DATE_PARSERS
+    if preferred is not None:
+        date_parsers = [preferred] + [p for p in date_parsers if p is not preferred]
+    for date_parser in date_parsers:
+        timestamp = date_parser.parse(timestamp_string)
+        if timestamp is not None:
+            return timestamp
+    raise UnexpectedTimeFormatError(raw_timestamp)
@@ -1,27 +1,26 @@
 from __future__ import unicode_literals
 
 from datetime import datetime
+import importlib
 import io
 import os
 import shutil
 
 import six
 
-from .json import JsonWriter
-from .pretty_json import PrettyJsonWriter
-from .csv import CsvWriter
-from .text import TextWriter
-from .yaml import YamlWriter
+from ..profiling import timed, WRITER
 
 if six.PY2:
     FileNotFoundError = OSError
 
+# The module and class of each writer. Writers are only imported once
+# chosen, so that the dependencies of the others (such as PyYAML) aren't.
 _BUILTIN_WRITERS = {
-    "json": JsonWriter,
-    "pretty-json": PrettyJsonWriter,
-    "csv": CsvWriter,
-    "text": TextWriter,
-    "yaml": YamlWriter
+    "json": ("json", "JsonWriter"),
+    "pretty-json": ("pretty_json", "PrettyJsonWriter"),
+    "csv": ("csv", "CsvWriter"),
+    "text": ("text", "TextWriter"),
+    "yaml": ("yaml", "YamlWriter")
 }
 
 BUILTIN_WRITERS = tuple(sorted(list(_BUILTIN_WRITERS.keys())))
@@ -32,17 +31,41 @@ class SerializerDoesNotExist(KeyError):
     pass
 
 
-def write(fmt, data, stream_or_dir):
+def _get_writer(fmt):
     if fmt not in _BUILTIN_WRITERS:
         raise SerializerDoesNotExist("No such serializer '%s'" % fmt)
-    selected_writer = _BUILTIN_WRITERS[fmt]
+    module_name, class_name = _BUILTIN_WRITERS[fmt]
+    module = importlib.import_module('.' + module_name, __name__)
+    return getattr(module, class_name)()
+
+
+@timed(WRITER)
+def write(fmt, data, stream_or_dir):
+    selected_writer = _get_writer(fmt)
     if isinstance(stream_or_dir, six.string_types):
-        write_to_dir(selected_writer(), stream_or_dir, data)
+        write_to_dir(selected_writer, stream_or_dir, data)
     else:
-        selected_writer().write(data, stream_or_dir)
+        selected_writer.write(data, stream_or_dir)
 
 
-def write_to_dir(writer, directory, data):
+@timed(WRITER)
+def write_threads(fmt, user, threads, stream_or_dir):
+    """
+    Writes a chat history as its threads come in, rather than all at once.
+
+    fmt           -- the name of the format to write
+    user          -- the owner of the chat history
+    threads       -- an iterable of the threads in the order to write them
+    stream_or_dir -- the stream or directory to write to
+    """
+    selected_writer = _get_writer(fmt)
+    if isinstance(stream_or_dir, six.string_types):
+        write_threads_to_dir(selected_writer, stream_or_dir, user, threads)
+    else:
+        selected_writer.write_threads(user, threads, stream_or_dir)
+
+
+def _make_output_dir(directory):
 
     output_dir = datetime.now().strftime("fbchat_dump_%Y%m%d%H%M")
     directory = os.path.join(directory, output_dir)
@@ -52,6 +75,18 @@ def write_to_dir(writer, directory, data):
     except FileNotFoundError:
         pass
     os.makedirs(directory)
+    return directory
+
+
+def _write_thread_file(writer, directory, i, thread):
+    thread_file_str = "%s/thread_%s.%s" % (directory, i, writer.extension)
+    with io.open(thread_file_str, 'w', encoding='utf-8') as thread_file:
+        writer.write_thread(thread, stream=thread_file)
+
+
+def write_to_dir(writer, directory, data):
+
+    directory = _make_output_dir(directory)
 
     ordered_threads = [data.threads[k] for k in sorted(list(data.threads.keys()))]
 
@@ -63,8 +98,21 @@ def write_to_dir(writer, directory, data):
 
     # Write each thread.
     for i, thread in enumerate(ordered_threads, start=1):
-        thread_file_str = "%s/thread_%s.%s" % (directory, i, writer.extension)
-        with io.open(thread_file_str, 'w', encoding='utf-8') as thread_file:
-            writer.write_thread(thread, stream=thread_file)
+        _write_thread_file(writer, directory, i, thread)
+
+    print("Thread content written to [%s]" % directory)
+
+
+def write_threads_to_dir(writer, directory, user, threads):
+
+    directory = _make_output_dir(directory)
+
+    # The manifest is written as the threads come in.
+    with io.open("%s/manifest.txt" % directory, 'w', encoding='utf-8') as manifest:
+        manifest.write("Chat history manifest for: %s\n\n" % user)
+        for i, thread in enumerate(threads, start=1):
+            _write_thread_file(writer, directory, i, thread)
+            manifest.write("  %s. %s\n" % (i, ", ".join(thread.participants)))
+            manifest.flush()
 
     print("Thread content written to [%s]" % directory)
@@ -53,6 +53,11 @@ class CsvWriter(Writer):
         for k in history.threads.keys():
             self.write_thread(history.threads[k], stream, writer=writer)
 
+    def write_threads(self, user, threads, stream):
+        writer = self.get_writer(stream, True)
+        for thread in threads:
+            self.write_thread(thread, stream, writer=writer)
+
     def write_thread(self, thread, stream, writer=None):
         if not writer:
             writer = self.get_writer(stream, True)
@@ -1,5 +1,5 @@
 from __future__ import unicode_literals, absolute_import
-from .dict import DictWriter
+from .dict import DictWriter, USER_KEY, THREADS_KEY
 
 import json
 
@@ -9,6 +9,15 @@ class JsonWriter(DictWriter):
     def serialize_content(self, data):
         return json.dumps(data, ensure_ascii=False)
 
+    def write_threads(self, user, threads, stream):
+        stream.write('{"%s": %s, "%s": [' % (
+            USER_KEY, self.serialize_content(user), THREADS_KEY))
+        for i, thread in enumerate(threads):
+            if i:
+                stream.write(', ')
+            self.write_thread(thread, stream)
+        stream.write(']}')
+
     @property
     def extension(self):
         return 'json'
@@ -1,5 +1,5 @@
 from __future__ import unicode_literals, absolute_import
-from .dict import DictWriter
+from .dict import DictWriter, USER_KEY, THREADS_KEY
 
 import json
 
@@ -9,6 +9,19 @@ class PrettyJsonWriter(DictWriter):
     def serialize_content(self, data):
         return json.dumps(data, sort_keys=True, indent=4, ensure_ascii=False)
 
+    def write_threads(self, user, threads, stream):
+        # The keys are sorted, so the threads come before the user. Each
+        # thread is nested two levels deep.
+        stream.write('{\n    "%s": [' % THREADS_KEY)
+        wrote_thread = False
+        for thread in threads:
+            stream.write(',\n        ' if wrote_thread else '\n        ')
+            content = self.serialize_content(self.write_thread(thread, None))
+            stream.write(content.replace('\n', '\n        '))
+            wrote_thread = True
+        stream.write('\n    ]' if wrote_thread else ']')
+        stream.write(',\n    "%s": %s\n}' % (USER_KEY, self.serialize_content(user)))
+
     @property
     def extension(self):
         return 'json'
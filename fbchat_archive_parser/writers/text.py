@@ -14,19 +14,26 @@ class TextWriter(Writer):
     DATE_DOC_FORMAT = "%Y-%m-%d %H:%MZ"
 
     def write_history(self, history, stream):
+        self.write_threads(
+            history.user,
+            [history.threads[k] for k in sorted(history.threads.keys())],
+            stream)
+
+    def write_threads(self, user, threads, stream):
 
         dash_line = "-------------------------" + \
-                    ('-' * len(history.user)) + "-\n"
+                    ('-' * len(user)) + "-\n"
 
         stream.write(bright(dash_line))
         stream.write(bright(" Conversation history of %s\n")
-                     % cyan(history.user))
+                     % cyan(user))
         stream.write(bright(dash_line))
 
-        if len(history.threads) > 0:
-            for k in sorted([k for k in history.threads.keys()]):
-                self.write_thread(history.threads[k], stream)
-        else:
+        wrote_thread = False
+        for thread in threads:
+            self.write_thread(thread, stream)
+            wrote_thread = True
+        if not wrote_thread:
             stream.write("\n   There's nothing here!\n")
         stream.write("\n")
 
@@ -1,7 +1,7 @@
 import sys
 
 import pytz
-from ..parser import ChatThread, ChatMessage, FacebookChatHistory
+from .. import ChatThread, ChatMessage, FacebookChatHistory
 
 
 class UnserializableObject(Exception):
@@ -25,6 +25,16 @@ class Writer(object):
     def write_history(self, data, stream):
         raise NotImplementedError
 
+    def write_threads(self, user, threads, stream):
+        """
+        Writes a chat history as its threads come in, in the same format as
+        `write_history`.
+
+        user    -- the owner of the chat history
+        threads -- an iterable of the threads in the order to write them
+        """
+        raise NotImplementedError
+
     def write_thread(self, data, stream):
         raise NotImplementedError
 
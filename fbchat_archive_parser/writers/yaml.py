@@ -3,7 +3,7 @@ from __future__ import unicode_literals, absolute_import
 import six
 import yaml
 
-from .dict import DictWriter
+from .dict import DictWriter, USER_KEY, THREADS_KEY
 
 
 class YamlWriter(DictWriter):
@@ -15,6 +15,20 @@ class YamlWriter(DictWriter):
             return data.decode('utf8')
         return data
 
+    def write_threads(self, user, threads, stream):
+        # The keys are sorted, so the threads come before the user. Each
+        # thread is dumped as the only one of a history and then cut out of
+        # it, so that it is laid out just as it would be among the others.
+        header = "%s:\n" % THREADS_KEY
+        wrote_thread = False
+        for thread in threads:
+            content = self.serialize_content({THREADS_KEY: [self.write_thread(thread, None)]})
+            stream.write(content if not wrote_thread else content[len(header):])
+            wrote_thread = True
+        if not wrote_thread:
+            stream.write(self.serialize_content({THREADS_KEY: []}))
+        stream.write(self.serialize_content({USER_KEY: user}))
+
     @property
     def extension(self):
         return 'yaml'
@@ -25,6 +25,9 @@ setup(
     install_requires=[line.strip()
                       for line in open("requirements.txt", "r",
                                        encoding="utf-8").readlines()],
+    extras_require={
+        'lxml': ['lxml'],
+    },
     test_suite="tests",
     entry_points={
         "console_scripts": [
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from fbchat_archive_parser.cache import ThreadCache
+from fbchat_archive_parser.parser import parse
+
+package_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestThreadCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def parse(self, fixture, cache, **kwargs):
+        path = os.path.join(package_dir, fixture, "html", "messages.htm")
+        with io.open(path, 'rb') as f:
+            return parse(f, cache=cache, **kwargs)
+
+    def assert_same_history(self, expected, actual):
+        self.assertEqual(expected.user, actual.user)
+        self.assertEqual(list(expected.threads.keys()), list(actual.threads.keys()))
+        for k, thread in expected.threads.items():
+            self.assertEqual(thread.messages, actual.threads[k].messages)
+            self.assertEqual([str(m.timestamp) for m in thread.messages],
+                             [str(m.timestamp) for m in actual.threads[k].messages])
+
+    def test_warm_run(self):
+        for fixture in ("simulated_split", "simulated_split_images"):
+            for i, kwargs in enumerate(({}, {'use_utc': False}, {'workers': 2})):
+                directory = os.path.join(self.directory, "%s-%d" % (fixture, i))
+                expected = self.parse(fixture, None, **kwargs)
+                cold = ThreadCache(directory)
+                self.assert_same_history(expected, self.parse(fixture, cold, **kwargs))
+                self.assertEqual(0, cold.hits)
+                warm = ThreadCache(directory)
+                self.assert_same_history(expected, self.parse(fixture, warm, **kwargs))
+                self.assertGreater(warm.hits, 0)
+                self.assertEqual(0, warm.misses)
+
+    def test_key(self):
+        cache = ThreadCache(self.directory)
+        path = os.path.join(package_dir, "simulated_split", "messages", "1.html")
+        key = cache.key(path, None, True)
+        self.assertEqual(key, cache.key(path, {}, True))
+        self.assertNotEqual(key, cache.key(path, {}, False))
+        self.assertNotEqual(key, cache.key(path, {'PDT': (-7, 0)}, True))
+        self.assertIsNone(cache.key(path + ".missing", None, True))
+
+    def test_prune(self):
+        cache = ThreadCache(self.directory, max_size=0)
+        for i, key in enumerate(("a", "b", "c")):
+            cache.put(key, ("", False, []))
+            # Make sure each entry was used after the last.
+            used = time.time() - 100 + i
+            os.utime(os.path.join(self.directory, key + ".fbcap"), (used, used))
+        cache.max_size = os.path.getsize(os.path.join(self.directory, "c.fbcap"))
+        cache.get("a")
+        cache.prune()
+        self.assertEqual(["a.fbcap"], os.listdir(self.directory))
+
+    def test_unwritable_directory(self):
+        # A file stands where the cache directory would have to be created.
+        blocker = os.path.join(self.directory, "file")
+        open(blocker, 'w').close()
+        for kwargs in ({}, {'workers': 2}):
+            cache = ThreadCache(os.path.join(blocker, "cache"))
+            self.assert_same_history(self.parse("simulated_split", None, **kwargs),
+                                     self.parse("simulated_split", cache, **kwargs))
+            self.assertTrue(cache.failed)
+
+
+if __name__ == '__main__':
+    unittest.main()
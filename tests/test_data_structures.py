@@ -1,8 +1,14 @@
+import pickle
 import unittest
-from datetime import datetime
+from datetime import datetime, timedelta
 from itertools import permutations
+
+import pytz
+
 from fbchat_archive_parser import \
-    FacebookChatHistory, ChatThread, ChatMessage
+    FacebookChatHistory, ChatThread, ChatMessage, MessageColumns, SymbolTable, \
+    StringInterner
+from fbchat_archive_parser.time import TzInfoByOffset
 
 
 class TestDataStructures(unittest.TestCase):
@@ -42,14 +48,223 @@ class TestDataStructures(unittest.TestCase):
                          content="3")
 
         for p in permutations([m1, m2, m3]):
-            thread = ChatThread([])
+            for symbols in (None, SymbolTable()):
+                thread = ChatThread([], symbols)
+
+                for m in p:
+                    thread.add_message(m)
+                thread.messages.sort()
+
+                self.assertEqual([1, 3, 2],
+                                 [int(m.content) for m in thread.messages])
 
-            for m in p:
+    def test_thread_signature(self):
+
+        tz = TzInfoByOffset(timedelta(hours=-7))
+        messages = [
+            ChatMessage(timestamp=datetime(2015, 1, 1, 0, 0, tzinfo=tz),
+                        sender="Sender 1", content="1"),
+            ChatMessage(timestamp=datetime(2015, 1, 1, 0, 1, tzinfo=tz),
+                        sender="Sender 2", content="2"),
+        ]
+
+        def thread_of(messages):
+            thread = ChatThread([])
+            for m in messages:
                 thread.add_message(m)
-            thread.messages.sort()
+            return thread
+
+        thread = thread_of(messages[:1])
+        before = thread.signature
+        thread.add_message(messages[1])
+        self.assertNotEqual(before, thread.signature)
+        self.assertEqual(thread_of(messages).signature, thread.signature)
+        self.assertEqual(thread.signature, pickle.loads(pickle.dumps(thread)).signature)
+
+        # Every field counts, as does where one ends and the next starts.
+        for changed in (messages[1]._replace(content="3"),
+                        messages[1]._replace(sender="Sender 22", content=""),
+                        messages[1]._replace(timestamp=datetime(2015, 1, 1, 0, 1)),
+                        messages[1]._replace(timestamp=messages[1].timestamp.replace(
+                            tzinfo=TzInfoByOffset(timedelta(hours=-8))))):
+            self.assertNotEqual(thread.signature,
+                                thread_of([messages[0], changed]).signature)
+
+    def test_history_merge(self):
+
+        pdt = TzInfoByOffset(timedelta(hours=-7))
+
+        def message(minute, content, tz=pdt):
+            timestamp = datetime(2015, 1, 1, 7, minute, tzinfo=pdt)
+            return ChatMessage(timestamp=timestamp.astimezone(tz),
+                               sender="Sender 1", content=content)
+
+        def history(*threads):
+            result = FacebookChatHistory("Owner")
+            for participants, messages in threads:
+                thread = ChatThread(participants)
+                for m in messages:
+                    thread.add_message(m)
+                result.threads[", ".join(thread.participants)] = thread
+            return result
+
+        utc = TzInfoByOffset(timedelta(0))
+        older = history((["A"], [message(0, "hi"), message(1, "ok"), message(1, "ok")]),
+                        (["B"], [message(0, "hey")]))
+        newer = history((["A"], [message(1, "ok", utc), message(1, "ok", utc),
+                                 message(1, "ok", utc), message(2, "bye", utc)]),
+                        (["C"], [message(0, "yo")]))
+
+        merged = older.merge(newer)
+        self.assertIs(older, merged)
+        merged.sort()
+        self.assertEqual(["A", "B", "C"], sorted(merged.threads.keys()))
+        self.assertEqual(["hi", "ok", "ok", "ok", "bye"],
+                         [m.content for m in merged.threads["A"].messages])
+        self.assertEqual(["hey"], [m.content for m in merged.threads["B"].messages])
+        self.assertEqual(["yo"], [m.content for m in merged.threads["C"].messages])
+
+        # Merging again adds nothing, including after more messages were added.
+        merged.threads["B"].add_message(message(5, "later"))
+        merged.merge(history((["A"], [message(2, "bye")]), (["B"], [message(5, "later")])))
+        self.assertEqual(5, len(merged.threads["A"]))
+        self.assertEqual(2, len(merged.threads["B"]))
+
+        with self.assertRaises(ValueError):
+            merged.merge(FacebookChatHistory("Someone else"))
+
+    def test_history_merge_unknown_users(self):
+
+        def history(*threads):
+            result = FacebookChatHistory("Owner")
+            for participant, contents in threads:
+                thread = ChatThread([participant])
+                for minute, content in enumerate(contents):
+                    thread.add_message(ChatMessage(datetime(2015, 1, 1, 0, minute),
+                                                   participant, content))
+                result.threads[participant] = thread
+            return result
+
+        # The later download lost the first deleted user, so the numbers of
+        # the others shifted.
+        older = history(("A", ["hi"]), ("Unknown user #000", ["one"]),
+                        ("Unknown user #001", ["two"]))
+        newer = history(("A", ["hi", "bye"]), ("Unknown user #000", ["two", "more"]),
+                        ("Unknown user #001", ["three"]))
+        older.merge(newer)
+        older.sort()
+        self.assertEqual(["hi", "bye"], [m.content for m in older.threads["A"].messages])
+        self.assertEqual(
+            {"Unknown user #000": ["one"], "Unknown user #001": ["two"],
+             "Unknown user #002": ["two", "more"], "Unknown user #003": ["three"]},
+            dict((k, [m.content for m in t.messages])
+                 for k, t in older.threads.items() if k != "A"))
+        self.assertEqual(["Unknown user #003"], older.threads["Unknown user #003"].participants)
+
+    def test_message_columns(self):
+
+        pdt = TzInfoByOffset(timedelta(hours=-7))
+        messages = [
+            ChatMessage(timestamp=datetime(2015, 1, 1, 0, 0, tzinfo=pdt),
+                        sender="Sender 1", content="Привет", seq_num=-1),
+            ChatMessage(timestamp=datetime(2015, 1, 1, 7, 0, 0, 250, tzinfo=pytz.utc),
+                        sender="Sender 2", content=""),
+            ChatMessage(timestamp=datetime(1969, 12, 31, 23, 59),
+                        sender="Sender 1", content="naive"),
+        ]
+        symbols = SymbolTable()
+        columns = MessageColumns(symbols)
+        for m in messages:
+            columns.append(m)
+
+        self.assertEqual(3, len(columns))
+        self.assertEqual(messages, columns)
+        self.assertEqual(columns, messages)
+        self.assertNotEqual(messages[:2], columns)
+        self.assertFalse(columns != messages)
+        self.assertEqual(messages[1:], columns[1:])
+        self.assertEqual(messages[-1], columns[-1])
+        with self.assertRaises(IndexError):
+            columns[-4]
+        self.assertEqual(["Sender 1", "Sender 2"], symbols.symbols)
+        self.assertEqual([pdt, pytz.utc, None], [m.timestamp.tzinfo for m in columns])
+
+        copy = pickle.loads(pickle.dumps(columns))
+        self.assertEqual(columns, copy)
+        self.assertEqual(1, copy.symbols.code("Sender 2"))
+
+        # Sorted the same as a list, down to the content of messages that
+        # only differ by it.
+        columns = MessageColumns(symbols)
+        expected = [messages[0]._replace(content=c) for c in ("b", "a", "ab", "", "é")]
+        expected += messages[:2]
+        for m in expected:
+            columns.append(m)
+        columns.sort()
+        expected.sort()
+        self.assertEqual(expected, columns)
+        columns.sort(reverse=True)
+        self.assertEqual(expected[::-1], columns)
+        # Stable, like sorting a list.
+        columns.sort(key=lambda m: m.content)
+        self.assertEqual(sorted(expected[::-1], key=lambda m: m.content), columns)
+
+    def test_columnar_thread(self):
+
+        tz = TzInfoByOffset(timedelta(hours=-7))
+        messages = [ChatMessage(timestamp=datetime(2015, 1, 1, 0, m, tzinfo=tz),
+                                sender="Sender %d" % (m % 2), content="%d" % m)
+                    for m in range(5)]
+        thread = ChatThread(["A"])
+        columnar = ChatThread(["A"], SymbolTable())
+        for m in messages:
+            thread.add_message(m)
+            columnar.add_message(m)
+
+        self.assertIsInstance(columnar.messages, MessageColumns)
+        self.assertEqual(thread.signature, columnar.signature)
+        copy = pickle.loads(pickle.dumps(columnar))
+        self.assertIsInstance(copy.messages, MessageColumns)
+        self.assertEqual(thread.signature, copy.signature)
+        self.assertEqual(messages, copy.messages)
+
+        # Threads merged into a columnar history are columnar too.
+        history = FacebookChatHistory("Owner", symbols=SymbolTable())
+        other = FacebookChatHistory("Owner", {"A": thread})
+        history.merge(other)
+        self.assertIsInstance(history.threads["A"].messages, MessageColumns)
+        self.assertIs(history.symbols, history.threads["A"].messages.symbols)
+        self.assertEqual(thread.messages, history.threads["A"].messages)
+
+    def test_string_interner(self):
+
+        def copy_of(string):
+            return "".join(list(string))
+
+        interner = StringInterner(max_content_length=3)
+        sender = interner.intern("Sender 1")
+        self.assertIs(sender, interner.intern(copy_of("Sender 1")))
+        self.assertIs(interner.intern_content("lol"), interner.intern_content(copy_of("lol")))
+        long_content = copy_of("lol!")
+        self.assertIs(long_content, interner.intern_content(long_content))
+        self.assertNotIn("lol!", interner.symbols)
+
+        message = interner.intern_message(ChatMessage(
+            timestamp=datetime(2015, 1, 1), sender=copy_of("Sender 1"), content="ok", seq_num=-1))
+        self.assertEqual(ChatMessage(datetime(2015, 1, 1), "Sender 1", "ok", -1), message)
+        self.assertIs(sender, message.sender)
+
+        copy = pickle.loads(pickle.dumps(interner))
+        self.assertEqual(3, copy.max_content_length)
+        self.assertEqual(interner.code("lol"), copy.code("lol"))
+
+        # Messages merged into a history are interned with its interner.
+        thread = ChatThread(["A"]).add_message(
+            ChatMessage(datetime(2015, 1, 1), copy_of("Sender 1"), "hi"))
+        history = FacebookChatHistory("Owner", interner=interner)
+        history.merge(FacebookChatHistory("Owner", {"A": thread}))
+        self.assertIs(sender, history.threads["A"].messages[0].sender)
 
-            self.assertEqual([1, 3, 2],
-                             [int(m.content) for m in thread.messages])
 
 if __name__ == '__main__':
     unittest.main()
@@ -2,14 +2,37 @@
 
 from __future__ import unicode_literals
 
+import gc
 import io
+import itertools
 import unittest
+import weakref
 import os
-from fbchat_archive_parser.parser import parse
+import shutil
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+from fbchat_archive_parser import StringInterner
+from fbchat_archive_parser.parser import (
+    parse, iter_threads, iter_messages, sniff_format, SafeXMLStream, ThreadSkippingStream,
+    LegacyMessageHtmlParser, SplitMessageHtmlParser, ChatThreadParser, _THREAD_EVENT_HANDLERS,
+    available_engines,
+    LEGACY_FORMAT, SPLIT_FORMAT, SPLIT_WITH_IMAGES_FORMAT, ETREE_ENGINE, LXML_ENGINE)
 
 package_dir = os.path.dirname(os.path.abspath(__file__))
 
 
+def assert_interned(test_case, history):
+    interner = history.interner
+    test_case.assertIsNotNone(interner)
+    for thread in history.threads.values():
+        for m in thread.messages:
+            test_case.assertIs(interner.intern(m.sender), m.sender)
+            if interner.max_content_length is not None and \
+                    len(m.content) <= interner.max_content_length:
+                test_case.assertIs(interner.intern(m.content), m.content)
+
+
 class TestParsing(unittest.TestCase):
 
     @classmethod
@@ -36,5 +59,400 @@ class TestParsing(unittest.TestCase):
     def test_message_content(self):
         pass
 
+    def test_locale(self):
+        self.assertEqual("en_us", self.fbc.locale)
+
+    def test_binary_handle(self):
+        with io.open(os.path.join(package_dir, "simulated_data.htm"), 'rb') as f:
+            fbc = parse(f)
+        self.assertEqual(sorted(self.fbc.threads.keys()), sorted(fbc.threads.keys()))
+        for k, thread in self.fbc.threads.items():
+            self.assertEqual(thread.messages, fbc.threads[k].messages)
+
+    def test_interning(self):
+        assert_interned(self, self.fbc)
+        self.assertNotIn("Yes, it is", self.fbc.interner.symbols)
+        with io.open(os.path.join(package_dir, "simulated_data.htm"), 'rb') as f:
+            fbc = parse(f, interner=StringInterner(max_content_length=16))
+        assert_interned(self, fbc)
+
+    def test_columnar(self):
+        with io.open(os.path.join(package_dir, "simulated_data.htm"), 'rb') as f:
+            fbc = parse(f, columnar=True)
+        self.assertIsNotNone(fbc.symbols)
+        self.assertEqual(sorted(self.fbc.threads.keys()), sorted(fbc.threads.keys()))
+        for k, thread in self.fbc.threads.items():
+            self.assertIs(fbc.symbols, fbc.threads[k].messages.symbols)
+            self.assertEqual(thread.messages, fbc.threads[k].messages)
+            self.assertEqual(thread.signature, fbc.threads[k].signature)
+
+
+class TestSplitParsing(unittest.TestCase):
+
+    def parse(self, fixture, **kwargs):
+        path = os.path.join(package_dir, fixture, "html", "messages.htm")
+        with io.open(path, 'rb') as f:
+            return parse(f, **kwargs)
+
+    def test_split(self):
+        fbc = self.parse("simulated_split")
+        self.assertEqual("First User 一", fbc.user)
+        self.assertEqual(
+            ["Second User 二", "Second User 二, Third User 三", "Third User 三"],
+            sorted(fbc.threads.keys()))
+        # Continued across two thread files.
+        self.assertEqual(5, len(fbc.threads["Second User 二"]))
+        # Duplicated in another thread file.
+        self.assertEqual(3, len(fbc.threads["Third User 三"]))
+
+    def test_split_with_images(self):
+        fbc = self.parse("simulated_split_images")
+        self.assertEqual(
+            ["Second User 二", "Second User 二, Third User 三", "Third User 三",
+             "Unknown user #000"],
+            sorted(fbc.threads.keys()))
+        self.assertIn("(image reference: messages/photos/10000.jpg)",
+                      [m.content for m in fbc.threads["Second User 二"].messages])
+
+    def test_merge(self):
+        fbc = self.parse("simulated_split")
+        merged = self.parse("simulated_split").merge(self.parse("simulated_split"))
+        self.assertEqual(sorted(fbc.threads.keys()), sorted(merged.threads.keys()))
+        for k, thread in fbc.threads.items():
+            self.assertEqual(sorted(thread.messages), sorted(merged.threads[k].messages))
+
+        # Only the image message is missing from the October 2017 archive.
+        merged.merge(self.parse("simulated_split_images"))
+        self.assertEqual(len(fbc.threads["Second User 二"]) + 1,
+                         len(merged.threads["Second User 二"]))
+        self.assertIn("Unknown user #000", merged.threads)
+
+    def test_parallel_matches_serial(self):
+        for fixture in ("simulated_split", "simulated_split_images"):
+            serial = self.parse(fixture)
+            parallel = self.parse(fixture, workers=3)
+            self.assertEqual(serial.user, parallel.user)
+            self.assertEqual(list(serial.threads.keys()), list(parallel.threads.keys()))
+            for k, thread in serial.threads.items():
+                self.assertEqual(thread.participants, parallel.threads[k].participants)
+                self.assertEqual(thread.messages, parallel.threads[k].messages)
+
+    def test_columnar(self):
+        for fixture in ("simulated_split", "simulated_split_images"):
+            expected = self.parse(fixture)
+            for workers in (1, 3):
+                fbc = self.parse(fixture, columnar=True, workers=workers)
+                self.assertEqual(list(expected.threads.keys()), list(fbc.threads.keys()))
+                for k, thread in expected.threads.items():
+                    self.assertEqual(thread.messages, fbc.threads[k].messages)
+
+    def test_interning(self):
+        for fixture in ("simulated_split", "simulated_split_images"):
+            for workers in (1, 3):
+                for interner in (None, StringInterner(max_content_length=16)):
+                    assert_interned(self, self.parse(fixture, workers=workers,
+                                                     interner=interner))
+
+    def test_locale(self):
+        for workers in (1, 3):
+            self.assertEqual("en_us", self.parse("simulated_split", workers=workers).locale)
+
+    def test_manifest_language(self):
+        root = tempfile.mkdtemp()
+        try:
+            fixture = os.path.join(root, "simulated_split")
+            shutil.copytree(os.path.join(package_dir, "simulated_split"), fixture)
+            manifest = os.path.join(fixture, "html", "messages.htm")
+            with io.open(manifest, encoding='utf-8') as f:
+                html = f.read()
+            with io.open(manifest, 'w', encoding='utf-8') as f:
+                f.write(html.replace("<html>", '<html lang="en">', 1))
+            with io.open(manifest, 'rb') as f:
+                parser = SplitMessageHtmlParser(f)
+                parser.parse()
+            self.assertEqual("en", parser.locale_detector.lang)
+            self.assertEqual("en_us", parser.locale)
+        finally:
+            shutil.rmtree(root)
+
+    def test_skipped_thread_files_are_not_opened(self):
+        root = tempfile.mkdtemp()
+        try:
+            fixture = os.path.join(root, "simulated_split")
+            shutil.copytree(os.path.join(package_dir, "simulated_split"), fixture)
+            # Referenced only for the thread with the third user.
+            os.remove(os.path.join(fixture, "messages", "2.html"))
+            os.remove(os.path.join(fixture, "messages", "5.html"))
+            for workers in (1, 2):
+                with io.open(os.path.join(fixture, "html", "messages.htm"), 'rb') as f:
+                    fbc = parse(f, thread_filter=('second',), workers=workers)
+                self.assertEqual(["Second User 二"], list(fbc.threads.keys()))
+        finally:
+            shutil.rmtree(root)
+
+    def test_filtered_parallel_matches_serial(self):
+        for fixture in ("simulated_split", "simulated_split_images"):
+            for thread_filter in (('second',), ('unknown',)):
+                serial = self.parse(fixture, thread_filter=thread_filter)
+                parallel = self.parse(fixture, thread_filter=thread_filter, workers=3)
+                self.assertEqual(list(serial.threads.keys()), list(parallel.threads.keys()))
+                for k, thread in serial.threads.items():
+                    self.assertEqual(thread.messages, parallel.threads[k].messages)
+
+
+class TestThreadFiltering(unittest.TestCase):
+
+    def parse(self, chunk_size, **kwargs):
+        with io.open(os.path.join(package_dir, "simulated_data.htm"), 'rb') as f:
+            parser = LegacyMessageHtmlParser(f, **kwargs)
+            parser.skipped = []
+            skips_thread = parser._skips_thread
+
+            def record(participants):
+                skipped = skips_thread(participants)
+                if skipped:
+                    parser.skipped.append(participants)
+                return skipped
+
+            parser._skips_thread = record
+            ThreadSkippingStream.CHUNK_SIZE, chunk_size = chunk_size, ThreadSkippingStream.CHUNK_SIZE
+            try:
+                return parser.parse(), parser.skipped
+            finally:
+                ThreadSkippingStream.CHUNK_SIZE = chunk_size
+
+    def test_legacy_threads_are_skipped_unparsed(self):
+        everything, _ = self.parse(64 * 1024)
+        for thread_filter in (('second',), ('third',), ('second', 'third'), ('nobody',)):
+            expected = [k for k, t in everything.threads.items()
+                        if LegacyMessageHtmlParser(None, thread_filter=thread_filter)
+                        .should_record_thread(t.participants)]
+            for chunk_size in (1, 7, 100, 64 * 1024):
+                fbc, skipped = self.parse(chunk_size, thread_filter=thread_filter)
+                self.assertEqual(expected, list(fbc.threads.keys()))
+                for k, thread in fbc.threads.items():
+                    self.assertEqual(everything.threads[k].messages, thread.messages)
+                self.assertEqual(3 - len(expected), len(skipped))
+
+    def test_stream(self):
+        archive = ('<div><h1>Owner</h1><div class="thread">A &amp; B<div class="message">'
+                   '<div></div></div><p>1</p></div>\n<div class="thread">C<div></div></div>'
+                   '<div class="thread">D<div></div></div></div>')
+        for size in (1, 5, 1024):
+            for skipped, expected in (
+                    (set(), archive),
+                    ({'A & B'}, archive.replace(
+                        '<div class="thread">A &amp; B<div class="message"><div></div></div>'
+                        '<p>1</p></div>', '')),
+                    ({'C', 'D'}, archive.replace('<div class="thread">C<div></div></div>', '')
+                        .replace('<div class="thread">D<div></div></div>', ''))):
+                for handle in (io.StringIO(archive), io.BytesIO(archive.encode('utf8'))):
+                    stream = ThreadSkippingStream(handle, lambda p: p in skipped)
+                    stream.CHUNK_SIZE = size
+                    data = b''
+                    while True:
+                        buff = stream.read(size)
+                        if not buff:
+                            break
+                        data += buff
+                    self.assertEqual(expected.encode('utf8'), data)
+
+
+class TestStreaming(unittest.TestCase):
+
+    FIXTURES = (("simulated_data.htm",),
+                ("simulated_split", "html", "messages.htm"),
+                ("simulated_split_images", "html", "messages.htm"))
+
+    def open(self, path):
+        return io.open(os.path.join(package_dir, *path), 'rb')
+
+    def test_threads_match_parse(self):
+        for path in self.FIXTURES:
+            with self.open(path) as f:
+                fbc = parse(f)
+            with self.open(path) as f:
+                stream = iter_threads(f)
+                merged = {}
+                for thread in stream:
+                    merged.setdefault(", ".join(thread.participants), []).extend(thread.messages)
+            self.assertEqual(fbc.user, stream.user)
+            self.assertEqual(fbc.locale, stream.locale)
+            self.assertEqual(sorted(fbc.threads.keys()), sorted(merged.keys()))
+            for k, thread in fbc.threads.items():
+                self.assertEqual(sorted(thread.messages), sorted(merged[k]))
+
+    def test_messages(self):
+        path = ("simulated_split_images", "html", "messages.htm")
+        with self.open(path) as f:
+            fbc = parse(f, thread_filter=('second',))
+        with self.open(path) as f:
+            records = list(iter_messages(f, thread_filter=('second',), workers=2))
+        self.assertEqual(sorted(fbc.threads["Second User 二"].messages),
+                         sorted(m for _, m in records))
+        self.assertEqual({("Second User 二",)}, set(p for p, _ in records))
+
+    def test_threads_are_not_retained(self):
+        with self.open(("simulated_data.htm",)) as f:
+            refs = [weakref.ref(thread) for thread in iter_threads(f)]
+        gc.collect()
+        self.assertEqual(3, len(refs))
+        self.assertEqual([None] * 3, [ref() for ref in refs])
+
+
+@unittest.skipIf(LXML_ENGINE not in available_engines(), "lxml is not installed")
+class TestEngines(unittest.TestCase):
+
+    def test_engines_agree(self):
+        for path in (("simulated_data.htm",),
+                     ("simulated_split", "html", "messages.htm"),
+                     ("simulated_split_images", "html", "messages.htm")):
+            histories = []
+            for engine in (ETREE_ENGINE, LXML_ENGINE):
+                with io.open(os.path.join(package_dir, *path), 'rb') as f:
+                    histories.append(parse(f, engine=engine))
+            etree, lxml = histories
+            self.assertEqual(etree.user, lxml.user)
+            self.assertEqual(list(etree.threads.keys()), list(lxml.threads.keys()))
+            for k, thread in etree.threads.items():
+                self.assertEqual(thread.messages, lxml.threads[k].messages)
+
+    def test_falls_back_to_lxml(self):
+        with io.open(os.path.join(package_dir, "simulated_data.htm"), 'rb') as f:
+            data = f.read().replace("Yes, it is".encode('utf8'), b"Yes, it&eacute;s")
+        with self.assertRaises(ET.ParseError):
+            parse(io.BytesIO(data), engine=ETREE_ENGINE)
+        fbc = parse(io.BytesIO(data))
+        self.assertIn("Yes, it\xe9s", [m.content for m in fbc.threads["Second User 二"].messages])
+
+
+class TestFormatSniffing(unittest.TestCase):
+
+    def sniff(self, *path):
+        with io.open(os.path.join(package_dir, *path), 'rb') as f:
+            archive_format = sniff_format(f)
+            self.assertEqual(0, f.tell())
+        return archive_format
+
+    def test_legacy(self):
+        self.assertEqual(LEGACY_FORMAT, self.sniff("simulated_data.htm").name)
+
+    def test_split(self):
+        archive_format = self.sniff("simulated_split", "html", "messages.htm")
+        self.assertEqual(SPLIT_FORMAT, archive_format.name)
+        self.assertGreater(archive_format.bytes_read, 0)
+
+    def test_split_with_images(self):
+        archive_format = self.sniff("simulated_split_images", "html", "messages.htm")
+        self.assertEqual(SPLIT_WITH_IMAGES_FORMAT, archive_format.name)
+
+
+class _SyntheticLegacyArchive(object):
+    """
+    A legacy archive that is generated as it is read.
+    """
+
+    MESSAGE = ('<div class="message"><div class="message_header"><span class="user">User</span>'
+               '<span class="meta">Friday, October 4, 2013 at 10:05pm PDT</span></div></div>'
+               '<p>Message content</p>')
+
+    def __init__(self, threads, messages):
+        self.chunks = itertools.chain(
+            ['<html><body><div class="contents"><h1>First User 一</h1><div>'],
+            itertools.chain.from_iterable(
+                itertools.chain(['<div class="thread">First User 一, User %d' % i],
+                                itertools.repeat(self.MESSAGE, messages), ['</div>'])
+                for i in range(threads)),
+            ['</div></div></body></html>'])
+        self.buffer = b''
+
+    def read(self, size=-1):
+        for chunk in self.chunks:
+            self.buffer += chunk.encode('utf8')
+            if len(self.buffer) >= size:
+                break
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+@unittest.skipIf(sys.version_info < (3, 4), "tracemalloc is unavailable")
+class TestStreamingMemory(unittest.TestCase):
+
+    def setUp(self):
+        # Imports, compiled patterns and timestamp parsers are set up by the
+        # first parse, which mustn't count towards the first measurement.
+        self.working_memory(100)
+
+    def working_memory(self, messages):
+        """
+        :return: The most memory in use at any point while parsing a thread
+                 of this many messages, less what the history holds on to.
+        """
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            history = LegacyMessageHtmlParser(_SyntheticLegacyArchive(1, messages)).parse()
+            retained, peak = tracemalloc.get_traced_memory()
+            self.assertEqual(messages, len(history.threads["User 0"]))
+            return peak - retained
+        finally:
+            tracemalloc.stop()
+
+    def assert_flat(self, flat):
+        small = self.working_memory(2000)
+        large = self.working_memory(20000)
+        if flat:
+            self.assertLess(large, small * 2)
+        else:
+            self.assertGreater(large, small * 2)
+
+    def test_peak_memory_is_flat(self):
+        self.assert_flat(True)
+
+    def test_retained_elements_are_caught(self):
+        # Without releasing elements, the whole tree of the thread is built.
+        release = ChatThreadParser._release
+        handlers = dict(_THREAD_EVENT_HANDLERS)
+        ChatThreadParser._release = lambda parser, element: None
+        _THREAD_EVENT_HANDLERS.clear()
+        try:
+            self.assert_flat(False)
+        finally:
+            ChatThreadParser._release = release
+            _THREAD_EVENT_HANDLERS.clear()
+            _THREAD_EVENT_HANDLERS.update(handlers)
+
+
+class TestSafeXMLStream(unittest.TestCase):
+
+    SAMPLE = "<p>a\x01b\u0084c三￾\U0001fffe\U0001f600﷐d\r\n</p>"
+
+    def read_all(self, stream, size):
+        data = b''
+        while True:
+            buff = stream.read(size)
+            if not buff:
+                return data
+            data += buff
+
+    def test_text_and_binary_agree(self):
+        expected = self.read_all(SafeXMLStream(io.StringIO(self.SAMPLE)), 1024)
+        actual = self.read_all(SafeXMLStream(io.BytesIO(self.SAMPLE.encode('utf8'))), 1024)
+        self.assertEqual(expected, actual)
+        self.assertEqual(
+            expected, SafeXMLStream.HTML_ENTITY_DEF + "<p>abc三\U0001f600d\n</p>".encode('utf8'))
+
+    def test_multibyte_read_boundaries(self):
+        expected = self.read_all(SafeXMLStream(io.StringIO(self.SAMPLE)), 1024)
+        for size in range(1, 8):
+            stream = SafeXMLStream(io.BytesIO(self.SAMPLE.encode('utf8')))
+            self.assertEqual(expected, self.read_all(stream, size))
+
+    def test_html_entities(self):
+        sample = "<p>a&nbsp;b&amp;nbsp;&nbsp;</p>".encode('utf8')
+        for size in range(1, 8):
+            stream = SafeXMLStream(io.BytesIO(sample), html_entities=True)
+            self.assertEqual(b"<p>a b&amp;nbsp; </p>", self.read_all(stream, size))
+
 if __name__ == '__main__':
     unittest.main()
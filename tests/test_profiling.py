@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import io
+import os
+import unittest
+
+from fbchat_archive_parser import profiling
+from fbchat_archive_parser.parser import parse
+from fbchat_archive_parser.profiling import Profiler, phase, timed, timed_iter
+
+package_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_nested_phases(self):
+        clock = FakeClock()
+        profiler = Profiler(clock)
+        with profiler:
+            for subject in ("a", "b"):
+                with phase('outer', subject):
+                    clock.now += 1
+                    with phase('inner'):
+                        clock.now += 2
+            clock.now += 1
+        self.assertIsNone(profiling.active())
+        report = profiler.report()
+        self.assertEqual(7, report['seconds'])
+        self.assertEqual({'seconds': 6, 'self_seconds': 2, 'calls': 2,
+                          'slowest': [{'subject': "b", 'seconds': 3},
+                                      {'subject': "a", 'seconds': 3}]},
+                         report['phases']['outer'])
+        self.assertEqual({'seconds': 4, 'self_seconds': 4, 'calls': 2},
+                         report['phases']['inner'])
+
+    def test_inactive(self):
+        calls = []
+
+        @timed('call')
+        def call(x):
+            calls.append(x)
+            return x
+
+        items = [1, 2]
+        self.assertIs(items, timed_iter('items', items))
+        self.assertEqual(1, call(1))
+        with phase('nothing'):
+            pass
+
+        profiler = Profiler()
+        with profiler:
+            self.assertEqual(2, call(2))
+            self.assertEqual(items, list(timed_iter('items', items)))
+        self.assertEqual([1, 2], calls)
+        self.assertEqual(1, profiler.phases['call'][2])
+        # Once for each item, and once more for the end.
+        self.assertEqual(3, profiler.phases['items'][2])
+        self.assertEqual(['call', 'items'], sorted(profiler.phases))
+
+    def test_absorb(self):
+        clock = FakeClock()
+        profiler = Profiler(clock, slowest=2)
+        for seconds, subject in ((1, "a"), (3, "b"), (2, "c")):
+            worker = Profiler(clock)
+            with worker:
+                with phase('file', subject):
+                    clock.now += seconds
+            profiler.absorb(worker.state())
+        report = profiler.report()
+        self.assertEqual(3, report['phases']['file']['calls'])
+        self.assertEqual(6, report['phases']['file']['seconds'])
+        self.assertEqual(["b", "c"],
+                         [s['subject'] for s in report['phases']['file']['slowest']])
+
+
+class TestParserProfiling(unittest.TestCase):
+
+    def profile(self, path, **kwargs):
+        profiler = Profiler()
+        with profiler:
+            with io.open(os.path.join(package_dir, *path), 'rb') as f:
+                parse(f, **kwargs)
+        return profiler.report()['phases']
+
+    def test_legacy(self):
+        phases = self.profile(("simulated_data.htm",))
+        self.assertEqual(20, phases['parse_timestamp']['calls'])
+        self.assertIn('xml', phases)
+        self.assertIn('name_resolution', phases)
+        self.assertEqual(set(["Second User 二", "Third User 三",
+                              "Second User 二, Third User 三"]),
+                         set(s['subject'] for s in phases['threads']['slowest']))
+
+    def test_split(self):
+        for kwargs in ({}, {'workers': 2}):
+            phases = self.profile(("simulated_split_images", "html", "messages.htm"),
+                                  **kwargs)
+            self.assertEqual(1, phases['sniff']['calls'])
+            self.assertEqual(1, phases['manifest']['calls'])
+            self.assertEqual(6, phases['threads']['calls'])
+            self.assertEqual(6, len(phases['threads']['slowest']))
+            self.assertLessEqual(phases['parse_timestamp']['seconds'],
+                                 phases['threads']['seconds'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import sys
+import unittest
+
+from fbchat_archive_parser.parser import parse
+from fbchat_archive_parser.progress import ProgressReporter
+
+package_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProgressReporter(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.stream = io.StringIO()
+
+    def events(self):
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_redraws_are_limited(self):
+        progress = ProgressReporter(self.stream, max_redraws=10, machine_readable=True,
+                                    clock=self.clock)
+        progress.set_totals(total_files=1000)
+        for _ in range(1000):
+            progress.update(files_done=1, messages=10)
+            self.clock.now += 0.001
+        progress.finish()
+        events = self.events()
+        self.assertEqual(11, len(events))
+        self.assertEqual(['progress'] * 10 + ['done'], [e['event'] for e in events])
+        self.assertEqual(1000, events[-1]['files'])
+        self.assertEqual(10000, events[-1]['messages'])
+        self.assertEqual(1.0, events[-1]['fraction'])
+
+    def test_rates_and_eta(self):
+        progress = ProgressReporter(self.stream, machine_readable=True, clock=self.clock)
+        progress.set_totals(total_bytes=4000000, total_files=4)
+        self.clock.now += 2
+        progress.update(bytes_done=1000000, files_done=1, messages=500)
+        event = self.events()[-1]
+        self.assertEqual(500000, event['bytes_per_second'])
+        self.assertEqual(250, event['messages_per_second'])
+        self.assertEqual(0.25, event['fraction'])
+        self.assertEqual(6, event['eta'])
+
+    def test_position(self):
+        progress = ProgressReporter(self.stream, machine_readable=True, clock=self.clock)
+        handle = io.BytesIO(b'x' * 1000)
+        progress.set_totals(total_bytes=1000, position=handle.tell)
+        handle.read(250)
+        self.clock.now += 1
+        progress.update()
+        self.assertEqual(250, self.events()[-1]['bytes'])
+
+    def test_status_line(self):
+        progress = ProgressReporter(self.stream, machine_readable=False, clock=self.clock)
+        progress.set_totals(total_bytes=4000000)
+        self.clock.now += 2
+        progress.update(status="Discovered chat thread with [A]...",
+                        bytes_done=1000000, messages=500)
+        self.assertEqual("\r[ 25% | 0.5 MB/s | 250 msgs/s | ETA 0:06] "
+                         "Discovered chat thread with [A]...", self.stream.getvalue())
+        progress.finish()
+        self.assertTrue(self.stream.getvalue().endswith("\r"))
+
+
+class TestParserProgress(unittest.TestCase):
+
+    def parse(self, *path):
+        stderr, sys.stderr = sys.stderr, io.StringIO()
+        try:
+            with io.open(os.path.join(package_dir, *path), 'rb') as f:
+                fbc = parse(f, progress_output=True)
+            return fbc, [json.loads(line) for line in sys.stderr.getvalue().splitlines()]
+        finally:
+            sys.stderr = stderr
+
+    def test_legacy(self):
+        fbc, events = self.parse("simulated_data.htm")
+        done = events[-1]
+        self.assertEqual('done', done['event'])
+        self.assertEqual(os.path.getsize(os.path.join(package_dir, "simulated_data.htm")),
+                         done['total_bytes'])
+        self.assertEqual(done['total_bytes'], done['bytes'])
+        self.assertEqual(sum(len(t) for t in fbc.threads.values()), done['messages'])
+
+    def test_split(self):
+        fbc, events = self.parse("simulated_split", "html", "messages.htm")
+        done = events[-1]
+        self.assertEqual('done', done['event'])
+        self.assertEqual(5, done['total_files'])
+        self.assertEqual(5, done['files'])
+        self.assertEqual(done['total_bytes'], done['bytes'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import os
+import subprocess
+import sys
+import unittest
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestStartup(unittest.TestCase):
+
+    def imported_modules(self, statement):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [root_dir, env.get('PYTHONPATH')]))
+        output = subprocess.check_output(
+            [sys.executable, '-c', '%s\nimport sys\nsys.stdout.write(" ".join(sys.modules))'
+             % statement], env=env)
+        return set(output.decode('utf-8').split())
+
+    def test_cli_defers_heavy_imports(self):
+        modules = self.imported_modules("import fbchat_archive_parser.main")
+        for name in ('requests', 'bs4', 'yaml', 'arrow', 'babel', 'lxml',
+                     'fbchat_archive_parser.writers.yaml'):
+            self.assertNotIn(name, modules)
+
+    def test_writers_are_imported_when_chosen(self):
+        modules = self.imported_modules(
+            "from fbchat_archive_parser.writers import _get_writer\n_get_writer('yaml')")
+        self.assertIn('fbchat_archive_parser.writers.yaml', modules)
+        self.assertNotIn('fbchat_archive_parser.writers.csv', modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,12 +3,17 @@
 from __future__ import unicode_literals
 
 from datetime import datetime
+import pickle
 import unittest
 
 import pytz
+from fbchat_archive_parser import time
 from fbchat_archive_parser.time import (parse_timestamp,
                                         UnexpectedTimeFormatError,
-                                        AmbiguousTimeZoneError)
+                                        AmbiguousTimeZoneError,
+                                        TimestampCache,
+                                        TIMESTAMP_CACHE,
+                                        LocaleDetector)
 
 
 class TestTimestamps(unittest.TestCase):
@@ -127,5 +132,134 @@ class TestTimestamps(unittest.TestCase):
         self.run_timestamp_test(timestamp_raw)
 
 
+
+class TestTimestampCache(unittest.TestCase):
+
+    def setUp(self):
+        TIMESTAMP_CACHE.clear()
+
+    def test_repeated_timestamps(self):
+        timestamp_raw = "Sunday, December 4, 2016 at 1:54pm PDT"
+        first = parse_timestamp(timestamp_raw, use_utc=True, hints={})
+        self.assertIs(first, parse_timestamp(timestamp_raw, use_utc=True, hints={}))
+        self.assertEqual((1, 1), (TIMESTAMP_CACHE.hits, TIMESTAMP_CACHE.misses))
+        self.assertEqual(0.5, TIMESTAMP_CACHE.hit_rate)
+
+        local = parse_timestamp(timestamp_raw, use_utc=False, hints={})
+        self.assertEqual(first, local)
+        self.assertNotEqual(str(first), str(local))
+        hinted = parse_timestamp(timestamp_raw, use_utc=True, hints={'PDT': (-8, 0)})
+        self.assertEqual(datetime(2016, 12, 4, 21, 54).replace(tzinfo=pytz.UTC), hinted)
+        self.assertEqual(3, TIMESTAMP_CACHE.misses)
+
+    def test_timezones_are_shared(self):
+        first = parse_timestamp("Sunday, December 4, 2016 at 1:54pm UTC-07", use_utc=False,
+                                hints={})
+        second = parse_timestamp("Monday, December 5, 2016 at 2:54pm UTC-07:00",
+                                 use_utc=False, hints={})
+        self.assertIs(first.tzinfo, second.tzinfo)
+        self.assertIs(first.tzinfo, pickle.loads(pickle.dumps(second)).tzinfo)
+        self.assertIsNot(first.tzinfo, parse_timestamp(
+            "Sunday, December 4, 2016 at 1:54pm UTC+07", use_utc=False, hints={}).tzinfo)
+
+    def test_errors_are_not_cached(self):
+        for _ in range(2):
+            with self.assertRaises(UnexpectedTimeFormatError):
+                parse_timestamp("not a real timestamp", use_utc=True, hints={})
+        self.assertEqual(0, len(TIMESTAMP_CACHE.entries))
+
+    def test_timezone_map_is_built_on_demand(self):
+        timezone_map = time._LazyTimezoneMap()
+        original, time.TIMEZONE_MAP = time.TIMEZONE_MAP, timezone_map
+        try:
+            parse_timestamp("Sunday, December 4, 2016 at 1:54pm UTC-07", use_utc=True, hints={})
+            self.assertIsNone(timezone_map._map)
+            parse_timestamp("Sunday, December 4, 2016 at 1:54pm PDT", use_utc=True, hints={})
+            self.assertIn('PDT', timezone_map)
+            self.assertEqual(set([(-7, 0, '-0700')]), set(timezone_map['PDT'].keys()))
+        finally:
+            time.TIMEZONE_MAP = original
+
+    def test_eviction(self):
+        cache = TimestampCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(1, cache.get("a"))
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(["a", "c"], list(cache.entries))
+
+        disabled = TimestampCache(maxsize=0)
+        disabled.put("a", 1)
+        self.assertIsNone(disabled.get("a"))
+
+
+class TestLocaleDetector(unittest.TestCase):
+
+    def setUp(self):
+        TIMESTAMP_CACHE.clear()
+
+    def test_locks_in(self):
+        detector = LocaleDetector(sample_size=3)
+        # Both Norwegian and Danish spell it this way.
+        self.assertEqual(datetime(2016, 1, 4, 13, 54),
+                         detector.match("4. januar 2016 kl. 13:54"))
+        self.assertIsNone(detector.locale)
+        detector.match("5. januar 2016 kl. 13:55")
+        detector.match("6. januar 2016 kl. 13:56")
+        self.assertEqual("nb_no", detector.locale)
+        self.assertEqual("D. MMMM YYYY [kl.] HH:mm", detector.timestamp_format)
+
+    def test_single_candidate(self):
+        detector = LocaleDetector()
+        detector.match("2016 m. gruodis 4 d., 13:54")
+        self.assertEqual("lt_lt", detector.locale)
+
+    def test_redetects_on_a_miss(self):
+        detector = LocaleDetector()
+        detector.match("Sunday, December 4, 2016 at 1:54pm")
+        self.assertEqual("en_us", detector.locale)
+        self.assertEqual(datetime(2016, 12, 4, 13, 54),
+                         detector.match("dimanche 4 décembre 2016, 13:54"))
+        self.assertEqual("fr_fr", detector.locale)
+        self.assertEqual(1, detector.redetections)
+        # Matched by nothing, so French stays locked in.
+        self.assertIsNone(detector.match("not a real timestamp"))
+        self.assertEqual("fr_fr", detector.locale)
+
+    def test_preferred_language(self):
+        detector = LocaleDetector(lang="da")
+        detector.match("4. januar 2016 kl. 13:54")
+        self.assertEqual("da_dk", detector.locale)
+
+    def test_sample(self):
+        detector = LocaleDetector()
+        self.assertEqual("nb_no", detector.sample(["4. desember 2016 kl. 13:54 UTC+01"]))
+        self.assertIsNone(LocaleDetector().sample([]))
+
+    def test_parse_timestamp(self):
+        detector = LocaleDetector()
+        timestamp = parse_timestamp("2016 m. gruodis 4 d., 13:54 UTC-07", use_utc=True,
+                                    hints={}, locale_detector=detector)
+        self.assertEqual(datetime(2016, 12, 4, 20, 54).replace(tzinfo=pytz.UTC), timestamp)
+        self.assertEqual("lt_lt", detector.locale)
+
+    def test_parsers_are_created_on_demand(self):
+        date_parsers = time._LazyDateParsers(time.FACEBOOK_TIMESTAMP_FORMATS)
+        fitting = [n for n in range(len(date_parsers))
+                   if date_parsers.fits(n, "2016 m. gruodis 4 d., 13:54")]
+        self.assertEqual(["lt_lt"], [date_parsers.locale_id(n) for n in fitting])
+        self.assertEqual([None] * len(date_parsers), date_parsers.parsers)
+        self.assertEqual("lt_lt", date_parsers[fitting[0]].locale_id)
+        self.assertEqual(1, len([p for p in date_parsers.parsers if p is not None]))
+
+    def test_pickling(self):
+        detector = LocaleDetector(lang="lt")
+        detector.match("2016 m. gruodis 4 d., 13:54")
+        copy = pickle.loads(pickle.dumps(detector))
+        self.assertEqual("lt_lt", copy.locale)
+        self.assertEqual("lt", copy.lang)
+
+
 if __name__ == '__main__':
     unittest.main()
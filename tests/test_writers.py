@@ -4,6 +4,9 @@ from __future__ import unicode_literals
 
 from datetime import datetime
 import io
+import os
+import shutil
+import tempfile
 import unittest
 
 import pytz
@@ -11,7 +14,7 @@ import six
 
 
 from fbchat_archive_parser import (FacebookChatHistory, ChatThread, ChatMessage)
-from fbchat_archive_parser.writers import write
+from fbchat_archive_parser.writers import write, write_threads, BUILTIN_WRITERS
 
 
 _NOW = datetime.now().replace(tzinfo=pytz.UTC)
@@ -61,6 +64,38 @@ class TestWriters(unittest.TestCase):
         # TODO: Write tests for text expected output.
         self.assert_output('text')
 
+    def get_output(self, write_func, *args):
+        self.output.seek(0)
+        self.output.truncate()
+        write_func(*args)
+        self.output_handle.flush()
+        return self.output.getvalue()
+
+    def test_streamed_output_matches(self):
+        for fmt in BUILTIN_WRITERS:
+            for history in (self.history, FacebookChatHistory(user="test_owner")):
+                expected = self.get_output(write, fmt, history, self.output_handle)
+                keys = list(history.threads.keys())
+                if fmt == 'text':
+                    keys.sort()
+                threads = iter([history.threads[k] for k in keys])
+                actual = self.get_output(
+                    write_threads, fmt, history.user, threads, self.output_handle)
+                self.assertEqual(expected, actual, fmt)
+
+    def test_streamed_directory(self):
+        directory = tempfile.mkdtemp()
+        try:
+            threads = iter(self.history.threads.values())
+            write_threads('json', self.history.user, threads, directory)
+            output_dir = os.path.join(directory, os.listdir(directory)[0])
+            self.assertEqual(['manifest.txt', 'thread_1.json', 'thread_2.json'],
+                             sorted(os.listdir(output_dir)))
+            with io.open(os.path.join(output_dir, 'manifest.txt'), encoding='utf-8') as f:
+                self.assertEqual(4, len(f.read().splitlines()))
+        finally:
+            shutil.rmtree(directory)
+
 
 if __name__ == '__main__':
     unittest.main()